@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark counting job statuses for `ctip check`.
+
+Registers 4 sessions of 500,000 jobs, moves some of them through a few
+statuses, and reports the time to count the jobs per status of one session
+from the trigger-maintained session_status_counts table, from the
+(session_id, status) index of the jobs table, and with a full scan of the
+jobs table, which is all the original schema allowed. Run from the root
+ctip directory:
+
+    $ python benchmarks/bench_check.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip.dbm import DatabaseManager
+
+GROUP_BY = "SELECT status, COUNT(*) FROM jobs {} WHERE session_id = ? GROUP BY status"
+
+
+def timed(run, repeat=5):
+    """Return the result of a function and its best time out of several runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - begin)
+    return result, best
+
+
+def main(sessions=4, jobs=500000):
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "ctip.db"))
+    for session_id in range(sessions):
+        db.register_jobs(session_id, range(jobs))
+    conn = db.conn
+    begin = time.perf_counter()
+    with conn:
+        updates = sum(conn.execute("UPDATE jobs SET status = ? WHERE config_id % ? < ?", args).rowcount
+                      for args in (('running', 10, 3), ('done', 10, 2), ('failed', 100, 1)))
+    update_time = time.perf_counter() - begin
+
+    session = sessions // 2
+    counts, counts_time = timed(lambda: db.status_counts(session))
+    indexed, index_time = timed(lambda: dict(conn.execute(GROUP_BY.format(""), (session,)).fetchall()))
+    scanned, scan_time = timed(lambda: dict(conn.execute(GROUP_BY.format("NOT INDEXED"), (session,)).fetchall()))
+    assert counts == indexed == scanned
+
+    print("{:,} jobs in {} sessions, {:,} status updates in {:.3f} sec".format(
+        sessions * jobs, sessions, updates, update_time))
+    print("status_counts():        {:10.6f} sec".format(counts_time))
+    print("index on status:        {:10.6f} sec".format(index_time))
+    print("full scan:              {:10.6f} sec".format(scan_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark resuming an interrupted sweep from a checkpoint.
+
+Builds a schema with 10M configs, checkpoints a cursor after 3M configs, and
+reports the time to resume from the token and yield the next config, along
+with the time skipping the first 3M configs of configs() takes. Also reports
+the overhead of iterating a cursor instead of configs(). Run from the root
+ctip directory:
+
+    $ python benchmarks/bench_checkpoints.py
+"""
+
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema
+from ctip.cursor import ConfigCursor
+from ctip.utils import FRange
+
+
+def sweep():
+    """Build a nested schema with 10M configs."""
+    schema = GenSchema()
+    schema.add_values("seed", *range(100))
+    schema.add_values("lr", FRange(0.001, 0.1, 0.001))
+    schema.add_values("model", "tree", "net")
+
+    tree = GenSchema()
+    tree.add_values("depth", *range(1, 401))
+    schema.add_dependencies("model", "tree", tree)
+
+    net = GenSchema()
+    net.add_values("width", *range(16, 1616, 16))
+    net.add_values("activation", "relu", "tanh", "gelu", "silu", "elu", "selu")
+    schema.add_dependencies("model", "net", net)
+    return schema
+
+
+def main(done=3 * 10**6, sample=10**6):
+    schema = sweep()
+    token = ConfigCursor(schema, position=done).checkpoint()
+
+    begin = time.perf_counter()
+    resumed = next(sweep().resume(token))
+    resume_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    skipped = next(itertools.islice(schema.configs(), done, None))
+    skip_time = time.perf_counter() - begin
+    assert resumed == skipped
+
+    begin = time.perf_counter()
+    for _ in itertools.islice(schema.configs(), sample):
+        pass
+    configs_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    for _ in itertools.islice(schema.cursor(), sample):
+        pass
+    cursor_time = time.perf_counter() - begin
+
+    print("resuming after {:,} of {:,} configs".format(done, schema.size()))
+    print("resume(token):        {:10.4f} sec".format(resume_time))
+    print("skipping configs():   {:10.4f} sec".format(skip_time))
+    print("iterating {:,} configs".format(sample))
+    print("configs():            {:10.4f} sec".format(configs_time))
+    print("cursor():             {:10.4f} sec".format(cursor_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark config generation with GenSchema.configs().
+
+Times generating every config of each genfile in tests/resources as well as a
+synthetic schema with 1,000,000 nested configs, both as new dicts and as
+in-place updates with GenSchema.config_changes(). Run from the root ctip directory:
+
+    $ python benchmarks/bench_configs.py
+"""
+
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema
+
+
+def synthetic_schema():
+    """Create a schema with 1,000,000 configs where most configs have a nested value."""
+    schema = GenSchema("synthetic")
+    schema.add_values("x1", *range(100))
+    schema.add_values("x2", *range(100))
+    dep = GenSchema()
+    dep.add_values("y", *range(100))
+    for value in range(100):
+        schema.add_dependencies("x2", value, dep)
+    return schema
+
+
+def time_configs(schema, repeat=1, incremental=False):
+    """Return the best time in seconds to generate every config of a schema."""
+    best = None
+    for _ in range(repeat):
+        generate = schema.config_changes if incremental else schema.configs
+        begin = time.perf_counter()
+        for _ in generate():
+            pass
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    print("{:<45} {:>9} {:>14}".format("schema", "configs", "configs/sec"))
+    for genfile in sorted(glob.glob(os.path.join("tests", "resources", "*.gen"))):
+        schema = GenSchema.read(genfile)
+        n = len(list(schema.configs()))
+        elapsed = time_configs(schema, repeat=2000)
+        print("{:<45} {:>9} {:>14,.0f}".format(os.path.basename(genfile), n, n / elapsed))
+
+    schema = synthetic_schema()
+    n = schema.size()
+    elapsed = time_configs(schema)
+    print("{:<45} {:>9} {:>14,.0f}".format("synthetic", n, n / elapsed))
+    elapsed = time_configs(schema, incremental=True)
+    print("{:<45} {:>9} {:>14,.0f}".format("synthetic (config_changes)", n, n / elapsed))
+
+
+if __name__ == '__main__':
+    main()
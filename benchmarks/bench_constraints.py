@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark pruning constrained configs during enumeration.
+
+Builds a sweep of a million configs where only a few thousand satisfy the
+constraints, then reports the time to generate the valid configs by
+filtering every config after it's generated and with the constraints added
+to the schema, along with the time to count and index the valid configs.
+Run from the root ctip directory:
+
+    $ python benchmarks/bench_constraints.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema
+
+
+def sweep():
+    """Build an unconstrained sweep of 1M configs."""
+    schema = GenSchema()
+    schema.add_values("seed", *range(10))
+    schema.add_values("lr", *(10.0 ** -k for k in range(10)))
+    schema.add_values("width", *range(1, 51))
+    schema.add_values("depth", *range(1, 51))
+    schema.add_values("model", "tree", "net", "linear", "svm")
+    return schema
+
+
+def add_constraints(schema):
+    """Add constraints allowing 3,000 of the configs."""
+    schema.add_constraint("depth", lambda depth: depth <= 5)
+    schema.add_inequality("width", "<", "depth")
+    schema.add_exclusion({"model": "svm"})
+    return schema
+
+
+def main():
+    schema = sweep()
+    constraints = add_constraints(GenSchema()).constraints
+    def allowed(config):
+        return all(c.check(config) for c in constraints)
+
+    begin = time.perf_counter()
+    filtered = [c for c in schema.configs() if allowed(c)]
+    filter_time = time.perf_counter() - begin
+
+    schema = add_constraints(sweep())
+    begin = time.perf_counter()
+    size = schema.size()
+    size_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    pruned = list(schema.configs())
+    prune_time = time.perf_counter() - begin
+    assert pruned == filtered
+
+    begin = time.perf_counter()
+    for i in range(0, size, 7):
+        schema.config_at(i)
+    index_time = (time.perf_counter() - begin) / len(range(0, size, 7))
+
+    print("{:,} of {:,} configs are valid".format(size, len(sweep())))
+    print("post-filter:    {:10.3f} sec".format(filter_time))
+    print("pruned:         {:10.3f} sec".format(prune_time))
+    print("size():         {:10.3f} sec".format(size_time))
+    print("config_at():    {:10.1f} usec".format(index_time * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark job updates sent through the status daemon.
+
+Starts N client processes that each send status updates for their jobs,
+first writing each update directly to the database on a new connection, as
+every `ctip update status` call did, then sending each one to a running
+StatusDaemon. Reports the updates per second and the average number of
+updates the daemon commits per transaction. For scale, also reports the
+time of a full `ctip update status` command, interpreter start included.
+Run from the root ctip directory:
+
+    $ python benchmarks/bench_daemon.py [clients] [updates per client]
+"""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip.daemon import StatusDaemon, send
+from ctip.dbm import DatabaseManager, apply_updates, connect
+
+
+def updates(client, count):
+    """Generate the status updates of one client."""
+    for i in range(count):
+        yield {'command': 'status', 'job_id': str(client * 10 + i % 10), 'session_id': 1,
+               'value': 'running' if i % 2 else 'done'}
+
+
+def direct_client(dbpath, client, count):
+    for update in updates(client, count):
+        conn = connect(dbpath)
+        with conn:
+            apply_updates(conn, [update])
+        conn.close()
+
+
+def daemon_client(path, client, count):
+    for update in updates(client, count):
+        send(update, path)
+
+
+def run(target, path, clients, count):
+    """Run the clients in parallel and return the elapsed time."""
+    procs = [multiprocessing.Process(target=target, args=(path, k, count)) for k in range(clients)]
+    begin = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    return time.perf_counter() - begin
+
+
+def cli_time(dbpath, calls=10):
+    """Return the average time of a `ctip update status` command."""
+    env = dict(os.environ, CTIP_DB=dbpath, CTIP_SESSION_ID="1")
+    begin = time.perf_counter()
+    for i in range(calls):
+        subprocess.run([sys.executable, "ctip-runner.py", "update", "status", "0", "done"], env=env, check=True)
+    return (time.perf_counter() - begin) / calls
+
+
+def main(clients=32, count=200):
+    directory = tempfile.mkdtemp()
+    dbpath = os.path.join(directory, "ctip.db")
+    DatabaseManager(dbpath).register_jobs(1, range(clients * 10))
+    total = clients * count
+    print("{} clients, {:,} updates each".format(clients, count))
+
+    elapsed = run(direct_client, dbpath, clients, count)
+    print("connection per update:  {:8.3f} sec {:10,.0f} updates/sec".format(elapsed, total / elapsed))
+
+    server = StatusDaemon(os.path.join(directory, "ctip.sock"), dbpath)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    elapsed = run(daemon_client, server.path, clients, count)
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    print("status daemon:          {:8.3f} sec {:10,.0f} updates/sec, {:.1f} updates per commit".format(
+        elapsed, total / elapsed, server.updates / server.batches))
+
+    print("ctip update status:     {:8.3f} sec per command".format(cli_time(dbpath)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark concurrent job status updates against the ctip database.
+
+Starts N writer processes that each update the status of their jobs one
+commit at a time, like jobs calling `ctip update status` and `ctip log`, and
+reports the updates per second and the number of "database is locked"
+errors. Compares the original setup, a new connection per update in the
+default rollback journal mode, with pooled connections in WAL mode. Run
+from the root ctip directory:
+
+    $ python benchmarks/bench_db_contention.py [writers] [updates per writer]
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip.dbm import DatabaseManager, get_pool
+
+UPDATE = "UPDATE jobs SET status = ? WHERE session_id = 1 AND job_id = ?"
+
+
+def legacy_writer(path, worker, updates, errors):
+    for i in range(updates):
+        try:
+            conn = sqlite3.connect(path)
+            with conn:
+                conn.execute(UPDATE, ("running" if i % 2 else "done", "{}-{}".format(worker, i % 10)))
+            conn.close()
+        except sqlite3.OperationalError:
+            with errors.get_lock():
+                errors.value += 1
+
+
+def pooled_writer(path, worker, updates, errors):
+    db = DatabaseManager(path)
+    for i in range(updates):
+        try:
+            conn = db.conn
+            with conn:
+                conn.execute(UPDATE, ("running" if i % 2 else "done", "{}-{}".format(worker, i % 10)))
+        except sqlite3.OperationalError:
+            with errors.get_lock():
+                errors.value += 1
+
+
+def run(writer, path, writers, updates):
+    """Run the writers in parallel and return the elapsed time and error count."""
+    errors = multiprocessing.Value('i', 0)
+    procs = [multiprocessing.Process(target=writer, args=(path, k, updates, errors)) for k in range(writers)]
+    begin = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    return time.perf_counter() - begin, errors.value
+
+
+def setup(path, writers, wal):
+    """Create a database with 10 jobs per writer."""
+    if wal:
+        conn = DatabaseManager(path).conn
+    else:
+        conn = sqlite3.connect(path)
+        conn.executescript("CREATE TABLE jobs(session_id INT, config_id INT, job_id TEXT, status TEXT, "
+                           "time_log TEXT, runtime TEXT, PRIMARY KEY (session_id, job_id));")
+    with conn:
+        conn.executemany("INSERT INTO jobs (session_id, job_id, status) VALUES (1, ?, 'queued')",
+                         [("{}-{}".format(k, i),) for k in range(writers) for i in range(10)])
+    if wal:
+        get_pool(path).close()
+    else:
+        conn.close()
+
+
+def main(writers=32, updates=200):
+    directory = tempfile.mkdtemp()
+    total = writers * updates
+    print("{} writers, {:,} updates each".format(writers, updates))
+    print("{:28} {:>10} {:>14} {:>8}".format("setup", "time (s)", "updates/sec", "errors"))
+    for name, writer, wal in (("connection per update", legacy_writer, False),
+                              ("pooled WAL connections", pooled_writer, True)):
+        path = os.path.join(directory, name.replace(" ", "_") + ".db")
+        setup(path, writers, wal)
+        elapsed, errors = run(writer, path, writers, updates)
+        print("{:28} {:10.3f} {:14,.0f} {:8}".format(name, elapsed, (total - errors) / elapsed, errors))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark space-filling designs over a large numeric GenSchema.
+
+Builds a 6-dimensional schema of ranges whose full grid holds 10^12 configs
+and a 500 config budget, then reports the time to generate each design and
+how well it covers the space: the smallest distance between two configs
+(larger is better) and the fraction of the 2-dimensional 10x10 cells of
+every pair of variables left empty (smaller is better). GenSchema.sample()
+is included as a purely random baseline. Requires NumPy. Run from the root
+ctip directory:
+
+    $ python benchmarks/bench_designs.py
+"""
+
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema
+from ctip.utils import FRange
+
+
+def space(dimensions=6):
+    """Build a schema with 100 values per numeric variable."""
+    schema = GenSchema()
+    for k in range(dimensions):
+        schema.add_values("x{}".format(k), FRange(0, 0.99, 0.01))
+    return schema
+
+
+def coverage(configs, variables):
+    """Return the minimum distance between configs and the fraction of empty 2-D cells."""
+    points = np.array([[c[v] for v in variables] for c in configs])
+    diffs = points[:, None, :] - points[None, :, :]
+    distances = np.sqrt((diffs ** 2).sum(axis=-1))
+    min_distance = distances[np.triu_indices(len(points), 1)].min()
+
+    cells = np.minimum((points * 10).astype(int), 9)
+    empty = []
+    for i, j in itertools.combinations(range(len(variables)), 2):
+        filled = len(set(zip(cells[:, i].tolist(), cells[:, j].tolist())))
+        empty.append(1 - filled / 100)
+    return min_distance, np.mean(empty)
+
+
+def main(budget=500):
+    schema = space()
+    variables = list(schema.schema)
+    print("{:,} configs in the full grid, budget of {}".format(schema.size(), budget))
+    print("{:10} {:>10} {:>14} {:>12}".format("design", "time (s)", "min distance", "empty cells"))
+
+    runs = [(method, lambda m=method: list(schema.design(budget, m, seed=0)))
+            for method in ('lhs', 'sobol', 'halton')]
+    runs.append(('random', lambda: schema.sample(budget, seed=0)))
+    for name, run in runs:
+        begin = time.perf_counter()
+        configs = run()
+        elapsed = time.perf_counter() - begin
+        min_distance, empty = coverage(configs, variables)
+        print("{:10} {:10.3f} {:14.3f} {:12.1%}".format(name, elapsed, min_distance, empty))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the memory held by large GenSchema objects.
+
+Builds a schema with long lists of explicit numeric values, a schema with
+many string variables, and a schema whose values share one dependency block,
+then reports the memory each one holds before and after compact(). Run from
+the root ctip directory:
+
+    $ python benchmarks/bench_memory.py
+"""
+
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema
+
+
+def numeric_schema(variables=20, width=50000):
+    """Build a schema with many explicit int and float values per variable."""
+    gen = GenSchema()
+    for i in range(variables):
+        if i % 2:
+            gen.add_values("int{}".format(i), *range(0, 3 * width, 3))
+        else:
+            gen.add_values("float{}".format(i), *(0.37 * k for k in range(width)))
+    return gen
+
+
+def string_schema(variables=2000, width=20):
+    """Build a schema with many variables holding a few string values each."""
+    gen = GenSchema()
+    for i in range(variables):
+        gen.add_values("var{}".format(i), *("v{}_{}".format(i, j) for j in range(width)))
+    return gen
+
+
+def nested_schema(width=20000):
+    """Build a schema whose values all share one numeric dependency block."""
+    dep = GenSchema()
+    dep.add_values("lr", *(0.001 * k for k in range(1, 101)))
+    dep.add_values("batch", 16, 32, 64)
+    gen = GenSchema()
+    gen.add_values("model", *range(width))
+    gen.add_dependencies("model", 0, dep)
+    for v in range(1, width):
+        gen.add_dependencies("model", v, dep)
+    return gen
+
+
+def measure(build):
+    """Return the memory held by the schema from build() before and after compacting."""
+    gc.collect()
+    tracemalloc.start()
+    schema = build()
+    gc.collect()
+    built = tracemalloc.get_traced_memory()[0]
+    compact = getattr(schema, 'compact', None)
+    if compact is not None:
+        compact()
+    gc.collect()
+    compacted = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return built, compacted
+
+
+def main():
+    for name, build in [("numeric", numeric_schema), ("strings", string_schema), ("nested", nested_schema)]:
+        built, compacted = measure(build)
+        print("{:8s} built: {:8.2f} MB   compacted: {:8.2f} MB".format(
+            name, built / 2**20, compacted / 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the throughput of GenParser over the test genfiles.
+
+Parses every genfile in tests/resources repeatedly with GenParser, which uses
+the hand written parser whenever it can, with the shared pyparsing grammar,
+and with a new grammar built for every file, then reports the number of files
+parsed per second. Run from the root ctip directory:
+
+    $ python benchmarks/bench_parse.py
+"""
+
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenParser
+
+
+def throughput(parse, files, rounds):
+    """Return the number of files parsed per second by parse()."""
+    begin = time.perf_counter()
+    for _ in range(rounds):
+        for genfile in files:
+            parse(genfile)
+    return rounds * len(files) / (time.perf_counter() - begin)
+
+
+def parse_with_grammar(genfile):
+    """Parse a genfile with the shared grammar only."""
+    with GenParser._lock:
+        return GenParser._get_grammar().parseFile(genfile)
+
+
+def main(rounds=50):
+    files = sorted(glob.glob(os.path.join("tests", "resources", "*.gen")))
+
+    fast = throughput(GenParser.parseFile, files, rounds)
+    shared = throughput(parse_with_grammar, files, rounds)
+    rebuilt = throughput(lambda f: GenParser._get_parser().parseFile(f), files, rounds)
+
+    print("{} genfiles x {} rounds".format(len(files), rounds))
+    print("GenParser:       {:10,.0f} files/sec".format(fast))
+    print("shared grammar:  {:10,.0f} files/sec".format(shared))
+    print("new grammar:     {:10,.0f} files/sec".format(rebuilt))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark reading wide, nested genfiles with GenSchema.read().
+
+Writes a genfile where every suite binds the same nested block to hundreds of
+values, then reports the time to parse and read it, the time to read it again
+from the schema cache, and the memory held by the resulting schema. Then does
+the same for a genfile with thousands of distinct nested blocks. Run from the root ctip directory:
+
+    $ python benchmarks/bench_read.py
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema, GenParser
+from ctip.cache import SchemaCache
+
+
+def write_wide_genfile(filename, suites=10, width=500):
+    """Write a genfile with several suites binding one nested block to many values."""
+    with open(filename, 'w') as f:
+        f.write("wide\n")
+        for i in range(suites):
+            values = ', '.join("m{}_{}".format(i, j) for j in range(width))
+            f.write("model{} = {}\n".format(i, values))
+            f.write("    lr = {}\n".format(', '.join(str(0.001 * k) for k in range(1, 51))))
+            f.write("    batch = 16, 32, 64\n")
+            f.write("    opt = adam\n")
+            f.write("        beta = 0.9, 0.99\n")
+            f.write("    opt = sgd\n")
+            f.write("        momentum = 0, 0.5, 0.9\n")
+
+
+def write_nested_genfile(filename, suites=3000):
+    """Write a machine generated style genfile with thousands of distinct nested blocks."""
+    with open(filename, 'w') as f:
+        f.write("nested\n")
+        for i in range(suites):
+            f.write("model = m{}\n".format(i))
+            f.write("    lr = {}\n".format(', '.join(str(0.001 * (k + i)) for k in range(1, 30))))
+            f.write("    opt = adam{}\n".format(i))
+            f.write("        beta = 0.9, 0.99, {}\n".format(i))
+            f.write("    opt = sgd{}\n".format(i))
+            f.write("        momentum = 0, 0.5, {}\n".format(i))
+
+
+def read_memory(genfile):
+    """Return the memory held by the schema read from a genfile and the peak memory."""
+    gc.collect()
+    tracemalloc.start()
+    schema = GenSchema.read(genfile, cache=False)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del schema
+    return current, peak
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        genfile = os.path.join(tmp, "wide.gen")
+        write_wide_genfile(genfile)
+
+        begin = time.perf_counter()
+        GenParser.parseFile(genfile)
+        parse_time = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        GenSchema.read(genfile, cache=False)
+        read_time = time.perf_counter() - begin
+
+        cache = SchemaCache(os.path.join(tmp, "cache"))
+        GenSchema.read(genfile, cache=cache)
+        begin = time.perf_counter()
+        GenSchema.read(genfile, cache=cache)
+        cached_time = time.perf_counter() - begin
+
+        current, peak = read_memory(genfile)
+
+        print("parse time:    {:8.3f} sec".format(parse_time))
+        print("read time:     {:8.3f} sec".format(read_time))
+        print("cached read:   {:8.3f} sec".format(cached_time))
+        print("schema memory: {:8.2f} MB".format(current / 2**20))
+        print("peak memory:   {:8.2f} MB".format(peak / 2**20))
+
+        nested = os.path.join(tmp, "nested.gen")
+        write_nested_genfile(nested)
+        begin = time.perf_counter()
+        GenSchema.read(nested, cache=False)
+        read_time = time.perf_counter() - begin
+        current, peak = read_memory(nested)
+
+        print("nested genfile ({:.1f} MB)".format(os.path.getsize(nested) / 2**20))
+        print("read time:     {:8.3f} sec".format(read_time))
+        print("schema memory: {:8.2f} MB".format(current / 2**20))
+        print("peak memory:   {:8.2f} MB".format(peak / 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark registering the jobs of a large sweep in the ctip database.
+
+Registers one jobs row per config of a 2M config schema with
+DatabaseManager.register_jobs() and reports the rows per second and the
+growth of the process's peak memory, along with the time row-at-a-time
+inserts with autocommit would take, extrapolated from the first 20,000
+configs. Run from the root ctip directory:
+
+    $ python benchmarks/bench_register.py
+"""
+
+import itertools
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema
+from ctip.dbm import DatabaseManager
+
+
+def sweep():
+    """Build a schema with 2M configs."""
+    schema = GenSchema()
+    schema.add_values("seed", *range(200))
+    schema.add_values("lr", *(10.0 ** -k for k in range(10)))
+    schema.add_values("width", *range(16, 16016, 16))
+    return schema
+
+
+def peak_memory():
+    """Return the peak resident memory of the process in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(prefix=20000):
+    schema = sweep()
+    directory = tempfile.mkdtemp()
+
+    db = DatabaseManager(os.path.join(directory, "autocommit.db"))
+    conn = db.conn
+    begin = time.perf_counter()
+    for config_id, _ in enumerate(itertools.islice(schema.configs(), prefix)):
+        with conn:
+            conn.execute("INSERT INTO jobs (session_id, config_id, job_id, status) VALUES (?, ?, ?, ?)",
+                         (1, config_id, str(config_id), 'queued'))
+    autocommit_time = (time.perf_counter() - begin) * schema.size() / prefix
+
+    db = DatabaseManager(os.path.join(directory, "bulk.db"))
+    memory = peak_memory()
+    rows, seconds = db.register_jobs(1, schema.configs())
+    memory = peak_memory() - memory
+
+    print("{:,} jobs".format(rows))
+    print("register_jobs():          {:10.3f} sec {:12,.0f} rows/sec {:8.1f} MB".format(
+        seconds, rows / seconds, memory))
+    print("autocommit (estimated):   {:10.3f} sec {:12,.0f} rows/sec".format(
+        autocommit_time, schema.size() / autocommit_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark runtime percentiles of finished jobs.
+
+Registers a session of 200,000 jobs over a gen schema, logs a start, pause,
+resume and end event for each of them, then reports the time to compute the
+50th and 95th percentile runtimes per value of a config variable in SQLite
+with runtime_percentiles(), and in Python from text time logs: fetching every
+log and config, parsing them, and sorting the runtimes. Run from the root ctip
+directory:
+
+    $ python benchmarks/bench_runtimes.py [jobs]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip.dbm import DatabaseManager
+from ctip.gen import GenSchema
+
+PERCENTILES = (50, 95)
+
+
+def timed(run, repeat=3):
+    """Return the result of a function and its best time out of several runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - begin)
+    return result, best
+
+
+def events(job_id):
+    """Return the log events of a job, with a runtime depending on its id."""
+    start = job_id * 1000
+    return [('start', start), ('pause', start + 100 + job_id % 97),
+            ('resume', start + 500), ('end', start + 600 + job_id % 89)]
+
+
+def python_percentiles(conn, variable):
+    """Compute the percentiles by parsing the text time logs and configs of every job."""
+    groups = {}
+    for config, time_log in conn.execute("SELECT config, time_log FROM logs"):
+        runtime, started = 0, None
+        for line in time_log.splitlines():
+            kind, ts = line.split()
+            if kind in ('start', 'resume'):
+                started = int(ts)
+            elif started is not None:
+                runtime += int(ts) - started
+                started = None
+        groups.setdefault(json.loads(config)[variable], []).append(runtime)
+    result = {}
+    for value, runtimes in groups.items():
+        runtimes.sort()
+        result[value] = tuple(runtimes[max(0, -(-p * len(runtimes) // 100) - 1)] for p in PERCENTILES)
+    return result
+
+
+def main(jobs=200000):
+    schema = GenSchema()
+    schema.add_values("seed", *range(jobs // 20))
+    schema.add_values("size", *range(20))
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "ctip.db"))
+    db.register_jobs(1, schema.configs())
+    conn = db.conn
+    updates = [{'command': 'log', 'job_id': str(k), 'session_id': 1, 'value': kind, 'ts': ts}
+               for k in range(jobs) for kind, ts in events(k)]
+    begin = time.perf_counter()
+    db.apply(updates)
+    apply_time = time.perf_counter() - begin
+
+    # The same events as one line of text per event
+    with conn:
+        conn.execute("CREATE TABLE logs(config TEXT, time_log TEXT)")
+        conn.executemany("INSERT INTO logs VALUES (?, ?)",
+                         ((json.dumps(config), "".join("{} {}\n".format(*event) for event in events(k)))
+                          for k, config in enumerate(schema.configs())))
+
+    sql, sql_time = timed(lambda: db.runtime_percentiles(1, PERCENTILES, "size"))
+    session, session_time = timed(lambda: db.runtime_percentiles(1, PERCENTILES))
+    parsed, parse_time = timed(lambda: python_percentiles(conn, "size"))
+    assert sql == parsed
+
+    print("{:,} jobs, {:,} log events applied in {:.3f} sec".format(jobs, len(updates), apply_time))
+    print("per session in SQLite:  {:10.3f} sec".format(session_time))
+    print("per variable in SQLite: {:10.3f} sec".format(sql_time))
+    print("parsing text logs:      {:10.3f} sec".format(parse_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
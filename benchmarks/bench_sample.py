@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark drawing random configs from a large nested GenSchema.
+
+Builds a ragged schema with about 50M configs and reports the time to draw
+2,000 configs with GenSchema.sample(), with and without replacement, along
+with the time reservoir sampling over configs() would take, extrapolated
+from the time to generate the first million configs. Run from the root ctip
+directory:
+
+    $ python benchmarks/bench_sample.py
+"""
+
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema
+
+
+def ragged_schema():
+    """Build a nested schema where each model has a differently sized block."""
+    schema = GenSchema()
+    schema.add_values("seed", *range(100))
+    schema.add_values("lr", *(10.0 ** -k for k in range(10)))
+    schema.add_values("model", "tree", "net", "linear")
+
+    tree = GenSchema()
+    tree.add_values("depth", *range(1, 201))
+    tree.add_values("leaves", *range(2, 402, 2))
+    schema.add_dependencies("model", "tree", tree)
+
+    net = GenSchema()
+    net.add_values("layers", *range(1, 51))
+    net.add_values("width", *range(16, 1040, 16))
+    net.add_values("activation", "relu", "tanh", "gelu")
+    schema.add_dependencies("model", "net", net)
+
+    linear = GenSchema()
+    linear.add_values("penalty", "l1", "l2", "none")
+    schema.add_dependencies("model", "linear", linear)
+    return schema
+
+
+def reservoir(configs, n, rng):
+    """Sample n configs from an iterable in one pass."""
+    sample = list(itertools.islice(configs, n))
+    for i, config in enumerate(configs, n):
+        j = rng.randrange(i + 1)
+        if j < n:
+            sample[j] = config
+    return sample
+
+
+def main(n=2000, prefix=10**6):
+    schema = ragged_schema()
+    size = schema.size()
+
+    begin = time.perf_counter()
+    schema.sample(n, seed=0)
+    sample_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    schema.sample(n, seed=0, replace=True)
+    replace_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    reservoir(itertools.islice(schema.configs(), prefix), n, random.Random(0))
+    reservoir_time = (time.perf_counter() - begin) * size / prefix
+
+    print("{:,} of {:,} configs".format(n, size))
+    print("sample():                {:10.3f} sec".format(sample_time))
+    print("sample(replace=True):    {:10.3f} sec".format(replace_time))
+    print("reservoir (estimated):   {:10.3f} sec".format(reservoir_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark building large schemas through the GenSchema API.
+
+Builds schemas of increasing size one value at a time with add_values() and
+add_dependencies(), and all at once with extend(). Build time per value should
+stay flat as the schema grows. Run from the root ctip directory:
+
+    $ python benchmarks/bench_schema_build.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema
+
+
+def build_incrementally(n):
+    """Build a schema with n values, binding a dependency to every 10th value."""
+    dep = GenSchema()
+    dep.add_values("sub", "a", "b")
+    schema = GenSchema()
+    for i in range(n):
+        schema.add_values("var", i)
+    for i in range(0, n, 10):
+        schema.add_dependencies("var", i, dep)
+    schema.size()
+    return schema
+
+
+def build_in_bulk(n):
+    """Build the same schema as build_incrementally with a single extend() call."""
+    dep = GenSchema()
+    dep.add_values("sub", "a", "b")
+    schema = GenSchema()
+    schema.extend({"var": range(n)}, (("var", i, dep) for i in range(0, n, 10)))
+    schema.size()
+    return schema
+
+
+def main():
+    print("{:>8} {:>14} {:>14} {:>14}".format("values", "method", "seconds", "usec/value"))
+    for n in (12500, 25000, 50000, 100000):
+        for build in (build_incrementally, build_in_bulk):
+            begin = time.perf_counter()
+            build(n)
+            elapsed = time.perf_counter() - begin
+            method = build.__name__.replace("build_", "")
+            print("{:>8} {:>14} {:>14.3f} {:>14.2f}".format(n, method, elapsed, elapsed / n * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark finding the new configs after values are added to a GenSchema.
+
+Builds the ragged schema from bench_sample.py with about 50M configs, adds
+two values to its learning rates, and reports the time new.difference(old)
+takes to find the new configs, along with the time filtering configs() of
+the new schema against the old one would take, extrapolated from the time
+to filter the first 200,000 configs. Run from the root ctip directory:
+
+    $ python benchmarks/bench_setops.py
+"""
+
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from bench_sample import ragged_schema
+
+
+def main(prefix=200000):
+    old = ragged_schema()
+    new = ragged_schema()
+    new.add_values("lr", 1e-10, 1e-11)
+
+    begin = time.perf_counter()
+    delta = new.difference(old)
+    difference_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    count = sum(1 for _ in itertools.islice(delta.configs(), prefix))
+    delta_time = (time.perf_counter() - begin) * delta.size() / count
+
+    begin = time.perf_counter()
+    for config in itertools.islice(new.configs(), prefix):
+        try:
+            old.index_of(config)
+        except ValueError:
+            pass
+    filter_time = (time.perf_counter() - begin) * new.size() / prefix
+
+    print("{:,} new of {:,} configs".format(delta.size(), new.size()))
+    print("difference():               {:10.3f} sec".format(difference_time))
+    print("generating the new configs: {:10.3f} sec (estimated)".format(delta_time))
+    print("filtering configs():        {:10.3f} sec (estimated)".format(filter_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark writing large GenSchemas to genfiles.
+
+Writes a deeply nested schema and a schema with long lists of explicit
+numbers, then reports the time to write each one, the size of the genfile,
+the peak memory used while writing, and the time to read it back. Run from
+the root ctip directory:
+
+    $ python benchmarks/bench_write.py
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.getcwd())
+
+from ctip import GenSchema
+
+
+def deep_schema(depth=8, width=3):
+    """Build a schema nested depth levels deep, binding distinct blocks at every level."""
+    def build(level, tag):
+        gen = GenSchema()
+        gen.add_values("param{}".format(level), *("{}_{}".format(tag, k) for k in range(40)))
+        if level < depth:
+            gen.add_values("branch{}".format(level), *range(width))
+            for k in range(width):
+                gen.add_dependencies("branch{}".format(level), k, build(level + 1, "{}.{}".format(tag, k)))
+        return gen
+    return build(0, "t")
+
+
+def numeric_schema(variables=20, width=50000):
+    """Build a schema with many explicit ints and floats per variable."""
+    gen = GenSchema()
+    for i in range(variables):
+        if i % 2:
+            gen.add_values("int{}".format(i), *range(0, 3 * width, 3))
+        else:
+            gen.add_values("float{}".format(i), *(0.25 * k for k in range(width)))
+    return gen
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, build in [("deep", deep_schema), ("numeric", numeric_schema)]:
+            schema = build()
+            genfile = os.path.join(tmp, name + ".gen")
+
+            gc.collect()
+            tracemalloc.start()
+            begin = time.perf_counter()
+            schema.write(genfile)
+            write_time = time.perf_counter() - begin
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            begin = time.perf_counter()
+            GenSchema.read(genfile, cache=False)
+            read_time = time.perf_counter() - begin
+
+            print(name)
+            print("write time:    {:8.3f} sec".format(write_time))
+            print("genfile size:  {:8.2f} MB".format(os.path.getsize(genfile) / 2**20))
+            print("write peak:    {:8.2f} MB".format(peak / 2**20))
+            print("read time:     {:8.3f} sec".format(read_time))
+
+
+if __name__ == '__main__':
+    main()
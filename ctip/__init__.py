@@ -1 +1,18 @@
-from .gen import GenSchema, GenParser
\ No newline at end of file
+import importlib
+
+# Modules of the public classes, imported on first use so commands like
+# `ctip update status` don't pay for pyparsing and NumPy on every call
+_exports = {
+    'GenSchema': 'gen',
+    'GenParser': 'gen',
+    'GenPlan': 'gen',
+    'GenUnion': 'setops',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        return getattr(importlib.import_module('.' + _exports[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
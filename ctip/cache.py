@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent cache of the GenSchemas built from genfiles.
+
+Schemas are pickled into a cache directory under a key made from the hash of
+the genfile's contents and the ctip version, so editing a genfile or upgrading
+ctip never returns a stale schema. The directory is kept under a maximum size
+by evicting the least recently used schemas.
+
+The cache directory defaults to $CTIP_CACHE_DIR if it's set, otherwise to
+ctip/schemas in the user's cache directory ($XDG_CACHE_HOME or ~/.cache).
+Cached schemas are unpickled when loaded, so the directory must only be
+writable by trusted users.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+
+# Bump whenever the pickled layout of GenSchema objects changes
+CACHE_FORMAT = 2
+# Default maximum size of the cache directory in bytes
+DEFAULT_MAX_SIZE = 256 * 2**20
+
+SUFFIX = ".schema"
+
+
+class SchemaCache(object):
+    """
+    Directory of pickled GenSchemas keyed by the contents of their genfiles.
+
+    Args:
+        directory: (str) Optional directory to store schemas in, defaults to
+            default_cache_dir().
+        max_size: (int) Maximum total size of the cached schemas in bytes.
+    """
+
+    def __init__(self, directory = None, max_size = DEFAULT_MAX_SIZE):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+
+    def key(self, contents):
+        """
+        Create the cache key of a genfile.
+
+        Args:
+            contents: (str) Contents of the genfile, or an iterable of strings
+                making up the contents such as an open genfile.
+        Returns:
+            Hex digest identifying the contents and the version of ctip.
+        """
+        digest = self.digest()
+        if isinstance(contents, str):
+            contents = [contents]
+        for chunk in contents:
+            digest.update(chunk.encode('utf-8'))
+        return digest.hexdigest()
+
+    def digest(self):
+        """
+        Start hashing the contents of a genfile incrementally.
+
+        Returns:
+            hashlib object whose hexdigest() is the key() of the UTF-8
+            encoded contents it's updated with.
+        """
+        digest = hashlib.sha256()
+        digest.update("ctip {} format {}\n".format(ctip_version(), CACHE_FORMAT).encode('utf-8'))
+        return digest
+
+    def load(self, key):
+        """
+        Load a cached schema and mark it as recently used.
+
+        Unreadable entries are removed from the cache.
+
+        Args:
+            key: (str) Cache key from key().
+        Returns:
+            The cached GenSchema, or None if the key isn't cached.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                schema = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError):
+            self._remove(path)
+            return None
+        return schema
+
+    def store(self, key, schema):
+        """
+        Add a schema to the cache, evicting old schemas if the cache is too big.
+
+        Failing to write the cache isn't an error, the schema just won't be
+        cached.
+
+        Args:
+            key: (str) Cache key from key().
+            schema: GenSchema to cache.
+        Returns:
+            True if the schema was cached.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(schema, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, self._path(key))
+            except BaseException:
+                self._remove(tmp)
+                raise
+        except OSError:
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """Remove the least recently used schemas until the cache fits in max_size."""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """Remove every schema from the cache."""
+        max_size, self.max_size = self.max_size, -1
+        try:
+            self.evict()
+        finally:
+            self.max_size = max_size
+
+    def _path(self, key):
+        """Return the file a key is cached in."""
+        return os.path.join(self.directory, key + SUFFIX)
+
+    @staticmethod
+    def _remove(path):
+        """Remove a file if it exists."""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def default_cache_dir():
+    """Return the directory schemas are cached in by default."""
+    directory = os.environ.get('CTIP_CACHE_DIR')
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ctip", "schemas")
+
+
+_default_cache = None
+
+def get_cache(cache):
+    """
+    Resolve the cache argument of GenSchema.read().
+
+    Args:
+        cache: True for the default cache, False or None to bypass caching, or
+            a SchemaCache object.
+    Returns:
+        SchemaCache object to use, or None.
+    """
+    global _default_cache
+    if cache is True:
+        if _default_cache is None:
+            _default_cache = SchemaCache()
+        return _default_cache
+    return cache or None
+
+
+def set_default_cache(cache):
+    """
+    Replace the cache GenSchema.read() uses by default.
+
+    Args:
+        cache: SchemaCache object, or None to go back to a cache in
+            default_cache_dir().
+    Returns:
+        The previous default SchemaCache, or None if it wasn't created yet.
+    """
+    global _default_cache
+    previous, _default_cache = _default_cache, cache
+    return previous
+
+
+_version = None
+
+def ctip_version():
+    """Return the version of ctip, read the same way setup.py reads it."""
+    global _version
+    if _version is None:
+        entrypoint = os.path.join(os.path.dirname(os.path.abspath(__file__)), "entrypoint.py")
+        with open(entrypoint) as f:
+            _version = re.search(r'^__version__\s*=\s*"(.*)"', f.read(), re.M).group(1)
+    return _version
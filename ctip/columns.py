@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Export the configs of a GenSchema as batches of NumPy column arrays.
+
+NumPy is an optional dependency of ctip and is only needed by this module.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ColumnBatch(object):
+    """
+    A contiguous batch of configs stored as one array per variable.
+
+    Attributes:
+        index: Array holding the index of each config in the batch.
+        columns: Dict mapping each variable to an array with one entry per
+            config. Numeric variables hold their values directly, int64 when
+            every value is an int and float64 otherwise. All other variables
+            are dictionary encoded and hold int32 codes into categories.
+        categories: Dict mapping each dictionary encoded variable to the list
+            of values its codes refer to.
+        present: Dict mapping each variable that is missing from some configs
+            (i.e. dependent variables) to a boolean array that is True where
+            the variable is part of the config. Missing entries hold NaN for
+            float columns, 0 for int columns, and -1 for dictionary codes.
+    """
+
+    def __init__(self, index, columns, categories, present):
+        self.index = index
+        self.columns = columns
+        self.categories = categories
+        self.present = present
+
+    def __len__(self):
+        """Return the number of configs in the batch."""
+        return len(self.index)
+
+    def save(self, filename, compressed=False):
+        """
+        Write the batch to a NumPy .npz file.
+
+        Arrays are stored under the names 'index', 'values/<variable>',
+        'present/<variable>', and 'categories/<variable>'. Categories are
+        stored as strings.
+
+        Args:
+            filename: (str) Name of the .npz file to write.
+            compressed: (bool) Compress the arrays in the file.
+        """
+        arrays = {'index': self.index}
+        for variable, column in self.columns.items():
+            arrays['values/{}'.format(variable)] = column
+        for variable, mask in self.present.items():
+            arrays['present/{}'.format(variable)] = mask
+        for variable, categories in self.categories.items():
+            arrays['categories/{}'.format(variable)] = np.array([str(c) for c in categories])
+        save = np.savez_compressed if compressed else np.savez
+        save(filename, **arrays)
+
+
+def column_batches(plan, start, stop, batch_size, blocks = None):
+    """
+    Generate ColumnBatch objects covering the configs of a GenPlan in [start, stop).
+
+    Each batch is decoded directly from its config indices with vectorized
+    mixed-radix arithmetic over the plan, so no config dicts are created.
+
+    Args:
+        plan: GenPlan to export.
+        start: (int) Index of the first config to export.
+        stop: (int) Index after the last config to export.
+        batch_size: (int) Maximum number of configs per batch.
+        blocks: Optional iterable of (first, last) plan index ranges holding
+            the configs to export when some configs are skipped, see
+            ConstrainedPlan.blocks(). Indices start and stop then count
+            only the configs in the blocks.
+    Raises:
+        ImportError if NumPy is not installed
+        ValueError if batch_size is less than 1
+    """
+    if np is None:
+        raise ImportError("NumPy is required to export configs as columns")
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    encoding = _ColumnEncoding(plan)
+    if blocks is None:
+        for begin in range(start, stop, batch_size):
+            index = np.arange(begin, min(begin + batch_size, stop), dtype=np.int64)
+            yield encoding.batch(index)
+        return
+
+    # Gather batch_size plan indices at a time from the blocks
+    begin = start
+    pieces = []
+    count = 0
+    for first, last in blocks:
+        while first < last:
+            end = min(last, first + batch_size - count)
+            pieces.append(np.arange(first, end, dtype=np.int64))
+            count += end - first
+            first = end
+            if count == batch_size:
+                yield encoding.batch(np.concatenate(pieces), np.arange(begin, begin + count, dtype=np.int64))
+                begin += count
+                pieces = []
+                count = 0
+    if count:
+        yield encoding.batch(np.concatenate(pieces), np.arange(begin, begin + count, dtype=np.int64))
+
+
+class _ColumnEncoding(object):
+    """Per-slot lookup arrays used to turn value positions into column entries."""
+
+    def __init__(self, plan):
+        self.plan = plan
+
+        # Group slots by variable name to pick one column type per variable
+        slots_by_name = {}
+        for slot, name in enumerate(plan.names):
+            slots_by_name.setdefault(name, []).append(slot)
+
+        self.dtypes = {}
+        self.categories = {}
+        self.lookup = [None] * len(plan.names)
+        for name, slots in slots_by_name.items():
+            domain = [v for slot in slots for v in plan.values[slot]]
+            if all(type(v) == int for v in domain):
+                self.dtypes[name] = np.int64
+                for slot in slots:
+                    self.lookup[slot] = np.fromiter(plan.values[slot], np.int64, len(plan.values[slot]))
+            elif all(type(v) in (int, float) for v in domain):
+                self.dtypes[name] = np.float64
+                for slot in slots:
+                    self.lookup[slot] = np.fromiter(plan.values[slot], np.float64, len(plan.values[slot]))
+            else:
+                self.dtypes[name] = np.int32
+                codes = {}
+                for v in domain:
+                    codes.setdefault((type(v), v), len(codes))
+                self.categories[name] = [v for _, v in codes]
+                for slot in slots:
+                    self.lookup[slot] = np.array([codes[(type(v), v)] for v in plan.values[slot]],
+                                                 dtype=np.int32)
+
+        # Top level variables are part of every config
+        self.always_present = {plan.names[slot] for slot in plan.node_slots[0]}
+
+        # Per-slot arrays describing the values with dependencies, see
+        # Domain.layout(), along with the node holding their dependencies
+        self.layouts = []
+        for slot, domain in enumerate(plan.domains):
+            positions, starts, spans, extras = (np.array(a, dtype=np.int64) for a in domain.layout())
+            children = np.array([plan.children[slot][pos] for pos in positions], dtype=np.int64)
+            self.layouts.append((domain.radix(), positions, starts, spans, extras, children))
+
+    def locate(self, slot, digit):
+        """
+        Vectorized version of Domain.locate() for the domain of a slot.
+
+        Returns:
+            Arrays of value positions, indices among the configs of their
+            dependencies, and nodes holding those dependencies (or -1).
+        """
+        _, positions, starts, spans, extras, children = self.layouts[slot]
+        if not len(positions):
+            return digit, np.zeros_like(digit), np.full(len(digit), -1, dtype=np.int64)
+        k = np.searchsorted(starts, digit, side='right') - 1
+        before = k < 0
+        k[before] = 0
+        inside = ~before & (digit < starts[k] + spans[k])
+        pos = np.where(inside, positions[k], digit - np.where(before, 0, extras[k]))
+        sub_index = np.where(inside, digit - starts[k], 0)
+        child = np.where(inside, children[k], -1)
+        return pos, sub_index, child
+
+    def batch(self, index, ranks = None):
+        """
+        Create the ColumnBatch for an array of valid config indices.
+
+        Args:
+            index: Array of plan indices to decode.
+            ranks: Optional array of the indices to report in the batch,
+                defaults to index.
+        """
+        n = len(index)
+        columns = {}
+        present = {}
+        for name, dtype in self.dtypes.items():
+            if dtype == np.float64:
+                columns[name] = np.full(n, np.nan)
+            elif dtype == np.int32:
+                columns[name] = np.full(n, -1, dtype=np.int32)
+            else:
+                columns[name] = np.zeros(n, dtype=np.int64)
+            if name not in self.always_present:
+                present[name] = np.zeros(n, dtype=bool)
+
+        def fill(node, sub_index, rows):
+            """Write the values of a node's variables for the given rows."""
+            # Dependencies are written before the variable they depend on and
+            # variables are written in order, so variables sharing a name
+            # override each other the same way they do in configs()
+            for slot in self.plan.node_slots[node]:
+                sub_index, digit = np.divmod(sub_index, self.layouts[slot][0])
+                pos, dep_index, child = self.locate(slot, digit)
+                for node_id in np.unique(child[child >= 0]):
+                    mask = child == node_id
+                    fill(int(node_id), dep_index[mask], rows[mask])
+                name = self.plan.names[slot]
+                columns[name][rows] = self.lookup[slot][pos]
+                if name in present:
+                    present[name][rows] = True
+
+        fill(0, index, np.arange(n))
+
+        return ColumnBatch(index if ranks is None else ranks, columns, dict(self.categories), present)
@@ -7,11 +7,25 @@ Created on Fri Sep  9  9:12:39 2016
 @author: Aaron Beckett
 """
 
+import os
+import signal
+import sys
+import time
+
+from .daemon import StatusDaemon, send
+from .dbm import DatabaseManager
+from .exceptions import DaemonUnreachable
+
+
 def run(args):
     pass
 
 def check(args):
-    pass
+    """Print the number of jobs with each status, in one session or all of them."""
+    counts = DatabaseManager().status_counts(args.session_id)
+    for status in sorted(counts):
+        print("{:<12} {:>12,}".format(status, counts[status]))
+    print("{:<12} {:>12,}".format("total", sum(counts.values())))
 
 def stop(args):
     pass
@@ -35,19 +49,58 @@ def list(args):
     pass
 
 def update_status(args):
-    pass
+    _update_job('status', args.job_id, args.new_status)
 
 def update_id(args):
-    pass
+    _update_job('id', args.job_id, args.new_id)
 
 def log_start(args):
-    pass
+    _update_job('log', args.job_id, 'start')
 
 def log_pause(args):
-    pass
+    _update_job('log', args.job_id, 'pause')
 
 def log_resume(args):
-    pass
+    _update_job('log', args.job_id, 'resume')
 
 def log_end(args):
-    pass
+    _update_job('log', args.job_id, 'end')
+
+def run_daemon(args):
+    """Apply job updates sent by other ctip commands until interrupted."""
+    server = StatusDaemon()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def _update_job(command, job_id, value):
+    """
+    Send a job update to the ctip daemon, or write it to the database if the
+    daemon isn't running.
+
+    Jobs are looked up in the session $CTIP_SESSION_ID if it's set, otherwise
+    in the latest session with a job with that id. Updates that reached the
+    daemon aren't written again if its reply is lost, since it may already
+    have applied them.
+    """
+    session_id = os.environ.get('CTIP_SESSION_ID')
+    update = {
+        'command': command,
+        'job_id': job_id,
+        'session_id': int(session_id) if session_id else None,
+        'value': value,
+    }
+    if command == 'log':
+        update['ts'] = time.monotonic_ns()
+    try:
+        error = send(update)
+    except DaemonUnreachable:
+        error = DatabaseManager().apply([update])[0]
+    except OSError as e:
+        error = "No reply from the ctip daemon, the update may not have been applied ({})".format(e)
+    if error is not None:
+        sys.exit("ctip: {}".format(error))
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative constraints on the configs of a GenSchema.
+
+Constraints are checked while configs are enumerated rather than after: as
+soon as every variable a constraint depends on has a value, every config
+sharing those values is pruned at once. Counting and indexing the configs
+that satisfy the constraints work the same way, so GenSchema.size(),
+config_at(), and index_of() never enumerate the configs they skip.
+"""
+
+import operator
+
+# Comparison operators accepted by inequality()
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# Placeholder for bound values that no longer affect any constraint
+_BOUND = object()
+
+
+class Constraint(object):
+    """
+    Condition every config generated by a GenSchema must satisfy.
+
+    The predicate is only called for configs containing all of the
+    constraint's variables. Configs missing any of them, for example because
+    a variable is a dependency of a value that wasn't chosen, always satisfy
+    the constraint. When variables share a name, the predicate sees the
+    value the config holds for that name.
+
+    Args:
+        variables: Names of the variables the predicate depends on.
+        predicate: Callable taking the value of each variable, in order, and
+            returning True if the config is allowed.
+        description: (str) Optional readable form of the constraint.
+    """
+
+    __slots__ = ('variables', 'predicate', 'description')
+
+    def __init__(self, variables, predicate, description = None):
+        self.variables = tuple(variables)
+        self.predicate = predicate
+        self.description = description
+
+    def check(self, values):
+        """
+        Check the constraint against the values of its variables.
+
+        Args:
+            values: Dict mapping at least the constraint's variables to values.
+        Returns:
+            True if the values satisfy the constraint.
+        """
+        return bool(self.predicate(*[values[v] for v in self.variables]))
+
+    def __repr__(self):
+        """Return the description of the constraint."""
+        if self.description is not None:
+            return "Constraint({})".format(self.description)
+        return "Constraint({!r}, {!r})".format(self.variables, self.predicate)
+
+
+def exclusion(combination):
+    """
+    Create a constraint excluding every config that contains a combination of values.
+
+    Args:
+        combination: Dict mapping variables to the values they must all hold
+            for a config to be excluded.
+    Returns:
+        Constraint object.
+    Raises:
+        ValueError if the combination is empty
+    """
+    if not combination:
+        raise ValueError("Excluded combinations must contain at least one variable")
+    variables = tuple(combination)
+    excluded = tuple(combination[v] for v in variables)
+    def predicate(*values):
+        return values != excluded
+    description = "not " + " and ".join("{!r} == {!r}".format(v, x) for v, x in zip(variables, excluded))
+    return Constraint(variables, predicate, description)
+
+
+def inequality(left, op, right):
+    """
+    Create a constraint comparing the values of two numeric variables.
+
+    Configs where either value isn't an int or float satisfy the constraint.
+
+    Args:
+        left: Variable on the left of the comparison.
+        op: (str) Comparison operator, one of <, <=, >, >=, ==, !=.
+        right: Variable on the right of the comparison.
+    Returns:
+        Constraint object.
+    Raises:
+        ValueError if the operator is unknown or both variables are the same
+    """
+    try:
+        compare = OPERATORS[op]
+    except (KeyError, TypeError):
+        raise ValueError("Unknown comparison operator {!r}, expected one of {}".format(
+                op, ", ".join(OPERATORS))) from None
+    if left == right:
+        raise ValueError("Inequalities must compare two different variables")
+    def predicate(a, b):
+        if type(a) not in (int, float) or type(b) not in (int, float):
+            return True
+        return compare(a, b)
+    return Constraint((left, right), predicate, "{!r} {} {!r}".format(left, op, right))
+
+
+def satisfied(constraints, config):
+    """
+    Check a config against a list of constraints.
+
+    Args:
+        constraints: List of Constraint objects.
+        config: (dict) Config to check.
+    Returns:
+        True if the config satisfies every constraint whose variables it contains.
+    """
+    return all(c.check(config) for c in constraints if all(v in config for v in c.variables))
+
+
+class ConstrainedPlan(object):
+    """
+    Count, index, and enumerate the configs of a GenPlan satisfying constraints.
+
+    Configs are ranked by their order in the plan, skipping the configs that
+    violate a constraint. The plan is explored as a sequence of decisions in
+    config order: the value of the most significant slot in use, then the
+    slots of that value's dependencies, then the next slot, and so on. The
+    state after some decisions is the stack of slots still to decide, stored
+    as (node, k) frames meaning the first k slots of the node, along with
+    the values bound so far to the constrained variables.
+
+    The number of valid configs below a state only depends on the slots left
+    and on the values bound to variables of constraints that could still
+    fail, so counts are memoized on those. Once no constraint can fail every
+    config below a state is valid, and slots that can't bind a variable of
+    a constraint that could fail are counted without looking at their values.
+    Configs are generated from the runs of consecutive plan indices left
+    after pruning.
+
+    Args:
+        plan: GenPlan to constrain.
+        constraints: List of Constraint objects.
+    """
+
+    def __init__(self, plan, constraints):
+        self.plan = plan
+        self.constraints = list(constraints)
+        names = {v for c in self.constraints for v in c.variables}
+        # Constraints to check when each constrained variable gets a value
+        self.watchers = {name: [c for c in self.constraints if name in c.variables] for name in names}
+
+        # Constrained variables each slot and its dependencies can bind
+        self.reach = [None] * len(plan.names)
+        def slot_reach(slot):
+            if self.reach[slot] is None:
+                reach = {plan.names[slot]} & names
+                for child in set(plan.children[slot].values()):
+                    for dep_slot in plan.node_slots[child]:
+                        reach |= slot_reach(dep_slot)
+                self.reach[slot] = frozenset(reach)
+            return self.reach[slot]
+
+        # Variables bound and configs counted by the first k slots of each node
+        self.prefix_reach = []
+        self.prefix_radix = []
+        for slots in plan.node_slots:
+            reach = [frozenset()]
+            radix = [1]
+            for slot in slots:
+                reach.append(reach[-1] | slot_reach(slot))
+                radix.append(radix[-1] * plan.domains[slot].radix())
+            self.prefix_reach.append(reach)
+            self.prefix_radix.append(radix)
+
+        self._counts = {}
+        self.size = self._count(self._root(), {}) if plan.size else 0
+
+    def locate(self, rank):
+        """
+        Find the plan index of the valid config with a given rank.
+
+        Args:
+            rank: (int) Position among the valid configs, 0 <= rank < size.
+        Returns:
+            (int) Index of the config in the plan.
+        """
+        stack, bound = self._root(), {}
+        base = 0
+        while True:
+            bound, needed = self._relevant(stack, bound)
+            if not needed:
+                return base + rank
+            slot, rest = self._pop(stack)
+            if self.reach[slot].isdisjoint(needed):
+                digit, rank = divmod(rank, self._count(rest, bound))
+                base += digit * self._plain(rest)
+                stack = rest
+                continue
+            for lo, hi, each, next_stack, next_bound in self._branches(slot, rest, bound, needed):
+                n = (hi - lo) * each
+                if rank < n:
+                    i, rank = divmod(rank, each)
+                    base += self.plan.domains[slot].offset(lo + i) * self._plain(rest)
+                    stack, bound = next_stack, next_bound
+                    break
+                rank -= n
+
+    def rank_of(self, index):
+        """
+        Find the rank of the config at a plan index.
+
+        Args:
+            index: (int) Valid index into the plan.
+        Returns:
+            (int) Rank of the config among the valid configs, or None if the
+            config violates a constraint.
+        """
+        stack, bound = self._root(), {}
+        rank = 0
+        while True:
+            bound, needed = self._relevant(stack, bound)
+            if not needed:
+                return rank + index
+            slot, rest = self._pop(stack)
+            plain = self._plain(rest)
+            digit, index = divmod(index, plain)
+            if self.reach[slot].isdisjoint(needed):
+                rank += digit * self._count(rest, bound)
+                stack = rest
+                continue
+            pos, sub_index = self.plan.domains[slot].locate(digit)
+            for lo, hi, each, next_stack, next_bound in self._branches(slot, rest, bound, needed):
+                if hi <= pos:
+                    rank += (hi - lo) * each
+                elif lo <= pos:
+                    rank += (pos - lo) * each
+                    stack, bound = next_stack, next_bound
+                    break
+                else:
+                    return None
+            else:
+                return None
+            # The dependencies of the value are decided before the rest
+            index += sub_index * plain
+
+    def blocks(self, start = 0, stop = None):
+        """
+        Generate the runs of plan indices holding the valid configs with ranks in [start, stop).
+
+        Yields:
+            (first, last) tuples of plan indices, where every index in
+            [first, last) holds a valid config. Runs are yielded in order and
+            never touch each other.
+        """
+        if stop is None or stop > self.size:
+            stop = self.size
+        if start >= stop:
+            return
+        first = last = None
+        for a, b in self._blocks(self._root(), {}, 0, start, stop):
+            if a == last:
+                last = b
+                continue
+            if first is not None:
+                yield first, last
+            first, last = a, b
+        yield first, last
+
+    def configs(self, start = 0, stop = None):
+        """Generate the valid configs with ranks in [start, stop), see GenPlan.configs()."""
+        for a, b in self.blocks(start, stop):
+            yield from self.plan.configs(a, b)
+
+    def _blocks(self, stack, bound, base, lo, hi):
+        """
+        Generate runs of plan indices for the valid configs with ranks in [lo, hi) below a state.
+
+        Args:
+            stack: Slots left to decide.
+            bound: Values bound to constrained variables so far.
+            base: (int) Plan index of the first config below the state.
+            lo, hi: (int) Ranks relative to the state, 0 <= lo < hi <= count.
+        """
+        bound, needed = self._relevant(stack, bound)
+        if not needed:
+            yield base + lo, base + hi
+            return
+        slot, rest = self._pop(stack)
+        plain = self._plain(rest)
+        if self.reach[slot].isdisjoint(needed):
+            each = self._count(rest, bound)
+            for digit in range(lo // each, (hi - 1) // each + 1):
+                offset = digit * each
+                yield from self._blocks(rest, bound, base + digit * plain,
+                                        max(lo - offset, 0), min(hi - offset, each))
+            return
+        domain = self.plan.domains[slot]
+        offset = 0
+        for first, last, each, next_stack, next_bound in self._branches(slot, rest, bound, needed):
+            n = (last - first) * each
+            if offset + n > lo:
+                for i in range(max(lo - offset, 0) // each, min(last - first, -(-(hi - offset) // each))):
+                    r = offset + i * each
+                    yield from self._blocks(next_stack, next_bound, base + domain.offset(first + i) * plain,
+                                            max(lo - r, 0), min(hi - r, each))
+            offset += n
+            if offset >= hi:
+                return
+
+    def _root(self):
+        """Return the slots left to decide before any decision."""
+        slots = self.plan.node_slots[0]
+        return ((0, len(slots)),) if slots else ()
+
+    def _pop(self, stack):
+        """Split a stack into its most significant slot and the slots after it."""
+        node, k = stack[-1]
+        rest = stack[:-1] + ((node, k - 1),) if k > 1 else stack[:-1]
+        return self.plan.node_slots[node][k - 1], rest
+
+    def _push(self, stack, child):
+        """Add the slots of a value's dependencies to a stack."""
+        if child is None or not self.plan.node_slots[child]:
+            return stack
+        return stack + ((child, len(self.plan.node_slots[child])),)
+
+    def _plain(self, stack):
+        """Count the configs below a state, ignoring constraints."""
+        count = 1
+        for node, k in stack:
+            count *= self.prefix_radix[node][k]
+        return count
+
+    def _relevant(self, stack, bound):
+        """
+        Find the constraints that could still fail below a state.
+
+        A constraint can fail if it has a variable without a value and every
+        such variable can still be bound by the slots left to decide.
+
+        Returns:
+            Tuple of the bound values, where values that can no longer affect
+            a constraint are replaced by a placeholder, and the set of
+            variables without values of the constraints that could fail.
+        """
+        reach = set()
+        for node, k in stack:
+            reach |= self.prefix_reach[node][k]
+        # Variables keep a placeholder once their values stop mattering, so
+        # later slots with the same name don't look like their first binding
+        kept = dict.fromkeys(bound, _BOUND)
+        needed = set()
+        for c in self.constraints:
+            unbound = [v for v in c.variables if v not in bound]
+            if unbound and reach.issuperset(unbound):
+                needed.update(unbound)
+                kept.update((v, bound[v]) for v in c.variables if v in bound)
+        return kept, needed
+
+    def _count(self, stack, bound):
+        """Count the valid configs below a state."""
+        bound, needed = self._relevant(stack, bound)
+        if not needed:
+            return self._plain(stack)
+        key = (stack, frozenset((v, type(x), x) for v, x in bound.items()))
+        count = self._counts.get(key)
+        if count is None:
+            slot, rest = self._pop(stack)
+            if self.reach[slot].isdisjoint(needed):
+                count = self.plan.domains[slot].radix() * self._count(rest, bound)
+            else:
+                count = sum((hi - lo) * each for lo, hi, each, _, _ in self._branches(slot, rest, bound, needed))
+            self._counts[key] = count
+        return count
+
+    def _branches(self, slot, rest, bound, needed):
+        """
+        List the valid choices for the value of a slot.
+
+        Args:
+            slot: Slot to decide, which can bind a needed variable.
+            rest: Slots left to decide after it.
+            bound: Relevant values bound so far.
+            needed: Variables of constraints that could fail without values.
+        Returns:
+            List of (first, last, count, stack, bound) tuples, one per run of
+            value positions [first, last) leading to the same state, along
+            with the number of valid configs below each position and that
+            state. Positions without valid configs are left out.
+        """
+        plan = self.plan
+        name = plan.names[slot]
+        children = plan.children[slot]
+        branches = []
+        if name in needed:
+            watchers = self.watchers[name]
+            for pos, value in enumerate(plan.values[slot]):
+                next_bound = dict(bound)
+                next_bound[name] = value
+                if not all(c.check(next_bound) for c in watchers
+                           if all(v in next_bound for v in c.variables)):
+                    continue
+                next_stack = self._push(rest, children.get(pos))
+                each = self._count(next_stack, next_bound)
+                if each:
+                    branches.append((pos, pos + 1, each, next_stack, next_bound))
+            return branches
+
+        # The slot's own value doesn't matter, only the dependencies of some
+        # of its values can bind needed variables
+        each = self._count(rest, bound)
+        first = 0
+        for pos in sorted(children):
+            if pos > first and each:
+                branches.append((first, pos, each, rest, bound))
+            next_stack = self._push(rest, children[pos])
+            count = self._count(next_stack, bound)
+            if count:
+                branches.append((pos, pos + 1, count, next_stack, bound))
+            first = pos + 1
+        n = len(plan.values[slot])
+        if n > first and each:
+            branches.append((first, n, each, rest, bound))
+        return branches
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable iteration over the configs of a GenSchema.
+
+A ConfigCursor yields the same configs as GenSchema.configs() while keeping
+track of its position, so it can be saved at any time as a short checkpoint
+token, e.g. in the sessions table, and resumed later by another process.
+Configs are decoded straight from their indices, so resuming only seeks to
+the saved index, which takes time proportional to the depth of the schema
+rather than the number of configs already generated.
+
+Tokens look like
+
+    ctip1:3f2a9c0e5b7d1e44:0/1:c:3000000
+
+and hold the token format, a fingerprint of the schema, the shard, whether
+shards are contiguous (c) or strided (s), and the index of the next config.
+"""
+
+import hashlib
+import types
+
+from .utils import FRange
+
+TOKEN_VERSION = 'ctip1'
+
+
+class ConfigCursor(object):
+    """
+    Iterator over the configs of a schema that can be checkpointed.
+
+    Cursors are created with GenSchema.cursor() and GenSchema.resume().
+
+    Args:
+        schema: GenSchema to generate configs from.
+        shard: (int) Which shard to generate, see GenSchema.configs().
+        num_shards: (int) Number of shards the config space is split into.
+        strided: (bool) Interleave shards instead of using contiguous slices.
+        position: (int) Index of the first config to generate, defaults to
+            the start of the shard.
+    Raises:
+        ValueError if the shard is invalid or the position is outside of it
+    """
+
+    def __init__(self, schema, shard = 0, num_shards = 1, strided = False, position = None):
+        self.schema = schema
+        self.shard = shard
+        self.num_shards = num_shards
+        self.strided = strided
+        start, self.stop, self.step = schema._shard_range(shard, num_shards, strided)
+        if position is None:
+            position = start
+        if not start <= position <= self.stop or ((position - start) % self.step and position != self.stop):
+            raise ValueError("Position {} is not part of the shard".format(position))
+        self._start = position
+        self._yielded = 0
+        # Computed on the first checkpoint, the schema must not be modified while in use
+        self._fingerprint = None
+        self._configs = schema._configs(position, self.stop, self.step)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        config = next(self._configs)
+        self._yielded += 1
+        return config
+
+    @property
+    def position(self):
+        """Index of the next config to generate, or the end of the shard."""
+        # Strided shards end at their stop index rather than past it
+        return min(self._start + self._yielded * self.step, self.stop)
+
+    def done(self):
+        """Check if every config of the shard has been generated."""
+        return self.position >= self.stop
+
+    def checkpoint(self):
+        """
+        Save the position of the cursor.
+
+        Returns:
+            (str) Token that GenSchema.resume() turns into a cursor yielding
+            the configs this cursor hasn't yielded yet.
+        Raises:
+            ValueError if the schema can't be fingerprinted, see fingerprint()
+        """
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.schema)
+        return "{}:{}:{}/{}:{}:{}".format(TOKEN_VERSION, self._fingerprint, self.shard,
+                                          self.num_shards, 's' if self.strided else 'c', self.position)
+
+    @classmethod
+    def resume(cls, schema, token):
+        """
+        Create a cursor from a checkpoint token, see GenSchema.resume().
+
+        Raises:
+            ValueError if the token is malformed or was made for a different schema
+        """
+        try:
+            version, digest, shards, mode, position = token.split(':')
+            shard, num_shards = shards.split('/')
+            shard, num_shards, position = int(shard), int(num_shards), int(position)
+        except (AttributeError, ValueError) as e:
+            raise ValueError("Invalid checkpoint token {!r}".format(token)) from e
+        if version != TOKEN_VERSION or mode not in ('c', 's'):
+            raise ValueError("Invalid checkpoint token {!r}".format(token))
+        if digest != fingerprint(schema):
+            raise ValueError("The checkpoint token was made for a different gen schema")
+        return cls(schema, shard, num_shards, mode == 's', position)
+
+
+def fingerprint(schema):
+    """
+    Compute a short hash identifying the configs of a schema and their order.
+
+    Schemas with the same variables in the same order, the same values of the
+    same types stored as the same ranges, the same dependencies, and the same
+    constraints have the same fingerprint, see _values_digest(). Ranges are
+    hashed by their parameters, so fingerprints take time proportional to
+    the number of explicit values and ranges rather than the number of
+    values in the ranges. Shared dependency schemas are only hashed once.
+
+    Constraints are identified by their description, or else by the module
+    and qualified name of their predicate.
+
+    Returns:
+        (str) 16 hex digits.
+    Raises:
+        ValueError if a constraint has neither a description nor a predicate
+        defined at the top level of a module, such as a lambda
+    """
+    digest = hashlib.sha256(_fingerprint(schema, {}).encode())
+    for constraint in schema.constraints:
+        description = constraint.description
+        if description is None:
+            description = _predicate_name(constraint.predicate)
+        digest.update(repr((constraint.variables, description)).encode())
+    return digest.hexdigest()[:16]
+
+
+def _predicate_name(predicate):
+    """
+    Return a name identifying a constraint predicate across processes.
+
+    Raises:
+        ValueError if the predicate has no such name
+    """
+    module = getattr(predicate, '__module__', None)
+    name = getattr(predicate, '__qualname__', None)
+    if not isinstance(predicate, (types.FunctionType, types.BuiltinFunctionType)) \
+            or module is None or name is None or '<' in name:
+        raise ValueError("Can't checkpoint a gen schema constrained by {!r}, give the "
+                         "constraint a description or use a module level function".format(predicate))
+    return "{}.{}".format(module, name)
+
+
+def _fingerprint(schema, memo):
+    """Hash the variables of a schema and its dependencies, see fingerprint()."""
+    key = id(schema)
+    if key not in memo:
+        digest = hashlib.sha256()
+        for variable, domain in schema.schema.items():
+            deps = tuple((pos, _fingerprint(dep, memo)) for pos, dep in domain.dependency_items())
+            digest.update(repr((variable, _values_digest(domain), deps)).encode())
+        # Keep the schema alive so its id isn't reused
+        memo[key] = (schema, digest.hexdigest())
+    return memo[key][1]
+
+
+def _values_digest(domain):
+    """
+    Hash the sequence of values in a domain in one pass.
+
+    FRanges are hashed by their parameters, so their values are never
+    generated, and other values are hashed one by one along with their types.
+    How explicit values are split into segments doesn't change the hash, so
+    domains hash the same before and after compact().
+    """
+    digest = hashlib.sha256()
+    for _, segment in domain.segments():
+        if isinstance(segment, FRange):
+            digest.update("g{}:{!r}:{}:{!r}:{!r}:{!r};".format(
+                type(segment.start).__qualname__, segment.start, type(segment.inc).__qualname__,
+                segment.inc, len(segment), segment.ndigits).encode())
+        else:
+            for value in segment:
+                digest.update("v{}:{!r};".format(type(value).__qualname__, value).encode())
+    return digest.hexdigest()
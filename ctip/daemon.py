@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Local daemon writing job updates to the ctip database.
+
+Jobs report their progress with `ctip update` and `ctip log`. Without the
+daemon, every report opens its own database connection and commits a single
+row. The daemon listens on a Unix domain socket instead: clients send each
+update as a line of JSON and wait for a one line JSON reply, while a single
+writer thread applies every update that arrived in the meantime in one
+transaction, so concurrent jobs share commits rather than wait on each
+other's write locks.
+
+Start it with `ctip daemon`. The socket defaults to $CTIP_SOCKET if it's set,
+otherwise to the database path followed by .sock. Commands fall back to
+writing to the database directly when no daemon is listening.
+"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+
+from .dbm import DatabaseManager, default_db_path
+from .exceptions import DaemonUnreachable
+
+# Most updates applied in one transaction
+DEFAULT_BATCH_SIZE = 1000
+# Seconds a client waits for the daemon to apply an update
+CLIENT_TIMEOUT = 60.0
+
+
+class StatusDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server applying job updates in batches.
+
+    Each connection sends one update per line, see dbm.apply_updates(), and
+    gets a reply per update once it's committed: {"ok": true} or
+    {"ok": false, "error": "..."}.
+
+    Args:
+        path: (str) Path of the socket, defaults to default_socket_path().
+        dbname: (str) Path of the database, defaults to default_db_path().
+        batch_size: (int) Most updates applied in one transaction.
+    Raises:
+        RuntimeError if another daemon is listening on the socket
+    """
+
+    daemon_threads = True
+    # Jobs tend to report at the same time
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, path = None, dbname = None, batch_size = DEFAULT_BATCH_SIZE):
+        self.path = path or default_socket_path(dbname)
+        self.db = DatabaseManager(dbname)
+        self.batch_size = batch_size
+        # Numbers of transactions committed and updates applied
+        self.batches = 0
+        self.updates = 0
+        self._queue = queue.Queue()
+        _remove_stale_socket(self.path)
+        socketserver.UnixStreamServer.__init__(self, self.path, _UpdateHandler)
+        self._writer = threading.Thread(target=self._write, name="ctip-writer", daemon=True)
+        self._writer.start()
+
+    def server_bind(self):
+        """Create the socket accessible only to its owner from the moment it exists."""
+        # Only the user's own jobs may write to their database
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def submit(self, update):
+        """
+        Queue an update for the writer thread and wait until it's applied.
+
+        Returns:
+            Error message, or None if the update was applied.
+        """
+        pending = _Pending(update)
+        self._queue.put(pending)
+        pending.done.wait()
+        return pending.error
+
+    def server_close(self):
+        """Stop listening, finish the queued updates, and remove the socket."""
+        socketserver.UnixStreamServer.server_close(self)
+        self._queue.put(None)
+        self._writer.join()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _write(self):
+        """Apply queued updates in batches until server_close() is called."""
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            # Group everything that queued up during the last commit
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [pending for pending in batch if pending is not None]
+            if batch:
+                self._apply(batch)
+
+    def _apply(self, batch):
+        """Apply a batch of pending updates and wake up their clients."""
+        try:
+            errors = self.db.apply([pending.update for pending in batch])
+        except Exception:
+            # One bad update shouldn't fail the others, apply them one by one
+            errors = []
+            for pending in batch:
+                try:
+                    errors.extend(self.db.apply([pending.update]))
+                except sqlite3.Error as e:
+                    errors.append(str(e))
+                except Exception as e:
+                    # Anything else must not kill the writer thread
+                    errors.append("Failed to apply update: {!r}".format(e))
+        self.batches += 1
+        self.updates += len(batch)
+        for pending, error in zip(batch, errors):
+            pending.error = error
+            pending.done.set()
+
+
+class _Pending(object):
+    """Update waiting for the writer thread."""
+
+    __slots__ = ('update', 'error', 'done')
+
+    def __init__(self, update):
+        self.update = update
+        self.error = None
+        self.done = threading.Event()
+
+
+class _UpdateHandler(socketserver.StreamRequestHandler):
+    """Read updates from a client, one JSON object per line."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                update = json.loads(line.decode('utf-8'))
+                _check_update(update)
+            except ValueError as e:
+                error = "Invalid update: {}".format(e)
+            else:
+                error = self.server.submit(update)
+            reply = {'ok': True} if error is None else {'ok': False, 'error': error}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b"\n")
+
+
+# Types of the fields of an update, None means the field may be left out
+_UPDATE_FIELDS = (
+    ('command', (str,)),
+    ('job_id', (str,)),
+    ('session_id', (int, type(None))),
+    ('value', (str,)),
+    ('ts', (int, type(None))),
+)
+
+
+def _check_update(update):
+    """
+    Check an update decoded from a client has the fields apply_updates() expects.
+
+    Raises:
+        ValueError if the update isn't a JSON object or a field has the wrong type
+    """
+    if not isinstance(update, dict):
+        raise ValueError("updates must be JSON objects")
+    for field, types in _UPDATE_FIELDS:
+        value = update.get(field)
+        # bool is an int subclass but never a valid session id or timestamp
+        if isinstance(value, bool) or not isinstance(value, types):
+            raise ValueError("{} must be {}, not {!r}".format(
+                field, " or ".join("null" if t is type(None) else t.__name__ for t in types), value))
+
+
+def send(update, path = None, timeout = CLIENT_TIMEOUT):
+    """
+    Send an update to the daemon and wait for it to be applied.
+
+    Args:
+        update: (dict) Update, see dbm.apply_updates().
+        path: (str) Path of the daemon's socket, defaults to default_socket_path().
+        timeout: (float) Seconds to wait for the reply.
+    Returns:
+        Error message, or None if the update was applied.
+    Raises:
+        DaemonUnreachable if the update couldn't be sent because no daemon
+        is listening on the socket or its backlog stayed full
+        OSError if the connection failed or timed out after the update was
+        sent, which may or may not have been applied, e.g. ConnectionError
+        if the daemon closed the connection before replying
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        raise DaemonUnreachable("Unix domain sockets are not supported")
+    deadline = time.monotonic() + timeout
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        while True:
+            try:
+                client.connect(path or default_socket_path())
+                break
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                raise DaemonUnreachable("The ctip daemon is not running") from e
+            except BlockingIOError:
+                # The daemon's backlog of connections is full
+                if time.monotonic() > deadline:
+                    raise DaemonUnreachable("Timed out connecting to the ctip daemon")
+                time.sleep(0.001)
+        client.sendall(json.dumps(update).encode('utf-8') + b"\n")
+        with client.makefile('rb') as replies:
+            line = replies.readline()
+    if not line:
+        raise ConnectionError("The ctip daemon closed the connection")
+    reply = json.loads(line.decode('utf-8'))
+    return None if reply.get('ok') else reply.get('error')
+
+
+def default_socket_path(dbname = None):
+    """Return the path of the daemon's socket for a database."""
+    path = os.environ.get('CTIP_SOCKET')
+    if path:
+        return path
+    return (dbname or default_db_path()) + ".sock"
+
+
+def _remove_stale_socket(path):
+    """
+    Remove a socket left behind by a daemon that didn't shut down cleanly.
+
+    Raises:
+        RuntimeError if a daemon is still listening on the socket
+    """
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.remove(path)
+            return
+    raise RuntimeError("A ctip daemon is already listening on {}".format(path))
@@ -1,42 +1,591 @@
 # -*- coding: utf-8 -*-
 """
+Local SQLite database of ctip sessions and jobs.
+
+Many jobs update the database at once, so connections are tuned for
+concurrent writers: the database uses write-ahead logging (WAL) so readers
+never block the writer, commits only sync the log at checkpoints
+(synchronous=NORMAL), and a writer waits up to a busy timeout for the write
+lock instead of failing with "database is locked". Connections are pooled
+per process and per thread, and each one keeps a cache of prepared
+statements, so repeated queries are only compiled once.
+
+The database file defaults to $CTIP_DB if it's set, otherwise to ctip/ctip.db
+in the user's data directory ($XDG_DATA_HOME or ~/.local/share).
+
 Created on Sat Sep 17  9:07:17 2016
 
 @author: Aaron Beckett
 """
 
+import itertools
+import json
+import os
 import sqlite3 as sql
+import threading
+import time
+
+# Seconds a connection waits for another connection's write lock
+DEFAULT_TIMEOUT = 30.0
+# Prepared statements cached by each connection
+STATEMENT_CACHE_SIZE = 256
+# Rows passed to each executemany() call by register_jobs()
+REGISTER_CHUNK_SIZE = 10000
+# Oldest SQLite with upserts (3.24) and window functions (3.25)
+MIN_SQLITE_VERSION = (3, 25, 0)
+# Events recorded by `ctip log`
+LOG_EVENTS = ('start', 'pause', 'resume', 'end')
+
+# Runtimes are in nanoseconds
+JOBS_TABLE = """
+    CREATE TABLE IF NOT EXISTS jobs(
+        session_id INT,
+        config_id INT,
+        job_id TEXT,
+        status TEXT,
+        config TEXT,
+        runtime INT,
+        PRIMARY KEY (session_id, job_id)
+    );
+"""
+
+SCHEMA = JOBS_TABLE + """
+    CREATE TABLE IF NOT EXISTS sessions(
+        id INTEGER PRIMARY KEY,
+        name TEXT,
+        exp TEXT,
+        genfile TEXT,
+        where_clause TEXT,
+        env TEXT,
+        date TEXT,
+        checkpoint TEXT
+    );
+    CREATE INDEX IF NOT EXISTS jobs_session_status ON jobs (session_id, status);
+    CREATE INDEX IF NOT EXISTS jobs_job_id ON jobs (job_id);
+    CREATE INDEX IF NOT EXISTS jobs_session_runtime ON jobs (session_id, runtime) WHERE runtime IS NOT NULL;
+    CREATE TABLE IF NOT EXISTS job_events(
+        session_id INT,
+        job_id TEXT,
+        kind TEXT,
+        ts INT
+    );
+    CREATE INDEX IF NOT EXISTS job_events_job ON job_events (session_id, job_id, ts);
+    CREATE TABLE IF NOT EXISTS session_status_counts(
+        session_id INT,
+        status TEXT,
+        count INT NOT NULL,
+        PRIMARY KEY (session_id, status)
+    ) WITHOUT ROWID;
+"""
+
+# Triggers keeping session_status_counts up to date, jobs without a status
+# aren't counted
+COUNT_INSERT_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS jobs_count_insert AFTER INSERT ON jobs
+    WHEN NEW.status IS NOT NULL BEGIN
+        INSERT INTO session_status_counts VALUES (NEW.session_id, NEW.status, 1)
+            ON CONFLICT (session_id, status) DO UPDATE SET count = count + 1;
+    END;
+"""
+COUNT_TRIGGERS = COUNT_INSERT_TRIGGER + """
+    CREATE TRIGGER IF NOT EXISTS jobs_count_update AFTER UPDATE OF session_id, status ON jobs
+    WHEN OLD.status IS NOT NEW.status OR OLD.session_id IS NOT NEW.session_id BEGIN
+        UPDATE session_status_counts SET count = count - 1
+            WHERE session_id = OLD.session_id AND status = OLD.status;
+        INSERT INTO session_status_counts SELECT NEW.session_id, NEW.status, 1
+            WHERE NEW.status IS NOT NULL
+            ON CONFLICT (session_id, status) DO UPDATE SET count = count + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS jobs_count_delete AFTER DELETE ON jobs
+    WHEN OLD.status IS NOT NULL BEGIN
+        UPDATE session_status_counts SET count = count - 1
+            WHERE session_id = OLD.session_id AND status = OLD.status;
+    END;
+"""
+
+# Total time between each start or resume event of a job and the event after it
+RUNTIME = """
+    SELECT SUM(next - ts) FROM (
+        SELECT kind, ts, LEAD(ts) OVER (ORDER BY ts, rowid) AS next
+        FROM job_events WHERE session_id = ? AND job_id = ?
+    ) WHERE kind IN ('start', 'resume') AND next IS NOT NULL
+"""
+
+# Stored in PRAGMA user_version once a database has every table and column
+SCHEMA_VERSION = 1
+
+# Columns added after the tables were first released, by table
+ADDED_COLUMNS = {
+    'sessions': [('checkpoint', 'TEXT')],
+}
 
 
 class DatabaseManager(object):
-    """Handles interactions with the local SQLite Database used by ctip."""
+    """
+    Handles interactions with the local SQLite Database used by ctip.
 
-    dbname = "C:\\Users\\aminor\\Dev\\ctip\\ctip.db"
+    Managers share the connections of their database's ConnectionPool, so
+    creating one is cheap and each thread uses its own connection.
+
+    Args:
+        dbname: (str) Optional path of the database file, defaults to
+            default_db_path().
+        timeout: (float) Seconds to wait for the write lock, only used by
+            the first manager of each database in a process.
+    """
+
+    dbname = None
     reserved_table_names = ['sessions', 'jobs']
 
-    def __init__(self):
-        self.conn = sql.connect(self.dbname)
-        self.conn.row_factory = sql.Row
-        self.conn.executescript("""
-                CREATE TABLE IF NOT EXISTS sessions(
-                    id INTEGER PRIMARY KEY,
-                    name TEXT,
-                    exp TEXT,
-                    genfile TEXT,
-                    where_clause TEXT,
-                    env TEXT,
-                    date TEXT
-                );
-                CREATE TABLE IF NOT EXISTS jobs(
-                    session_id INT,
-                    config_id INT,
-                    job_id TEXT,
-                    status TEXT,
-                    time_log TEXT,
-                    runtime TEXT,
-                    PRIMARY KEY (session_id, job_id)
-                );
-            """)
-
-    def __del__(self):
-        self.conn.close()
\ No newline at end of file
+    def __init__(self, dbname = None, timeout = DEFAULT_TIMEOUT):
+        self.pool = get_pool(dbname or self.dbname or default_db_path(), timeout)
+        self.pool.initialize(_create_tables)
+
+    @property
+    def conn(self):
+        """The calling thread's connection to the database."""
+        return self.pool.connection()
+
+    def save_checkpoint(self, session_id, token):
+        """
+        Record how far a session got through its configs.
+
+        Args:
+            session_id: (int) Id of the session.
+            token: (str) Token from ConfigCursor.checkpoint().
+        """
+        conn = self.conn
+        with conn:
+            conn.execute("UPDATE sessions SET checkpoint = ? WHERE id = ?", (token, session_id))
+
+    def checkpoint(self, session_id):
+        """Return the last checkpoint token saved for a session, or None."""
+        row = self.conn.execute("SELECT checkpoint FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row['checkpoint'] if row is not None else None
+
+    def status_counts(self, session_id = None):
+        """
+        Count the jobs with each status, as shown by `ctip check`.
+
+        Counts are kept up to date by triggers on the jobs table, so they're
+        read from a few rows of session_status_counts however many jobs
+        there are.
+
+        Args:
+            session_id: (int) Optional session to count jobs from, defaults
+                to every session.
+        Returns:
+            Dict mapping each status to its number of jobs.
+        """
+        if session_id is None:
+            rows = self.conn.execute("SELECT status, SUM(count) FROM session_status_counts "
+                                     "GROUP BY status HAVING SUM(count) > 0")
+        else:
+            rows = self.conn.execute("SELECT status, count FROM session_status_counts "
+                                     "WHERE session_id = ? AND count > 0", (session_id,))
+        return {status: count for status, count in rows}
+
+    def runtime_percentiles(self, session_id = None, percentiles = (50, 95), variable = None):
+        """
+        Compute percentiles of the runtimes of finished jobs inside SQLite.
+
+        Runtimes are grouped by session, or by the value a config variable
+        holds in the configs stored with the jobs, see register_jobs(). Jobs
+        whose config wasn't stored or doesn't hold the variable are left out.
+
+        Args:
+            session_id: (int) Optional session to use, defaults to every session.
+            percentiles: Percentiles to compute, from 0 to 100, using the
+                nearest-rank method.
+            variable: (str) Optional config variable to group runtimes by.
+        Returns:
+            Dict mapping each session id, or variable value, to a tuple with
+            a runtime in nanoseconds per percentile.
+        Raises:
+            ValueError if the variable name contains a double quote
+        """
+        params = []
+        if variable is None:
+            source = "SELECT session_id AS grp, runtime FROM jobs WHERE runtime IS NOT NULL"
+        else:
+            if '"' in variable:
+                raise ValueError("Can't group runtimes by variable {!r}".format(variable))
+            source = ("SELECT json_extract(config, ?) AS grp, runtime FROM jobs "
+                      "WHERE runtime IS NOT NULL AND grp IS NOT NULL")
+            params.append('$."{}"'.format(variable))
+        if session_id is not None:
+            source += " AND session_id = ?"
+            params.append(session_id)
+        # The smallest runtime whose rank is at least p% of the runtimes in its group
+        columns = ", ".join("MIN(CASE WHEN rank * 100 >= ? * n THEN runtime END)" for _ in percentiles)
+        query = ("""
+            SELECT grp, {} FROM (
+                SELECT grp, runtime,
+                    ROW_NUMBER() OVER (PARTITION BY grp ORDER BY runtime) AS rank,
+                    COUNT(*) OVER (PARTITION BY grp) AS n
+                FROM ({})
+            ) GROUP BY grp
+        """).format(columns, source)
+        rows = self.conn.execute(query, list(percentiles) + params).fetchall()
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def apply(self, updates):
+        """
+        Apply job updates from `ctip update` and `ctip log` in one transaction.
+
+        See apply_updates() for the format of the updates.
+
+        Returns:
+            List with an error message, or None, for each update.
+        Raises:
+            sqlite3.Error if the transaction fails, in which case no update
+            is applied
+        """
+        conn = self.conn
+        with conn:
+            return apply_updates(conn, updates)
+
+    def register_jobs(self, session_id, configs, first_config_id = 0, status = 'queued',
+                      chunk_size = REGISTER_CHUNK_SIZE, defer_indexes = None):
+        """
+        Insert one jobs row per config in a single transaction.
+
+        Configs are consumed in chunks of chunk_size rows, each inserted with
+        one executemany() call of the same prepared statement, so memory use
+        doesn't depend on the number of configs. Jobs are numbered by their
+        position among the configs, and each job_id starts out as its
+        config_id until the job is submitted, see `ctip update id`. Configs
+        given as dicts are stored as JSON in the config column.
+
+        Secondary indexes of the jobs table can be dropped during the inserts
+        and rebuilt once at the end, which is faster when the new rows make up
+        most of the table. Either way the indexes are back before the
+        transaction commits. The status counts of the session are updated
+        once rather than by a trigger per row.
+
+        Args:
+            session_id: (int) Id of the session the jobs belong to.
+            configs: Iterable of configs, e.g. GenSchema.configs(),
+                GenSchema.sample(), or a ConfigCursor.
+            first_config_id: (int) config_id of the first config, e.g. the
+                position of a resumed ConfigCursor.
+            status: (str) Status of the new jobs.
+            chunk_size: (int) Rows per executemany() call.
+            defer_indexes: (bool) Rebuild secondary indexes after the inserts
+                rather than updating them row by row. Defaults to True when
+                the jobs table is empty.
+        Returns:
+            Tuple of the number of rows inserted and the seconds it took.
+        Raises:
+            ValueError if chunk_size is less than 1
+            sqlite3.IntegrityError if a job already exists, in which case no
+            rows are inserted
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        begin = time.perf_counter()
+        conn = self.conn
+        encode = json.JSONEncoder(separators=(',', ':')).encode
+        rows = ((session_id, config_id, str(config_id), status,
+                 encode(config) if isinstance(config, dict) else None)
+                for config_id, config in enumerate(configs, first_config_id))
+        count = 0
+        # Take the write lock up front rather than when the first chunk is inserted
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if defer_indexes is None:
+                defer_indexes = conn.execute("SELECT 1 FROM jobs LIMIT 1").fetchone() is None
+            indexes = _drop_indexes(conn, 'jobs') if defer_indexes else []
+            conn.execute("DROP TRIGGER jobs_count_insert")
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                conn.executemany("INSERT INTO jobs (session_id, config_id, job_id, status, config) "
+                                 "VALUES (?, ?, ?, ?, ?)", chunk)
+                count += len(chunk)
+            for index in indexes:
+                conn.execute(index)
+            conn.execute(COUNT_INSERT_TRIGGER)
+            if count and status is not None:
+                conn.execute("INSERT INTO session_status_counts VALUES (?, ?, ?) ON CONFLICT (session_id, status) "
+                             "DO UPDATE SET count = count + excluded.count", (session_id, status, count))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if count >= chunk_size:
+            # Large transactions grow the write-ahead log, shrink it while the
+            # pages are still cached
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return count, time.perf_counter() - begin
+
+
+class ConnectionPool(object):
+    """
+    SQLite connections to one database, one per thread.
+
+    Connections are opened on first use by each thread and configured for
+    concurrent access, see connect(). A process forked from the one that
+    opened them opens its own connections, since SQLite connections can't
+    be shared across processes.
+
+    Args:
+        path: (str) Path of the database file.
+        timeout: (float) Seconds to wait for the write lock.
+    """
+
+    def __init__(self, path, timeout = DEFAULT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._connections = []
+        self._initialized = False
+
+    def connection(self):
+        """Return the calling thread's connection, opening it if needed."""
+        if self._pid != os.getpid():
+            # The parent's connections belong to the parent
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.path, self.timeout)
+            with self._lock:
+                self._connections.append(conn)
+            self._local.conn = conn
+        return conn
+
+    def initialize(self, setup):
+        """
+        Run a setup function on the database once per process.
+
+        Args:
+            setup: Callable taking a connection, e.g. to create tables.
+        """
+        if self._initialized and self._pid == os.getpid():
+            return
+        conn = self.connection()
+        with self._lock:
+            if not self._initialized:
+                setup(conn)
+                self._initialized = True
+
+    def close(self):
+        """Close every connection of the pool, which must no longer be in use."""
+        with self._lock:
+            connections = self._connections if self._pid == os.getpid() else []
+            for conn in connections:
+                conn.close()
+            self._reset()
+
+
+def connect(path, timeout = DEFAULT_TIMEOUT):
+    """
+    Open a connection tuned for many concurrent jobs.
+
+    Args:
+        path: (str) Path of the database file, its directory is created if
+            needed.
+        timeout: (float) Seconds to wait for the write lock, which sets
+            SQLite's busy_timeout.
+    Returns:
+        sqlite3.Connection whose rows are sqlite3.Row objects.
+    Raises:
+        RuntimeError if Python's sqlite3 module uses a version of SQLite older
+        than MIN_SQLITE_VERSION
+    """
+    if sql.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError("ctip requires SQLite {} or newer, Python's sqlite3 module uses {}".format(
+            ".".join(map(str, MIN_SQLITE_VERSION)), sql.sqlite_version))
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Pools only share connections across threads to close them
+    conn = sql.connect(path, timeout=timeout, cached_statements=STATEMENT_CACHE_SIZE,
+                       check_same_thread=False)
+    conn.row_factory = sql.Row
+    # WAL is persistent, but checking it is as cheap as setting it
+    conn.execute("PRAGMA journal_mode = WAL")
+    # Safe from corruption in WAL mode, a power loss can only undo the last commits
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def apply_updates(conn, updates):
+    """
+    Apply job updates within the current transaction.
+
+    Each update is a dict with the keys:
+
+        command: 'status', 'id', or 'log'.
+        job_id: Id of the job to update.
+        session_id: Session of the job, or None for the latest session with
+            a job with that id.
+        value: New status, new job id, or one of LOG_EVENTS.
+        ts: Time of a log event in nanoseconds on the monotonic clock,
+            time.monotonic_ns(), defaults to the time it's applied.
+
+    Log events are recorded in the job_events table. When a job ends, its
+    runtime is set to the nanoseconds it spent running, not counting the
+    time between pause and resume events. Monotonic timestamps can't go
+    backwards, but are only comparable between processes on the same
+    machine since it booted.
+
+    Args:
+        conn: sqlite3.Connection to the database.
+        updates: List of update dicts.
+    Returns:
+        List with an error message, or None, for each update.
+    """
+    errors = []
+    for update in updates:
+        command = update.get('command')
+        job_id = update.get('job_id')
+        value = update.get('value')
+        session_id = update.get('session_id')
+        if session_id is None:
+            row = conn.execute("SELECT MAX(session_id) FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            session_id = row[0]
+        key = (session_id, job_id)
+        if command == 'status':
+            found = conn.execute("UPDATE jobs SET status = ? WHERE session_id = ? AND job_id = ?",
+                                 (value,) + key).rowcount
+        elif command == 'id':
+            found = conn.execute("UPDATE jobs SET job_id = ? WHERE session_id = ? AND job_id = ?",
+                                 (value,) + key).rowcount
+            conn.execute("UPDATE job_events SET job_id = ? WHERE session_id = ? AND job_id = ?", (value,) + key)
+        elif command == 'log' and value in LOG_EVENTS:
+            found = conn.execute("SELECT 1 FROM jobs WHERE session_id = ? AND job_id = ?", key).fetchone()
+            if found:
+                ts = update.get('ts')
+                conn.execute("INSERT INTO job_events VALUES (?, ?, ?, ?)",
+                             key + (value, time.monotonic_ns() if ts is None else int(ts)))
+                if value == 'end':
+                    conn.execute("UPDATE jobs SET runtime = ({}) WHERE session_id = ? AND job_id = ?".format(RUNTIME),
+                                 key + key)
+        else:
+            errors.append("Invalid update {!r}".format(update))
+            continue
+        errors.append(None if found else "No job with id {!r}".format(job_id))
+    return errors
+
+
+def _drop_indexes(conn, table):
+    """
+    Drop the indexes created on a table with CREATE INDEX.
+
+    Returns:
+        List of the statements that recreate the dropped indexes.
+    """
+    indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                           "AND tbl_name = ? AND sql IS NOT NULL", (table,)).fetchall()
+    for index in indexes:
+        conn.execute('DROP INDEX "{}"'.format(index['name']))
+    return [index['sql'] for index in indexes]
+
+
+def _create_tables(conn):
+    """
+    Create the ctip tables, adding columns and tables missing from older databases.
+
+    Many jobs may open an older database at the same time, so the schema is
+    checked and migrated while holding the write lock, and up to date
+    databases are marked with SCHEMA_VERSION so they skip the lock.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another connection may have migrated the database while we waited
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            _migrate(conn)
+            conn.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _migrate(conn):
+    """Bring the tables of a database up to date within the current transaction."""
+    counted = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'session_status_counts'").fetchone()
+    runtime = [row['type'] for row in conn.execute("PRAGMA table_info(jobs)") if row['name'] == 'runtime']
+    if runtime and runtime[0] != 'INT':
+        _rebuild_jobs(conn)
+    _execute_script(conn, SCHEMA)
+    if counted is None:
+        conn.execute("INSERT INTO session_status_counts SELECT session_id, status, COUNT(*) FROM jobs "
+                     "WHERE status IS NOT NULL GROUP BY session_id, status")
+    _execute_script(conn, COUNT_TRIGGERS)
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row['name'] for row in conn.execute("PRAGMA table_info({})".format(table))}
+        for name, kind in columns:
+            if name not in existing:
+                conn.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, name, kind))
+
+
+def _rebuild_jobs(conn):
+    """
+    Replace the jobs table of databases created by ctip 0.1.
+
+    Its time_log and runtime columns were declared as text but never
+    written. SQLite can't change the type of a column, so the rows are copied
+    into a new table without them.
+    """
+    _execute_script(conn, "ALTER TABLE jobs RENAME TO jobs_old;" + JOBS_TABLE + """
+        INSERT INTO jobs (session_id, config_id, job_id, status)
+            SELECT session_id, config_id, job_id, status FROM jobs_old;
+        DROP TABLE jobs_old;
+    """)
+
+
+def _execute_script(conn, script):
+    """
+    Execute SQL statements one at a time within the current transaction.
+
+    Unlike executescript(), this doesn't commit the transaction first.
+    """
+    statement = ""
+    for part in script.split(";"):
+        statement += part + ";"
+        if sql.complete_statement(statement):
+            if statement.strip(" \n;"):
+                conn.execute(statement)
+            statement = ""
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path = None, timeout = DEFAULT_TIMEOUT):
+    """
+    Return the process-wide connection pool of a database.
+
+    Args:
+        path: (str) Path of the database file, defaults to default_db_path().
+        timeout: (float) Seconds to wait for the write lock, only used when
+            the pool is created.
+    Returns:
+        ConnectionPool shared by every caller using the same database.
+    """
+    path = os.path.abspath(path or default_db_path())
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path, timeout)
+        return pool
+
+
+def default_db_path():
+    """Return the path of the database used by default."""
+    path = os.environ.get('CTIP_DB')
+    if path:
+        return path
+    base = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "ctip", "ctip.db")
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Space-filling designs over the numeric variables of a GenSchema.
+
+Instead of the full grid of a schema's numeric variables, a design picks a
+fixed budget of points spread evenly over them: a Latin hypercube, a Sobol
+sequence, or a Halton sequence. Points are generated in batches as NumPy
+arrays of coordinates in the unit hypercube, then each coordinate is mapped
+to one of its variable's values. The remaining variables, along with their
+dependencies, are either crossed with every point or sampled by an extra
+coordinate of the design.
+
+NumPy is an optional dependency of ctip and is only needed by this module.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .constraints import satisfied
+
+METHODS = ('lhs', 'sobol', 'halton')
+
+# Bits of precision of Sobol points, which allows up to 2**BITS points
+BITS = 52
+
+# Primitive polynomials and initial direction numbers of the first Sobol
+# dimensions from Joe and Kuo's new-joe-kuo-6.21201 table. Polynomials are
+# written as integers whose bits are their coefficients, the first dimension
+# (1) is the van der Corput sequence in base 2.
+SOBOL_DIRECTIONS = (
+    (1, (1,)),
+    (3, (1,)),
+    (7, (1, 3)),
+    (11, (1, 3, 1)),
+    (13, (1, 1, 1)),
+    (19, (1, 1, 3, 3)),
+    (25, (1, 3, 5, 13)),
+    (37, (1, 1, 5, 5, 17)),
+    (41, (1, 1, 5, 5, 5)),
+    (47, (1, 1, 7, 11, 19)),
+    (55, (1, 1, 5, 1, 1)),
+    (59, (1, 1, 1, 3, 11)),
+    (61, (1, 3, 5, 5, 31)),
+    (67, (1, 3, 3, 9, 7, 49)),
+    (91, (1, 1, 1, 15, 21, 21)),
+    (97, (1, 3, 1, 13, 27, 49)),
+    (103, (1, 1, 1, 15, 7, 5)),
+    (109, (1, 3, 1, 15, 13, 25)),
+    (115, (1, 1, 5, 5, 19, 61)),
+    (131, (1, 3, 7, 11, 23, 15, 103)),
+    (137, (1, 3, 7, 13, 13, 15, 69)),
+    (143, (1, 1, 3, 13, 7, 35, 63)),
+    (145, (1, 3, 5, 9, 1, 25, 53)),
+    (157, (1, 3, 1, 13, 9, 35, 107)),
+    (167, (1, 3, 1, 5, 27, 61, 31)),
+    (171, (1, 1, 5, 11, 19, 41, 61)),
+    (185, (1, 3, 5, 3, 3, 13, 69)),
+    (191, (1, 1, 7, 13, 1, 19, 1)),
+    (193, (1, 3, 7, 5, 13, 19, 59)),
+    (203, (1, 1, 3, 9, 25, 29, 41)),
+    (211, (1, 3, 5, 13, 23, 1, 55)),
+    (213, (1, 3, 7, 3, 13, 59, 17)),
+)
+
+
+def design_configs(schema, n, method = 'lhs', seed = None, variables = None,
+                   categorical = 'cross', batch_size = 4096):
+    """
+    Generate the configs of a space-filling design over a GenSchema.
+
+    See GenSchema.design() for a description of the arguments.
+
+    Raises:
+        ImportError if NumPy is not installed
+        ValueError if the arguments are invalid
+    """
+    if np is None:
+        raise ImportError("NumPy is required to build space-filling designs")
+    if method not in METHODS:
+        raise ValueError("Unknown design method {!r}, expected one of {}".format(method, ", ".join(METHODS)))
+    if categorical not in ('cross', 'sample'):
+        raise ValueError("categorical must be 'cross' or 'sample'")
+    if n < 0:
+        raise ValueError("Design size can't be negative")
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    if variables is None:
+        variables = [v for v, domain in schema.schema.items() if _is_numeric(domain)]
+    else:
+        variables = list(variables)
+        for v in variables:
+            if v not in schema.schema:
+                raise ValueError("{} does not exist in the gen schema".format(v))
+            if schema.schema[v].dependency_items():
+                raise ValueError("Design variables can't have dependencies, {} does".format(v))
+    if not variables:
+        raise ValueError("The gen schema has no numeric variables to build a design over")
+
+    # Every other variable goes into a schema of its own, keeping its dependencies
+    rest = type(schema)()
+    rest.schema = {v: domain for v, domain in schema.schema.items() if v not in variables}
+    sampled = categorical == 'sample' and rest.schema
+    dimensions = len(variables) + (1 if sampled else 0)
+
+    values = [schema.schema[v].values() for v in variables]
+    lengths = np.array([len(vals) for vals in values], dtype=np.float64)
+    if sampled:
+        rest_size = rest.size()
+        lengths = np.append(lengths, rest_size)
+    if method == 'sobol' and dimensions > len(SOBOL_DIRECTIONS):
+        raise ValueError("Sobol designs support at most {} dimensions".format(len(SOBOL_DIRECTIONS)))
+    return _configs(schema.constraints, variables, values, lengths, rest, sampled,
+                    unit_batches(method, n, dimensions, seed, batch_size))
+
+
+def _configs(constraints, variables, values, lengths, rest, sampled, batches):
+    """
+    Turn batches of unit points into configs, see design_configs().
+
+    When crossing, the configs of the other variables are generated once and
+    kept for every point, so each point costs one pass over them.
+    """
+    crossed = None
+    for points in batches:
+        # Map each coordinate to one of the values of its dimension
+        positions = np.minimum(np.floor(points * lengths), lengths - 1).astype(np.int64)
+        columns = [[vals[i] for i in positions[:, k].tolist()] for k, vals in enumerate(values)]
+        rows = zip(*columns)
+        if sampled:
+            rows = zip(rows, positions[:, -1].tolist())
+        for row in rows:
+            if sampled:
+                row, index = row
+                others = [rest.config_at(index)]
+            else:
+                if crossed is None:
+                    crossed = list(rest.configs()) if rest.schema else [{}]
+                others = crossed
+            point = dict(zip(variables, row))
+            for other in others:
+                config = dict(other)
+                config.update(point)
+                if not constraints or satisfied(constraints, config):
+                    yield config
+
+
+def unit_batches(method, n, dimensions, seed = None, batch_size = 4096):
+    """
+    Generate the points of a design in the unit hypercube.
+
+    Args:
+        method: (str) One of 'lhs', 'sobol', or 'halton'.
+        n: (int) Number of points.
+        dimensions: (int) Number of coordinates per point.
+        seed: Seed for the random numbers used by the design. Latin
+            hypercubes are random even without a seed. Sobol and Halton
+            sequences are deterministic unless a seed is given, in which
+            case they're randomly shifted.
+        batch_size: (int) Maximum number of points per batch.
+    Yields:
+        Float64 arrays of shape (points, dimensions) with coordinates in [0, 1).
+    """
+    rng = np.random.default_rng(seed)
+    if method == 'lhs':
+        # Each dimension visits its n strata in a random order
+        strata = np.empty((n, dimensions), dtype=np.int64)
+        for k in range(dimensions):
+            strata[:, k] = rng.permutation(n)
+        for start in range(0, n, batch_size):
+            block = strata[start:start + batch_size]
+            yield (block + rng.random(block.shape)) / n
+    elif method == 'sobol':
+        directions = sobol_directions(dimensions)
+        shift = rng.integers(0, 2**BITS, dimensions, dtype=np.uint64) if seed is not None else None
+        for start in range(0, n, batch_size):
+            index = np.arange(start, min(start + batch_size, n), dtype=np.uint64)
+            yield sobol_points(index, directions, shift)
+    else:
+        shift = rng.random(dimensions) if seed is not None else 0
+        for start in range(0, n, batch_size):
+            index = np.arange(start, min(start + batch_size, n), dtype=np.int64)
+            yield (halton_points(index, dimensions) + shift) % 1.0
+
+
+def sobol_directions(dimensions):
+    """
+    Compute the direction numbers of the first Sobol dimensions.
+
+    Returns:
+        Uint64 array of shape (BITS, dimensions) where row k holds the
+        direction numbers XORed into a point when bit k of its index is set.
+    """
+    directions = np.zeros((BITS, dimensions), dtype=np.uint64)
+    for d, (poly, initial) in enumerate(SOBOL_DIRECTIONS[:dimensions]):
+        if poly == 1:
+            m = [1] * BITS
+        else:
+            s = poly.bit_length() - 1
+            m = list(initial)
+            for k in range(s, BITS):
+                new = m[k - s] ^ (m[k - s] << s)
+                for i in range(1, s):
+                    if (poly >> (s - i)) & 1:
+                        new ^= m[k - i] << i
+                m.append(new)
+        for k in range(BITS):
+            directions[k, d] = m[k] << (BITS - 1 - k)
+    return directions
+
+
+def sobol_points(index, directions, shift = None):
+    """
+    Compute Sobol points from their indices in the sequence.
+
+    Args:
+        index: Uint64 array of point indices.
+        directions: Direction numbers from sobol_directions().
+        shift: Optional bits XORed into every point, a random digital shift.
+    Returns:
+        Float64 array of shape (len(index), dimensions).
+    """
+    bits = np.zeros((len(index), directions.shape[1]), dtype=np.uint64)
+    for k in range(int(index.max()).bit_length() if len(index) else 0):
+        mask = ((index >> np.uint64(k)) & np.uint64(1)).astype(bool)
+        bits[mask] ^= directions[k]
+    if shift is not None:
+        bits ^= shift
+    return bits.astype(np.float64) / 2.0**BITS
+
+
+def halton_points(index, dimensions):
+    """
+    Compute Halton points from their indices in the sequence.
+
+    Dimension k is the radical inverse of the index in the k-th prime base.
+
+    Args:
+        index: Int64 array of point indices.
+        dimensions: (int) Number of coordinates per point.
+    Returns:
+        Float64 array of shape (len(index), dimensions).
+    """
+    points = np.zeros((len(index), dimensions))
+    for k, base in enumerate(_primes(dimensions)):
+        remaining = index.copy()
+        scale = 1.0
+        while remaining.any():
+            scale /= base
+            remaining, digit = np.divmod(remaining, base)
+            points[:, k] += digit * scale
+    return points
+
+
+def _primes(count):
+    """Return the first count prime numbers."""
+    primes = []
+    candidate = 2
+    while len(primes) < count:
+        if all(candidate % p for p in primes):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def _is_numeric(domain):
+    """Check if every value of a domain is an int or float without dependencies."""
+    # Ranges always hold numbers
+    return not domain.dependency_items() and all(type(v) in (int, float) for v in domain.explicit_values())
@@ -52,6 +52,7 @@ def create_cli_parser():
     parser_list = subparsers.add_parser('list')
     parser_update = subparsers.add_parser('update')
     parser_log = subparsers.add_parser('log')
+    parser_daemon = subparsers.add_parser('daemon')
 
     # run
     parser_run.add_argument('experiment')
@@ -124,4 +125,7 @@ def create_cli_parser():
     # log end
     parser_log_end.set_defaults(func=cmd.log_end)
 
+    # daemon
+    parser_daemon.set_defaults(func=cmd.run_daemon)
+
     return parser
\ No newline at end of file
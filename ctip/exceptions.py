@@ -7,3 +7,11 @@ Created on Sat Jul  9 16:41:53 2016
 @author: Aaron Beckett
 """
 
+
+class DaemonUnreachable(ConnectionError):
+    """
+    Raised when an update couldn't be sent to the ctip daemon at all.
+
+    Nothing reached the daemon, so the update can safely be written to the
+    database another way.
+    """
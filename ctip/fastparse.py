@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Hand written parser for the common subset of genfile syntax.
+
+Genfiles are line oriented, so most of them can be parsed with a few regular
+expressions per line and a stack of indentation levels, which is much faster
+than the general pyparsing grammar built by GenParser. The parser produces the
+same ParseResults structure as the grammar and raises UnsupportedSyntax for
+anything it isn't certain to parse identically (tabs, escaped quotes,
+continued lines, unusual indentation, malformed values, ...), in which case
+GenParser falls back to the grammar.
+
+The parser works one line at a time, so stream_genfile() can also build a
+schema directly from an open genfile without holding a parse tree.
+"""
+
+import re
+
+import pyparsing as p
+
+# Schema name on a line of its own
+_NAME = re.compile(r"([A-Za-z][A-Za-z0-9\-_.]*) *$")
+# Variable scope, the values are split by _parse_values()
+_SCOPE = re.compile(r"( *)([A-Za-z][A-Za-z0-9\-_.]*) *= *")
+# Numbers as written in genfiles, floats must contain a decimal point
+_NUMBER = r"[+-]?(?:\d*\.\d+(?:[eE][+-]?\d+)?|\d+)"
+_NUMBER_VALUE = re.compile(_NUMBER + "$")
+_RANGE_VALUE = re.compile(r"({0}) *: *({0})(?: *: *({0}))? *$".format(_NUMBER))
+# End of an unquoted value
+_DELIMITER = re.compile(r"[#,]")
+# Unquoted values starting like a number are only partially matched by the grammar
+_NUMERIC_START = re.compile(r"[+\-\d]|\.\d")
+# Characters allowed in unquoted values
+_UNQUOTED = re.compile(r"[!-~]+(?: +[!-~]+)*$")
+
+
+class UnsupportedSyntax(ValueError):
+    """Raised when a genfile uses syntax the fast parser doesn't handle."""
+
+
+def parse_genfile(text):
+    """
+    Parse the contents of a genfile.
+
+    Args:
+        text: (str) Contents of the genfile.
+    Returns:
+        ParseResults object equivalent to the one produced by the GenParser grammar.
+    Raises:
+        UnsupportedSyntax if the genfile must be parsed by the grammar
+    """
+    name, schema = stream_genfile(text.split('\n'), list, _add_domain)
+
+    # The domains of the top level schema aren't grouped into a nested list
+    results = p.ParseResults([] if name is None else [name])
+    if name is not None:
+        results['name'] = name
+    results += p.ParseResults(p.ParseResults([_domain_results(d) for d in schema]), 'schema')
+    return results
+
+
+def stream_genfile(lines, new_block, add_suite):
+    """
+    Parse a genfile one line at a time, handing over each suite as it closes.
+
+    A suite closes when the next line at the same or a lower indentation is
+    read, after all of the suites in its dependency block have closed, so
+    only the suites on the path to the current line are held in memory.
+
+    Args:
+        lines: Iterable of the lines of the genfile, e.g. an open genfile.
+        new_block: Function called without arguments to create the object
+            collecting the suites of the top level schema or of a nested block.
+        add_suite: Function called as add_suite(block, var, values, deps) when
+            a suite closes, where values is a list of values and range tuples
+            and deps is the block of the suite's dependencies or None.
+    Returns:
+        Tuple of the schema name, or None, and the top level block.
+    Raises:
+        UnsupportedSyntax if the genfile must be parsed by the grammar
+    """
+    name = None
+    started = False
+    # Indentation, block, and open suite [var, values, deps] of each open level
+    levels = [[0, new_block(), None]]
+    for line in lines:
+        if line.endswith('\n'):
+            line = line[:-1]
+        if '\t' in line or '\r' in line or '\\' in line:
+            raise UnsupportedSyntax("tabs, carriage returns, and escapes aren't supported")
+        stripped = line.lstrip(' ')
+        if not stripped or stripped[0] == '#':
+            continue
+
+        match = _SCOPE.match(line)
+        if match is None:
+            if name is None and not started and _NAME.match(line):
+                name = line.rstrip(' ')
+                continue
+            raise UnsupportedSyntax("unrecognized line: " + line)
+        started = True
+
+        indent = len(match.group(1))
+        level = levels[-1]
+        if indent > level[0]:
+            # Dependencies of the open suite
+            if level[2] is None:
+                raise UnsupportedSyntax("indented first line")
+            level = [indent, new_block(), None]
+            levels[-1][2][2] = level[1]
+            levels.append(level)
+        else:
+            while indent < levels[-1][0]:
+                _close(levels.pop(), add_suite)
+            level = levels[-1]
+            if indent != level[0]:
+                raise UnsupportedSyntax("inconsistent indentation")
+            _close(level, add_suite)
+
+        level[2] = [match.group(2), _parse_values(line, match.end()), None]
+
+    if not started:
+        raise UnsupportedSyntax("empty schema")
+    while levels:
+        block = levels[-1][1]
+        _close(levels.pop(), add_suite)
+    return name, block
+
+
+def _close(level, add_suite):
+    """Hand over the open suite of a level, see stream_genfile()."""
+    if level[2] is not None:
+        add_suite(level[1], *level[2])
+        level[2] = None
+
+
+def _add_domain(block, var, values, deps):
+    """Collect a suite as a [var, values, deps] domain, see parse_genfile()."""
+    block.append([var, values] if deps is None else [var, values, deps])
+
+
+def _parse_values(line, pos):
+    """Parse the comma separated values of a scope starting at line[pos]."""
+    values = []
+    while True:
+        while pos < len(line) and line[pos] == ' ':
+            pos += 1
+        if pos == len(line) or line[pos] in '#,':
+            raise UnsupportedSyntax("missing value")
+
+        quote = line[pos]
+        if quote in '"\'':
+            end = line.find(quote, pos + 1)
+            if end < 0:
+                raise UnsupportedSyntax("unterminated quote")
+            value = line[pos + 1:end]
+            # Values quoted twice lose both sets of quotes, see GenParser
+            if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            pos = end + 1
+            while pos < len(line) and line[pos] == ' ':
+                pos += 1
+            if pos < len(line) and line[pos] not in '#,':
+                raise UnsupportedSyntax("text after quoted value")
+        else:
+            delim = _DELIMITER.search(line, pos)
+            end = delim.start() if delim else len(line)
+            value = _convert(line[pos:end].rstrip(' '))
+            pos = end
+        values.append(value)
+
+        if pos == len(line) or line[pos] == '#':
+            return values
+        pos += 1
+
+
+def _convert(raw):
+    """Convert an unquoted value to a number, range tuple, or string."""
+    if _NUMBER_VALUE.match(raw):
+        return _number(raw)
+    match = _RANGE_VALUE.match(raw)
+    if match:
+        return tuple(_number(n) for n in match.groups() if n is not None)
+    if _NUMERIC_START.match(raw) or not _UNQUOTED.match(raw):
+        raise UnsupportedSyntax("ambiguous value: " + raw)
+    return raw
+
+
+def _number(raw):
+    """Convert a number the same way the grammar does."""
+    return float(raw) if '.' in raw else int(raw)
+
+
+def _deps_results(domains):
+    """Build the ParseResults holding a nested list of dependency domains."""
+    results = p.ParseResults([_domain_results(domain) for domain in domains])
+    return p.ParseResults([results], 'deps')
+
+
+def _domain_results(domain):
+    """Build the ParseResults of a single [var, values, deps] domain."""
+    var, values = domain[:2]
+    results = p.ParseResults([var], 'var', asList=False)
+    results += p.ParseResults([p.ParseResults(values)], 'values')
+    if len(domain) > 2:
+        results += _deps_results(domain[2])
+    return results
@@ -7,11 +7,28 @@ Created on Sun Jul 10 14:48:26 2016
 @author: Aaron Beckett
 """
 
+import bisect
+import hashlib
+import itertools
+import math
+import random
+import sys
+import threading
+import weakref
+from array import array
+
 import pyparsing as p
 
-from .utils import frange
+from .cache import get_cache
+from .constraints import ConstrainedPlan, Constraint, exclusion, inequality
+from .cursor import ConfigCursor
+from .fastparse import UnsupportedSyntax, parse_genfile, stream_genfile
+from .setops import GenUnion
+from .utils import FRange, range_digits
 
 TAB = ' ' * 4
+# Shortest run of ints or floats stored in a typed array by Domain.compact()
+COMPACT_RUN = 16
 
 
 class GenSchema(object):
@@ -31,6 +48,23 @@ class GenSchema(object):
     
         add_values(variable, *values)
         add_dependencies(variable, value, *dependencies)
+        extend(domains, dependencies)
+        add_constraint(variables, predicate)
+        add_exclusion(combination)
+        add_inequality(left, op, right)
+        size()
+        config_changes(shard, num_shards)
+        cursor(shard, num_shards)
+        resume(token)
+        sample(n, seed, replace)
+        design(n, method, seed)
+        union(other)
+        intersection(other)
+        difference(other)
+        to_columns(batch_size)
+        config_at(index)
+        index_of(config)
+        compile()
         
         
     The structure of a gen schema's variables and dependencies can be
@@ -56,7 +90,14 @@ class GenSchema(object):
         
     Notice how the dependents tied to 'val2.2' really just define a nested
     gen schema which is linked to 'val2.2'.
+    
+    Each variable's list of values is stored in a Domain, which behaves like
+    the list of [value, dependencies] pairs above but can hold ranges of
+    values lazily.
     """
+
+    __slots__ = ('name', 'schema', 'constraints', '_frozen', '_size', '_plan', '_constrained_plan',
+                 '_frozen_copy', '__weakref__')
     
     def __init__(self, name = None):
         """
@@ -67,6 +108,12 @@ class GenSchema(object):
         """
         self.name = name
         self.schema = {}
+        # Constraint objects every generated config must satisfy
+        self.constraints = []
+        # Shared dependency schemas are frozen, see add_dependencies()
+        self._frozen = False
+        # Cached sizes and lookup tables, reset whenever the schema is modified
+        self._reset_cache()
     
     def add_values(self, variable, *values):
         """
@@ -77,19 +124,23 @@ class GenSchema(object):
         If a value is passed in twice it is only added to the variable's domain once (provided it does not aready
         exist in the domain).
         Variables and values can be any immutable datatype besides a tuple.
+        Values can also be FRange objects, which are stored lazily so their
+        values are only computed when needed.
         
         Args:
             variable: Name of the variable to add values to.
-            *values: One or more values to add to the variable.
+            *values: One or more values or FRanges to add to the variable.
         Raises:
-            TypeError if no values are provided or the variable/values are not strings, ints, or floats
+            TypeError if no values are provided or the variable/values are not strings, ints, floats, or FRanges
         """
         
         def valid_type(v):
             return type(v) == str or type(v) == int or type(v) == float
             
         unique = set()
-        current_domain = {v[0] for v in self.schema[variable]} if variable in self.schema else None
+        domain = self.schema.get(variable)
+        # Ranges being added lazily by this call
+        new_ranges = []
         def check_uniqueness(v):
             """
             Check if v is already in the variable domain or duplicated in the values.
@@ -101,24 +152,48 @@ class GenSchema(object):
             """
             # test v against set of already checked values and
             # current domain of the variable
-            if v in unique or (current_domain and v in current_domain):
+            if v in unique or (domain and domain.has_value(v)) or any(v in r for r in new_ranges):
                 return False
             # v is not duplicated, add it to the set of checked values
             unique.add(v)
             return True
+
+        def overlaps(r):
+            """Check if any value in the range r could already be in the domain or the values."""
+            lo, hi = r.bounds()
+            ranges = new_ranges + (domain.ranges() if domain else [])
+            if any(lo <= other.bounds()[1] and other.bounds()[0] <= hi for other in ranges):
+                return True
+            explicit = domain.explicit_values() if domain else ()
+            return any(v in r for v in itertools.chain(unique, explicit))
             
+        self._check_mutable()
         if not values:
             raise TypeError("Must provide at least one value to add_values()")
             
-        if not valid_type(variable) or not all([valid_type(v) for v in values]):
-            raise TypeError("Gen schema variables and values must be strings, ints, or floats")
-            
-        values = [(v,None) for v in values if check_uniqueness(v)]
+        if not valid_type(variable) or not all([valid_type(v) or isinstance(v, FRange) for v in values]):
+            raise TypeError("Gen schema variables and values must be strings, ints, floats, or FRanges")
+
+        # Ranges are added lazily unless they might contain duplicates, in which
+        # case their values are checked one at a time
+        new_values = []
+        for v in values:
+            if not isinstance(v, FRange):
+                if check_uniqueness(v):
+                    new_values.append(v)
+            elif overlaps(v):
+                new_values.extend(x for x in v if check_uniqueness(x))
+            else:
+                new_values.append(v)
+                new_ranges.append(v)
+        self._reset_cache()
         
         if variable not in self.schema:
-            self.schema[variable] = values
+            if isinstance(variable, str):
+                variable = sys.intern(variable)
+            self.schema[variable] = Domain(new_values)
         else:
-            self.schema[variable].extend(values)
+            self.schema[variable].extend(new_values)
     
     def add_dependencies(self, variable, value, *dependencies):
         """
@@ -126,6 +201,13 @@ class GenSchema(object):
 
         The variable and value must already exist and dependencies must be
         a GenSchema.
+
+        Values don't hold on to the given dependencies. Instead they are bound
+        to a frozen snapshot of the merged dependencies which is shared by
+        every value with structurally identical dependencies, so a nested
+        block shared by many values is only stored once. Snapshots can't be
+        modified directly; binding more dependencies to a value replaces its
+        snapshot without affecting other values.
         
         Args:
             variable: Variable containing the value aquiring dependencies.
@@ -134,117 +216,656 @@ class GenSchema(object):
         Raises:
             TypeError if no dependencies are provided or a dependency is not of type GenSchema
             KeyError if the variable does not exist in the GenSchema
-            ValueError if the value is not in the variable's domain
+            ValueError if the value is not in the variable's domain or a dependency has constraints
         """
         
+        self._check_mutable()
         if not dependencies:
             raise TypeError("Must provide at least one dependency to add_dependencies()")
             
         if not all([isinstance(d, GenSchema) for d in dependencies]):
             raise TypeError("Dependencies must be of type GenSchema")
+        if any(d.constraints for d in dependencies):
+            raise ValueError("Dependencies can't have constraints, add them to the top level schema instead")
             
         try:
             values = self.schema[variable]
-            idx = [v[0] for v in values].index(value)
+            idx = values.index(value)
         except KeyError as e:
             raise KeyError("{} does not exist in the gen schema".format(variable)) from e
         except ValueError as e:
             raise ValueError("{} is not a valid value for {}".format(value,variable)) from e
             
-        if values[idx][1] is None:
-            values[idx] = (values[idx][0], GenSchema())
+        self._reset_cache()
+        current = values.dependencies(idx)
+        if current is None and len(dependencies) == 1:
+            values.set_dependencies(idx, dependencies[0]._snapshot())
+            return
+        # Copy on write: build a new snapshot rather than changing the current one
+        merged = GenSchema()
+        if current is not None:
+            merged.schema.update(current.schema)
         for dep in dependencies:
-            values[idx][1].schema.update(dep.schema)
+            merged.schema.update(dep._snapshot().schema)
+        values.set_dependencies(idx, _intern(merged))
     
-    def configs(self):
-        """Generate all configurations represented by the schema."""
-        
-        # Make sure there's a schema with which to generate configs
-        if not self.schema:
-            raise StopIteration
-        
-        # List of the variable names to maintain an order
-        variables = list(self.schema.keys())
-        N = len(variables)
-        # Indices tracking which value is next for each variable
-        cursors = [-1] * N
-        # References to any generator used to get a value's sub-variables
-        gens = [None] * N
-        # List holding pieces of the curent config associated with each variable.
-        # Config pieces are dictionaries of variables and their values. The piece
-        # associated with a varialbe at this level will have more than just that
-        # variable only if there are sub-variables associated with its current value.
-        config_pieces = [{}] * N
-            
-        def increment(variable, idx):
-            """
-            Update the config piece associated with this variable.
-            
-            Args:
-                variable: Name of the variable to increment.
-                idx: (int) Index of the variable in the order.
-            """
-            # Store whether or not the values for this variable rolled-over
-            cycled = False
-            # The new piece of the config associated with this variable
-            piece = {}
-            
-            # If there's a generator for this variable, the current value we're
-            # on has sub-variables. This means we should get the next round of
-            # sub-variables and only increment the cursor if there are no more
-            # sub-variables to be generated.
-            if gens[idx]:
-                val = self.schema[variable][cursors[idx]][0]
-                try:
-                    piece = next(gens[idx])
-                except StopIteration:
-                    # No more sub-variables to generate, un-store generator
-                    # so we fall in to the cursor incrementing if statement
-                    gens[idx] = None
-                    
-            # If there is no generator, either there never were sub-variables or
-            # the sub-variables ran out. Either way, we need to increment the
-            # cursor and move on to the next value. 
-            if not gens[idx]:
-                # Increment the cursor tracking which value we're on for this
-                # variable. Detect if we've cycled so we can return that flag.
-                pos = cursors[idx] + 1
-                if pos == len(self.schema[variable]):
-                    cycled = True
-                    pos = 0
-                cursors[idx] = pos
-                # Get the new value and any sub-value generator associated with it
-                val, gen = self.schema[variable][pos]
-                # If there are sub-variables, store their generator and get the
-                # first set of sub-variables.
-                if gen:
-                    gens[idx] = gen.configs()
-                    piece = next(gens[idx])
-
-            # At this point, val will have the correct value, regardless of whether
-            # it was incremented or stayed the same because of sub-variables or
-            # cycled. piece will either have sub-variables or be empty.
-            piece[variable] = val
-            # Swap out the old piece associated with this variable with the new piece
-            config_pieces[idx] = piece
-            
-            return cycled
-        
-        # Fill config_pieces with initial pieces for each variable
-        for i, var in enumerate(variables):
-            increment(var, i)
+    def extend(self, domains, dependencies=()):
+        """
+        Add many variables, values, and dependency bindings in one call.
+
+        This is equivalent to calling add_values() for every variable and then
+        add_dependencies() for every binding, except all dependencies bound to
+        the same value are merged at once. Values and dependencies are looked
+        up through each variable's value index, so building a schema this way
+        takes time linear in the number of values and bindings.
+
+        Args:
+            domains: Dict or iterable of (variable, values) pairs where values
+                is an iterable of values and FRanges to add to the variable.
+            dependencies: Iterable of (variable, value, GenSchema) triples.
+        Raises:
+            TypeError, KeyError, or ValueError under the same conditions as
+            add_values() and add_dependencies()
+        """
+        items = domains.items() if isinstance(domains, dict) else domains
+        for variable, values in items:
+            self.add_values(variable, *values)
+
+        # Group dependencies by the value they're bound to, keeping their order
+        bindings = {}
+        for variable, value, dep in dependencies:
+            bindings.setdefault((variable, type(value), value), []).append(dep)
+        for (variable, _, value), deps in bindings.items():
+            self.add_dependencies(variable, value, *deps)
+
+    def add_constraint(self, variables, predicate, description = None):
+        """
+        Only generate configs whose values satisfy a predicate.
+
+        The predicate is called with the value of each variable, in order, as
+        soon as all of them have been chosen while enumerating configs. If it
+        returns False, every config sharing those values is skipped at once.
+        Configs that don't contain all of the variables, for example because
+        a variable depends on a value that wasn't chosen, are never skipped.
+
+        Constraints apply to every variable with a matching name, including
+        dependent variables, so they're added to the top level schema. They
+        are not written to genfiles.
+
+        Args:
+            variables: Variable name or list of variable names the predicate
+                depends on.
+            predicate: Callable taking one value per variable and returning
+                True if the config is allowed.
+            description: (str) Optional readable form of the constraint. It
+                identifies the constraint in checkpoint tokens, so it's
+                needed to checkpoint schemas constrained by lambdas.
+        Raises:
+            TypeError if the predicate isn't callable or no variables are given
+        """
+        if isinstance(variables, (str, int, float)):
+            variables = [variables]
+        variables = list(variables)
+        if not variables:
+            raise TypeError("Must provide at least one variable to add_constraint()")
+        if not callable(predicate):
+            raise TypeError("Constraint predicates must be callable")
+        self._add_constraint(Constraint(variables, predicate, description))
+
+    def add_exclusion(self, combination):
+        """
+        Skip every config containing a combination of values.
+
+        For example add_exclusion({'optimizer': 'sgd', 'momentum': 0.9})
+        skips all configs using sgd with a momentum of 0.9. See
+        add_constraint() for how constraints are applied.
+
+        Args:
+            combination: Dict mapping variables to values.
+        Raises:
+            ValueError if the combination is empty
+        """
+        self._add_constraint(exclusion(combination))
+
+    def add_inequality(self, left, op, right):
+        """
+        Only generate configs where two numeric variables compare a certain way.
+
+        For example add_inequality('min_depth', '<=', 'max_depth'). Configs
+        where either value isn't an int or float are never skipped. See
+        add_constraint() for how constraints are applied.
+
+        Args:
+            left: Variable on the left of the comparison.
+            op: (str) One of <, <=, >, >=, ==, !=.
+            right: Variable on the right of the comparison.
+        Raises:
+            ValueError if the operator is unknown or the variables are the same
+        """
+        self._add_constraint(inequality(left, op, right))
+
+    def _add_constraint(self, constraint):
+        """Add a Constraint object to the schema."""
+        self._check_mutable()
+        self._reset_cache()
+        self.constraints.append(constraint)
+
+    def size(self):
+        """
+        Count the configurations represented by the schema without generating them.
+
+        Each variable contributes one config per value without dependencies and
+        one config per dependent config for values with dependencies. The size
+        of the schema is the product of those counts across all variables,
+        minus the configs skipped by constraints, which are counted without
+        being generated. The result is cached until the schema is modified.
+
+        Returns:
+            (int) Number of configs yielded by configs(), 0 for an empty schema.
+        """
+        constrained = self._constrained()
+        if constrained is not None:
+            return constrained.size
+        return self._plain_size()
+
+    def _plain_size(self):
+        """Count the configurations represented by the schema, ignoring constraints."""
+        if self._size is None:
+            size = 1 if self.schema else 0
+            for domain in self.schema.values():
+                size *= domain.radix()
+            self._size = size
+        return self._size
+
+    def config_at(self, index):
+        """
+        Return the config at a given position in the order generated by configs().
+
+        The config is decoded directly from the index by treating each variable
+        as a digit of a mixed-radix number, so no other configs are generated.
+        With constraints, the index is first mapped to the position of the
+        config among all configs by counting the skipped configs.
         
-        # If we've rolled over on the last element, we're done generating configs
-        cycled_last_variable = False
-        while not cycled_last_variable:
-            # Create and yield the current config made from the config pieces
-            yield {k:v for d in config_pieces for k,v in d.items()}
-            
-            # Gather new pieces of the config based on incrementing the cursors
-            for i, var in enumerate(variables):
-                cycled_last_variable = increment(var, i)
-                if not cycled_last_variable:
-                    break
+        Args:
+            index: (int) Position of the config, negative indices count from the end.
+        Returns:
+            The same config dict configs() would yield at that position.
+        Raises:
+            IndexError if the index is out of range
+        """
+        size = self.size()
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("config index out of range")
+        constrained = self._constrained()
+        if constrained is not None:
+            return self.compile().config_at(constrained.locate(index))
+        return self._decode(index)
+
+    def index_of(self, config):
+        """
+        Return the position of a config in the order generated by configs().
+
+        Variables redefined by dependencies are resolved the same way
+        configs() overrides them. If the schema generates the config more
+        than once, the position of its first occurrence is returned.
+
+        Args:
+            config: (dict) Config to locate.
+        Returns:
+            (int) Index such that config_at(index) == config.
+        Raises:
+            ValueError if the config is not represented by the schema or
+            violates a constraint
+        """
+        try:
+            index = self._encode(config)
+        except (KeyError, ValueError) as e:
+            raise ValueError("config is not represented by the gen schema") from e
+        if not self.schema or self._decode(index) != config:
+            raise ValueError("config is not represented by the gen schema")
+        constrained = self._constrained()
+        if constrained is not None:
+            index = constrained.rank_of(index)
+            if index is None:
+                raise ValueError("config is excluded by the gen schema's constraints")
+        return index
+
+    def compact(self):
+        """
+        Reduce the memory used by the schema without changing its configs.
+
+        Long runs of numeric values are stored in typed arrays, see
+        Domain.compact(). Schemas read from genfiles are compacted
+        automatically. The schema can still be modified afterwards.
+        """
+        for domain in self.schema.values():
+            domain.compact()
+
+    def _reset_cache(self):
+        """Discard cached sizes and plans after the schema is modified."""
+        self._size = None
+        self._plan = None
+        self._constrained_plan = None
+        self._frozen_copy = None
+
+    def _check_mutable(self):
+        """
+        Make sure the schema isn't a shared dependency snapshot.
+
+        Raises:
+            TypeError if the schema is frozen
+        """
+        if self._frozen:
+            raise TypeError("Dependency schemas are shared and can't be modified, "
+                            "use add_dependencies() on the parent schema instead")
+
+    def _snapshot(self):
+        """Return the frozen, shared copy of this schema used as a value's dependencies."""
+        if self._frozen:
+            return self
+        if self._frozen_copy is None:
+            copy = GenSchema()
+            copy.schema = {variable: domain.copy() for variable, domain in self.schema.items()}
+            copy.compact()
+            self._frozen_copy = _intern(copy)
+        return self._frozen_copy
+
+    def _decode(self, index):
+        """Build the config at a valid index, see config_at()."""
+        config = {}
+        for variable, domain in self.schema.items():
+            index, digit = divmod(index, domain.radix())
+            pos, sub_index = domain.locate(digit)
+            value, dep = domain[pos]
+            if dep is not None and dep.schema:
+                config.update(dep._decode(sub_index))
+            config[variable] = value
+        return config
+
+    def _encode(self, config):
+        """
+        Compute the index of a config without checking it decodes to the config, see index_of().
+
+        Raises:
+            ValueError if no index of the schema holds the config's values
+        """
+        for index, written in self._encodings(config, frozenset()):
+            if len(written) == len(config):
+                return index
+        raise ValueError("config is not represented by the gen schema")
+
+    def _encodings(self, config, written):
+        """
+        Generate the indices of the schema whose configs could hold the values of a config.
+
+        A variable defined more than once in a config is overridden by the
+        last definition configs() applies, so the variables are matched
+        last to first and a variable already written by a later definition
+        can take any value. Indices are generated in increasing order.
+
+        Args:
+            config: (dict) Config to locate.
+            written: (frozenset) Variables already set by later definitions.
+        Returns:
+            Generator yielding (index, written) pairs, where written also
+            holds the variables set by the schema.
+        """
+        items = list(self.schema.items())
+        strides = [1]
+        for _, domain in items[:-1]:
+            strides.append(strides[-1] * domain.radix())
+        return self._encode_variables(items, strides, len(items), config, written)
+
+    def _encode_variables(self, items, strides, count, config, written):
+        """Match the last of the first count variables, then the ones before it, see _encodings()."""
+        if not count:
+            yield 0, written
+            return
+        variable, domain = items[count - 1]
+        if variable in written:
+            positions = range(len(domain))
+        else:
+            if variable not in config:
+                return
+            try:
+                positions = [domain.index(config[variable])]
+            except ValueError:
+                return
+            written = written | {variable}
+        for pos in positions:
+            offset = domain.offset(pos)
+            dep = domain.dependencies(pos)
+            if dep is not None and dep.schema:
+                subs = dep._encodings(config, written)
+            else:
+                subs = [(0, written)]
+            for sub_index, after in subs:
+                for rest, final in self._encode_variables(items, strides, count - 1, config, after):
+                    yield (offset + sub_index) * strides[count - 1] + rest, final
+
+    def __len__(self):
+        """Return the number of configurations represented by the schema."""
+        return self.size()
+
+    def configs(self, shard=0, num_shards=1, strided=False):
+        """
+        Generate all configurations represented by the schema.
+
+        The configs can be split into shards so several workers can each
+        generate a disjoint part of the config space. Shards are contiguous
+        slices of the full config order by default, or every num_shards-th
+        config starting at index shard when strided is True. Either way, each
+        shard only generates its own configs and yields them in the same order
+        as the unsharded generator.
+
+        Args:
+            shard: (int) Which shard to generate, from 0 to num_shards - 1.
+            num_shards: (int) Number of shards the config space is split into.
+            strided: (bool) Interleave shards instead of using contiguous slices.
+        Returns:
+            Generator yielding config dicts.
+        Raises:
+            ValueError if num_shards is less than 1 or shard is out of range
+        """
+        return self._configs(*self._shard_range(shard, num_shards, strided))
+
+    def cursor(self, shard=0, num_shards=1, strided=False):
+        """
+        Generate all configurations from a cursor that can be checkpointed.
+
+        The cursor yields the same configs as configs() and its checkpoint()
+        method returns a short token at any point of the iteration. Passing
+        the token to resume() continues where the cursor left off, even in
+        another process, without generating the configs before it.
+
+        Args:
+            shard: (int) Which shard to generate, see configs().
+            num_shards: (int) Number of shards the config space is split into.
+            strided: (bool) Interleave shards instead of using contiguous slices.
+        Returns:
+            ConfigCursor yielding config dicts.
+        Raises:
+            ValueError if num_shards is less than 1 or shard is out of range
+        """
+        return ConfigCursor(self, shard, num_shards, strided)
+
+    def resume(self, token):
+        """
+        Continue generating configurations from a checkpoint.
+
+        Args:
+            token: (str) Token returned by ConfigCursor.checkpoint().
+        Returns:
+            ConfigCursor yielding the configs of the checkpointed shard that
+            weren't generated before the checkpoint.
+        Raises:
+            ValueError if the token is malformed or the schema has changed
+            since the checkpoint was made
+        """
+        return ConfigCursor.resume(self, token)
+
+    def _shard_range(self, shard, num_shards, strided):
+        """
+        Return the config indices of a shard as (start, stop, step), see configs().
+
+        Raises:
+            ValueError if num_shards is less than 1 or shard is out of range
+        """
+        size = self.size()
+        start, stop = _shard_bounds(size, shard, num_shards)
+        if strided:
+            return shard, max(size, shard), num_shards
+        return start, stop, 1
+
+    def _configs(self, start, stop, step=1):
+        """Generate the configs with indices in range(start, stop, step)."""
+        plan = self.compile()
+        constrained = self._constrained()
+        if constrained is not None:
+            if step > 1:
+                return (plan.config_at(constrained.locate(i)) for i in range(start, stop, step))
+            return constrained.configs(start, stop)
+        if step > 1:
+            return (plan.config_at(i) for i in range(start, stop, step))
+        return plan.configs(start, stop)
+
+    def sample(self, n, seed=None, replace=False, shard=0, num_shards=1):
+        """
+        Draw configurations uniformly at random without generating the others.
+
+        Each config is decoded from a random index with config_at(), so
+        values with large dependent schemas are chosen proportionally more
+        often and every config yielded by configs() is equally likely.
+        Drawing n configs takes time proportional to n times the depth of
+        the schema.
+
+        The sample only depends on n, seed, and the schema, so any process
+        with the same seed draws the same configs in the same order. Shards
+        split that sample into contiguous, disjoint parts, so several workers
+        using the same seed can each take a different part of one sample.
+
+        Args:
+            n: (int) Number of configs in the full sample.
+            seed: Optional seed for the random number generator, any value
+                accepted by random.seed(). A random sample is drawn if None.
+            replace: (bool) Allow the same config to be drawn more than once.
+            shard: (int) Which part of the sample to return.
+            num_shards: (int) Number of parts the sample is split into.
+        Returns:
+            List of config dicts.
+        Raises:
+            ValueError if n is negative, if the schema has fewer than n
+            configs when sampling without replacement, if the schema is
+            empty when sampling with replacement, or the shard is invalid
+        """
+        size = self.size()
+        if n < 0:
+            raise ValueError("Sample size can't be negative")
+        if not replace and n > size:
+            raise ValueError("Sample of {} configs is larger than the {} configs in the gen schema".format(n, size))
+        if replace and n and not size:
+            raise ValueError("Can't sample from a gen schema without configs")
+        start, stop = _shard_bounds(n, shard, num_shards)
+
+        rng = random.Random(seed)
+        if replace:
+            indices = [rng.randrange(size) for _ in range(n)]
+        else:
+            indices = _sample_indices(rng, size, n)
+        return [self.config_at(i) for i in indices[start:stop]]
+
+    def design(self, n, method='lhs', seed=None, variables=None, categorical='cross', batch_size=4096):
+        """
+        Generate the configurations of a space-filling design instead of the full grid.
+
+        The numeric variables span a unit hypercube in which n points are
+        placed by a Latin hypercube ('lhs'), a Sobol sequence ('sobol'), or a
+        Halton sequence ('halton'). Each coordinate is mapped to one of its
+        variable's values in order, so a variable's values are covered evenly
+        even when the full grid would be far too large to run. Points are
+        computed in batches with NumPy. Sobol points are best balanced when n
+        is a power of two.
+
+        The other variables, along with their dependencies, are either crossed
+        with every point or sampled by an extra coordinate of the design.
+        Crossing yields n times the number of configs of the other variables,
+        so the number of configs grows multiplicatively with both, and those
+        configs are held in memory while the design is generated. Sampling
+        yields n configs. Configs that violate a constraint are skipped, so
+        fewer configs may be yielded.
+
+        Args:
+            n: (int) Number of design points.
+            method: (str) One of 'lhs', 'sobol', or 'halton'.
+            seed: Optional seed for the random numbers used by the design.
+                Latin hypercubes are random even without a seed, Sobol and
+                Halton sequences are deterministic unless a seed is given, in
+                which case they're randomly shifted.
+            variables: Optional list of the variables to design over, defaults
+                to every top level variable whose values are all ints and
+                floats without dependencies.
+            categorical: (str) 'cross' or 'sample', how to treat the other variables.
+            batch_size: (int) Number of design points computed at a time.
+        Returns:
+            Generator yielding config dicts, like configs().
+        Raises:
+            ImportError if NumPy is not installed
+            ValueError if the method or categorical mode is unknown, n is
+            negative, a design variable doesn't exist or has dependencies,
+            or there are no variables to design over
+        """
+        # Imported here since NumPy is optional and slow to import
+        from .designs import design_configs
+        return design_configs(self, n, method, seed, variables, categorical, batch_size)
+
+    def union(self, other):
+        """
+        Combine the configurations of two schemas.
+
+        Args:
+            other: GenSchema or GenUnion.
+        Returns:
+            GenUnion yielding the configs of this schema followed by the
+            configs of other that aren't in this schema.
+        Raises:
+            ValueError if either schema has constraints
+        """
+        return self._as_union().union(other)
+
+    def intersection(self, other):
+        """
+        Find the configurations shared by two schemas without generating either one.
+
+        Args:
+            other: GenSchema or GenUnion.
+        Returns:
+            GenUnion yielding the configs in both schemas.
+        Raises:
+            ValueError if either schema has constraints
+        """
+        return self._as_union().intersection(other)
+
+    def difference(self, other):
+        """
+        Find the configurations of this schema that another schema doesn't have.
+
+        This is meant for incremental sweeps: after values are added to an
+        existing genfile, new.difference(old) yields only the configs that
+        haven't been run yet. The schemas are compared value by value through
+        their dependencies, see ctip.setops, so neither schema's configs are
+        generated unless a variable is moved in or out of a dependency. The
+        configs are yielded in a different order than configs().
+
+        Args:
+            other: GenSchema or GenUnion of configs to leave out.
+        Returns:
+            GenUnion yielding the configs of this schema that aren't in other.
+        Raises:
+            ValueError if either schema has constraints
+        """
+        return self._as_union().difference(other)
+
+    def _as_union(self):
+        """Return a GenUnion holding this schema as its only piece."""
+        return GenUnion.from_schema(self)
+
+    def config_changes(self, shard=0, num_shards=1):
+        """
+        Generate all configurations as in-place updates to a single dict.
+
+        This is a cheaper alternative to configs() for consumers that can patch
+        their output, such as config files or command lines, using only the
+        variables that changed. The same dict is yielded every time, so it must
+        be copied if it needs to outlive the next iteration. Its key order may
+        differ from the dicts yielded by configs().
+
+        Args:
+            shard: (int) Which contiguous shard to generate, see configs().
+            num_shards: (int) Number of shards the config space is split into.
+        Returns:
+            Generator yielding (config, changed_keys) tuples. Keys that were
+            removed from the config are included in changed_keys.
+        Raises:
+            ValueError if num_shards is less than 1 or shard is out of range
+        """
+        constrained = self._constrained()
+        if constrained is not None:
+            start, stop = _shard_bounds(constrained.size, shard, num_shards)
+            return _config_changes(constrained.configs(start, stop))
+        plan = self.compile()
+        start, stop = _shard_bounds(plan.size, shard, num_shards)
+        return plan.changes(start, stop)
+
+    def to_columns(self, batch_size=65536, shard=0, num_shards=1):
+        """
+        Generate all configurations as batches of NumPy column arrays.
+
+        Numeric variables become int64 or float64 arrays, other variables are
+        dictionary encoded, and dependent variables get a mask marking the
+        configs they are part of. See ctip.columns.ColumnBatch for details.
+        Batches are decoded straight from config indices, so the full config
+        space is never held in memory. Requires NumPy.
+
+        Args:
+            batch_size: (int) Maximum number of configs per batch.
+            shard: (int) Which contiguous shard to export, see configs().
+            num_shards: (int) Number of shards the config space is split into.
+        Returns:
+            Generator yielding ColumnBatch objects in config order.
+        Raises:
+            ImportError if NumPy is not installed
+            ValueError if batch_size is less than 1 or the shard is invalid
+        """
+        # Imported here since NumPy is optional and slow to import
+        from .columns import column_batches
+        plan = self.compile()
+        constrained = self._constrained()
+        if constrained is not None:
+            start, stop = _shard_bounds(constrained.size, shard, num_shards)
+            return column_batches(plan, start, stop, batch_size, constrained.blocks(start, stop))
+        start, stop = _shard_bounds(plan.size, shard, num_shards)
+        return column_batches(plan, start, stop, batch_size)
+
+    def write_columns(self, prefix, batch_size=65536, compressed=False):
+        """
+        Write all configurations to numbered .npz files, one per column batch.
+
+        Files are named <prefix>-00000.npz, <prefix>-00001.npz, and so on.
+
+        Args:
+            prefix: (str) Path prefix of the files to write.
+            batch_size: (int) Maximum number of configs per file.
+            compressed: (bool) Compress the arrays in each file.
+        Returns:
+            List of the filenames written.
+        """
+        filenames = []
+        for i, batch in enumerate(self.to_columns(batch_size)):
+            filename = "{}-{:05d}.npz".format(prefix, i)
+            batch.save(filename, compressed)
+            filenames.append(filename)
+        return filenames
+
+    def compile(self):
+        """
+        Compile the schema into a flat GenPlan used to generate configs.
+
+        The plan is cached until add_values() or add_dependencies() is called.
+        It enumerates every config of the schema, ignoring constraints.
+        """
+        if self._plan is None:
+            self._plan = GenPlan(self)
+        return self._plan
+
+    def _constrained(self):
+        """Return the cached ConstrainedPlan of the schema, or None without constraints."""
+        if not self.constraints:
+            return None
+        if self._constrained_plan is None:
+            self._constrained_plan = ConstrainedPlan(self.compile(), self.constraints)
+        return self._constrained_plan
     
     def __str__(self, indent=''):
         """
@@ -253,55 +874,86 @@ class GenSchema(object):
         Args:
             indent: Optional string appended before all lines added by this schema.
         """
-        
-        # Use sorted list to enforce an order (useful for testing and readability)
-        variables = sorted(self.schema.keys())
+        return '\n'.join(self.lines(indent))
+
+    def lines(self, indent=''):
+        """
+        Generate the lines of the genfile describing this schema.
+
+        Variables are written in sorted order (useful for testing and
+        readability). Lines are generated one at a time, nested schemas
+        included, so large schemas can be written without building their
+        whole text.
 
-        # The plan here is to build up a list of lines in the string representation
-        # then join them all with newlines in the end
-        s = []
+        Args:
+            indent: Optional string appended before all lines added by this schema.
+        """
         
         # Add name of schema if it exists
         if self.name:
-            s.append(str(self.name))
+            yield str(self.name)
         
         # Add lines for each variable and its values
-        for variable in variables:            
-            # Add a line itemizing values without dependencies
-            values = [str(pair[0]) for pair in self.schema[variable] if not pair[1]]
-            if values:
-                line = "{}{} = {}".format(indent, variable, ','.join(values))
-                s.append(line)
+        for variable in sorted(self.schema.keys()):
+            # Add lines itemizing values without dependencies
+            domain = self.schema[variable]
+            for values in _value_lines(domain):
+                yield "{}{} = {}".format(indent, variable, ','.join(values))
             
             # Add values with dependencies
-            values_with_deps = [pair for pair in self.schema[variable] if pair[1]]
-            for value, dep in values_with_deps:
-                line = "{}{} = {}".format(indent, variable, value)
-                s.append(line)
-                s.append(dep.__str__(indent + TAB))
-            
-        return '\n'.join(s)
+            for pos, dep in domain.dependency_items():
+                yield "{}{} = {}".format(indent, variable, _format_value(domain.value(pos)))
+                yield from dep.lines(indent + TAB)
         
     def write(self, filename):
         """
         Create a new genfile from a GenSchema.
 
+        Lines are written to the file as they are generated, see lines().
+
         Args:
-            filename: (str) Filename of the new genfile.
+            filename: (str) Filename of the new genfile, or a file object to
+                write the genfile to.
         """
-        with open(filename, 'w') as f:
-            f.write(str(self))
+        if hasattr(filename, 'write'):
+            filename.writelines(line + '\n' for line in self.lines())
+        else:
+            with open(filename, 'w') as f:
+                f.writelines(line + '\n' for line in self.lines())
     
     @classmethod
-    def read(cls, filename):
+    def read(cls, filename, cache = True):
         """
         Factory method for creating a GenSchema from the contents of a file.
+
+        Schemas are cached on disk by the contents of their genfile, see
+        ctip.cache, so reading an unchanged genfile again skips parsing.
         
         Args:
             cls: Python class this method was called on, should always be GenSchema.
             filename: (str) Genfile to parse.
+            cache: True to use the default SchemaCache, False to bypass the
+                cache, or the SchemaCache object to use.
         """
 
+        def add_suite(schema, var, values, deps):
+            """
+            Add a suite of the genfile to a schema.
+
+            Args:
+                schema: GenSchema to add the suite to.
+                var: (str) Variable of the suite.
+                values: Values of the variable, where ranges are (a, b, inc) tuples.
+                deps: GenSchema holding the dependencies of the values, or None.
+            """
+            ranges = []
+            values = [v for v in values if not isinstance(v, tuple) or ranges.append(v)]
+            ranges = [FRange(*r, ndigits=range_digits(*r)) for r in ranges]
+            schema.add_values(var, *(values + ranges))
+            if deps is not None:
+                for val in itertools.chain(values, *ranges):
+                    schema.add_dependencies(var, val, deps)
+
         def create_schema(domains):
             """
             Create GenSchema filled with the given domains.
@@ -316,36 +968,874 @@ class GenSchema(object):
             """
             schema = GenSchema()
             for domain in domains:
-                ranges = []
-                values = [v for v in domain['values'] if not isinstance(v, tuple) or ranges.append(v)]
-                for range in ranges:
-                    range_vals = [round(v, 5) for v in frange(*range)]
-                    values.extend(range_vals)
-                schema.add_values(domain['var'], *values)
-                if 'deps' in domain:
-                    deps = create_schema(domain['deps'])
-                    for val in domain['values']:
-                        schema.add_dependencies(domain['var'], val, deps)
+                deps = create_schema(domain['deps']) if 'deps' in domain else None
+                add_suite(schema, domain['var'], domain['values'], deps)
             return schema
 
-        # Parse the genfile using the GenParser
-        parsed_schema = GenParser.parseFile(filename)
+        def hashed(lines, digest):
+            """Pass the lines of the genfile through, adding each one to a digest."""
+            for line in lines:
+                if digest is not None:
+                    digest.update(line.encode('utf-8'))
+                yield line
+
+        # Load the schema from the cache if the genfile has been read before
+        schema_cache = get_cache(cache)
+        digest = None
+        if schema_cache is not None:
+            with open(filename, 'r') as f:
+                key = schema_cache.key(f)
+            schema = schema_cache.load(key)
+            if schema is not None:
+                return schema
+            digest = schema_cache.digest()
 
-        # Create a GenSchema from the ParseResult object
-        schema = create_schema(parsed_schema['schema'])
+        try:
+            # Build the schema while streaming through and hashing the genfile
+            with open(filename, 'r') as f:
+                name, schema = stream_genfile(hashed(f, digest), GenSchema, add_suite)
+        except UnsupportedSyntax:
+            # Parse the whole genfile with the pyparsing grammar instead
+            with open(filename, 'r') as f:
+                text = f.read()
+            if digest is not None:
+                digest = schema_cache.digest()
+                digest.update(text.encode('utf-8'))
+            parsed_schema = GenParser._parse_with_grammar(text)
+            schema = create_schema(parsed_schema['schema'])
+            name = parsed_schema.get('name')
 
         # Set the name of the GenSchema if one is given
-        if 'name' in parsed_schema:
-            schema.name = parsed_schema['name']
+        if name is not None:
+            schema.name = name
 
+        schema.compact()
+        # Only cache the schema if the genfile didn't change after it was hashed
+        if schema_cache is not None and digest.hexdigest() == key:
+            schema_cache.store(key, schema)
         return schema
     
     
+def _array_typecode(value):
+    """Return the array typecode able to hold a value exactly, or None."""
+    if type(value) == float:
+        return 'd'
+    if type(value) == int and -2**63 <= value < 2**63:
+        return 'q'
+    return None
+
+
+# Frozen dependency schemas keyed by their structure, see _intern()
+_interned = weakref.WeakValueDictionary()
+
+
+def _intern(schema):
+    """
+    Freeze a schema and return the shared schema with the same structure.
+
+    Two schemas have the same structure when they have the same variables in
+    the same order, the same values of the same types, and the same (already
+    interned) dependencies bound to the same values. Schemas are looked up by
+    a digest of their values, see Domain.key(), and only compared value by
+    value when their digests match.
+    """
+    key = tuple((variable, domain.key()) for variable, domain in schema.schema.items())
+    shared = _interned.get(key)
+    if shared is None:
+        schema._frozen = True
+        _interned[key] = shared = schema
+    elif not _same_structure(shared, schema):
+        # Digests collided, the schema just isn't shared
+        schema._frozen = True
+        shared = schema
+    return shared
+
+
+def _same_structure(a, b):
+    """Check two schemas with the same key have the same structure, see _intern()."""
+    return list(a.schema) == list(b.schema) and \
+        all(a.schema[v].same_structure(b.schema[v]) for v in a.schema)
+
+
+def _range_params(r):
+    """Return the parameters determining the values of an FRange, and their types."""
+    return r.start, type(r.start), r.inc, type(r.inc), len(r), r.ndigits
+
+
+def _span(dep):
+    """Return the number of configs a value contributes given its dependent schema."""
+    return dep.size() if dep is not None and dep.schema else 1
+
+
+def _value_lines(domain):
+    """
+    Generate the genfile value strings of each line itemizing the values of a
+    domain without dependencies.
+
+    Genfiles read the ranges on a line after its other values, so a new line
+    is started whenever an explicit value follows a range to keep the values
+    in order. Ranges with dependencies are written as explicit values, and
+    runs of explicit numbers are written as ranges when that's shorter, see
+    _collapse_runs().
+    """
+    dep_positions = [pos for pos, _ in domain.dependency_items()]
+    def has_deps(start, stop):
+        k = bisect.bisect_left(dep_positions, start)
+        return k < len(dep_positions) and dep_positions[k] < stop
+
+    explicit = []
+    ranges = []
+    for start, segment in domain.segments():
+        if isinstance(segment, FRange) and not has_deps(start, start + len(segment)):
+            ranges.append(_format_range(segment.a, segment.b, segment.inc))
+            continue
+        if dep_positions:
+            segment = [v for i, v in enumerate(segment, start) if not domain.dependencies(i)]
+        for value, is_range in _collapse_runs(segment):
+            if is_range:
+                ranges.append(value)
+            else:
+                if ranges:
+                    yield explicit + ranges
+                    explicit, ranges = [], []
+                explicit.append(value)
+    if explicit or ranges:
+        yield explicit + ranges
+
+
+# Shortest run of explicit numbers written as a range
+COLLAPSE_RUN = 4
+
+
+def _collapse_runs(values):
+    """
+    Generate (string, is_range) pairs for a sequence of explicit values.
+
+    Runs of at least COLLAPSE_RUN ints or floats with a constant difference
+    are written in a:b:c range syntax if the range is shorter than the values
+    and reading it back produces exactly the same values.
+    """
+    n = len(values)
+    i = 0
+    while i < n:
+        value = values[i]
+        kind = type(value)
+        j = i + 1
+        if kind in (int, float) and j < n and type(values[j]) == kind:
+            inc = values[j] - value
+            if kind == float:
+                inc = round(inc, 12)
+            tolerance = 1e-9 * abs(inc) if kind == float else 0
+            while j < n and type(values[j]) == kind and abs(values[j] - values[j-1] - inc) <= tolerance:
+                j += 1
+            if j - i >= COLLAPSE_RUN and inc and math.isfinite(inc):
+                # Every value takes at least two characters with its comma
+                text = _format_range(value, values[j-1], inc)
+                shorter = len(text) < 2 * (j - i) or len(text) < sum(len(_format_value(v)) + 1 for v in values[i:j])
+                if shorter and _same_values(text, values[i:j]):
+                    yield text, True
+                else:
+                    for v in values[i:j]:
+                        yield _format_value(v), False
+                i = j
+                continue
+        yield _format_value(value), False
+        i += 1
+
+
+def _format_range(a, b, inc):
+    """Return the genfile string for a range."""
+    return ':'.join(_format_value(v) for v in (a, b, inc))
+
+
+def _same_values(text, values):
+    """Check a range string is read back as exactly the given values."""
+    a, b, inc = (float(v) if '.' in v or 'e' in v else int(v) for v in text.split(':'))
+    try:
+        r = FRange(a, b, inc, ndigits=range_digits(a, b, inc))
+    except ValueError:
+        return False
+    # Values in a range and in a run all have the same type
+    return len(r) == len(values) and type(r[0]) == type(values[0]) and list(r) == list(values)
+
+
+def _format_value(value):
+    """Return the genfile string for a value, making sure floats are read back as floats."""
+    s = str(value)
+    if type(value) == float and 'e' in s and '.' not in s:
+        mantissa, exponent = s.split('e')
+        s = "{}.0e{}".format(mantissa, exponent)
+    return s
+
+
+def _config_changes(configs):
+    """Turn a generator of configs into updates of a single dict, see GenSchema.config_changes()."""
+    config = {}
+    for new in configs:
+        changed = [k for k in config if k not in new]
+        for k in changed:
+            del config[k]
+        for k, v in new.items():
+            if k not in config or config[k] != v or type(config[k]) is not type(v):
+                config[k] = v
+                changed.append(k)
+        yield config, tuple(changed)
+
+
+def _sample_indices(rng, size, n):
+    """Draw n distinct indices from range(size) in random order."""
+    if size <= sys.maxsize:
+        return rng.sample(range(size), n)
+    # range() can't report its length past sys.maxsize, but collisions are
+    # vanishingly rare in spaces that large
+    chosen = set()
+    indices = []
+    while len(indices) < n:
+        i = rng.randrange(size)
+        if i not in chosen:
+            chosen.add(i)
+            indices.append(i)
+    return indices
+
+
+def _shard_bounds(size, shard, num_shards):
+    """
+    Return the range of config indices [start, stop) in a contiguous shard.
+
+    Raises:
+        ValueError if num_shards is less than 1 or shard is out of range
+    """
+    if num_shards < 1:
+        raise ValueError("num_shards must be at least 1")
+    if not 0 <= shard < num_shards:
+        raise ValueError("shard must be between 0 and {}".format(num_shards - 1))
+    return size * shard // num_shards, size * (shard + 1) // num_shards
+
+
+class Domain(object):
+    """
+    Ordered values of a gen schema variable and the dependencies bound to them.
+
+    A Domain behaves like the list of (value, dependencies) pairs it replaces,
+    where dependencies is a GenSchema or None, and compares equal to such a
+    list. Values are stored in segments: lists of explicit values and lazy
+    FRange objects, so ranges with millions of values are never materialized
+    unless their values are actually needed. Compacted domains store runs of
+    ints or floats in typed arrays instead of lists, see compact().
+    Dependencies are stored sparsely by position since most values don't
+    have any.
+    """
+
+    __slots__ = ('_segments', '_ends', '_deps', '_index', '_layout')
+
+    def __init__(self, values=()):
+        """
+        Initialize a Domain.
+
+        Args:
+            values: Optional iterable of values and FRange objects.
+        """
+        # Lists or arrays of explicit values and FRange objects in order
+        self._segments = []
+        # Position after the last value of each segment
+        self._ends = []
+        # Dependencies keyed by the position of the value they're bound to
+        self._deps = {}
+        # Positions of the explicit values, ranges are searched arithmetically.
+        # Compacted domains drop the index until it's needed again.
+        self._index = {}
+        self._reset_cache()
+        self.extend(values)
+
+    def _reset_cache(self):
+        """Discard the cached config layout."""
+        self._layout = None
+
+    def extend(self, values):
+        """
+        Append values to the domain without checking for duplicates.
+
+        Args:
+            values: Iterable of values and FRange objects.
+        """
+        index = self._index
+        for v in values:
+            if isinstance(v, FRange):
+                self._segments.append(v)
+                self._ends.append(len(self) + len(v))
+                continue
+            if index is not None:
+                index.setdefault(v, len(self))
+            last = self._segments[-1] if self._segments else None
+            if isinstance(last, list) or (isinstance(last, array) and _array_typecode(v) == last.typecode):
+                last.append(v)
+                self._ends[-1] += 1
+            else:
+                self._segments.append([v])
+                self._ends.append(len(self) + 1)
+
+    def compact(self):
+        """
+        Reduce the memory used by the domain without changing its values.
+
+        Runs of at least COMPACT_RUN ints or floats are moved into typed arrays,
+        which store each value in 8 bytes instead of a pointer to a Python
+        object. The value index is dropped and rebuilt the next time a value
+        is looked up.
+        """
+        segments = []
+        run = []
+        def flush():
+            # Split the run of explicit values into typed arrays and lists
+            start = 0
+            while start < len(run):
+                code = _array_typecode(run[start])
+                stop = start + 1
+                while stop < len(run) and _array_typecode(run[stop]) == code:
+                    stop += 1
+                if code is not None and stop - start >= COMPACT_RUN:
+                    segments.append(array(code, run[start:stop]))
+                elif segments and isinstance(segments[-1], list):
+                    segments[-1].extend(run[start:stop])
+                else:
+                    segments.append(run[start:stop])
+                start = stop
+            del run[:]
+
+        for segment in self._segments:
+            if isinstance(segment, FRange):
+                flush()
+                segments.append(segment)
+            else:
+                run.extend(segment)
+        flush()
+
+        self._segments = segments
+        self._ends = list(itertools.accumulate(len(seg) for seg in segments))
+        self._index = None
+
+    def copy(self):
+        """Return a copy of the domain that shares its ranges and dependencies."""
+        domain = Domain()
+        domain._segments = [seg if isinstance(seg, FRange) else seg[:] for seg in self._segments]
+        domain._ends = list(self._ends)
+        domain._deps = dict(self._deps)
+        domain._index = None if self._index is None else dict(self._index)
+        return domain
+
+    def key(self):
+        """
+        Return a hashable key identifying the domain's values and dependencies.
+
+        Values are hashed into a fixed size digest along with their types,
+        since values like 1 and 1.0 are equal but written differently, so the
+        key doesn't keep a copy of the values alive. Arrays are hashed by
+        their bytes and ranges by their parameters. Dependencies are keyed by
+        identity.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for seg in self._segments:
+            if isinstance(seg, FRange):
+                start, start_type, inc, inc_type, n, ndigits = _range_params(seg)
+                digest.update("r{}:{!r}:{}:{!r}:{}:{!r};".format(
+                    start_type.__qualname__, start, inc_type.__qualname__, inc, n, ndigits).encode())
+            elif isinstance(seg, array):
+                digest.update("a{}:{};".format(seg.typecode, len(seg)).encode())
+                digest.update(seg.tobytes())
+            else:
+                digest.update("l{};".format(len(seg)).encode())
+                for v in seg:
+                    digest.update("{}:{!r};".format(type(v).__qualname__, v).encode())
+        deps = tuple(sorted((pos, id(dep)) for pos, dep in self._deps.items()))
+        return digest.digest(), deps
+
+    def same_structure(self, other):
+        """
+        Check another domain has the same segments of values of the same types
+        and the same dependencies, see key().
+        """
+        if len(self._segments) != len(other._segments) or self._deps.keys() != other._deps.keys():
+            return False
+        if any(dep is not other._deps[pos] for pos, dep in self._deps.items()):
+            return False
+        for a, b in zip(self._segments, other._segments):
+            if isinstance(a, FRange) or isinstance(b, FRange):
+                if not (isinstance(a, FRange) and isinstance(b, FRange)):
+                    return False
+                if _range_params(a) != _range_params(b):
+                    return False
+            elif isinstance(a, array) or isinstance(b, array):
+                if not (isinstance(a, array) and isinstance(b, array) and a.typecode == b.typecode and a == b):
+                    return False
+            elif len(a) != len(b) or any(type(x) is not type(y) or x != y for x, y in zip(a, b)):
+                return False
+        return True
+
+    def segments(self):
+        """Return a list of (position, segment) pairs for each segment of values."""
+        starts = [0] + self._ends[:-1]
+        return list(zip(starts, self._segments))
+
+    def explicit_values(self):
+        """Generate the values not stored in a range."""
+        for segment in self._segments:
+            if not isinstance(segment, FRange):
+                yield from segment
+
+    def ranges(self):
+        """Return the FRange objects holding the values stored as ranges."""
+        return [segment for segment in self._segments if isinstance(segment, FRange)]
+
+    def value(self, pos):
+        """Return the value at a non-negative position."""
+        k = bisect.bisect_right(self._ends, pos)
+        if k == len(self._ends):
+            raise IndexError("domain index out of range")
+        return self._segments[k][pos - (self._ends[k-1] if k else 0)]
+
+    def values(self):
+        """
+        Return an indexable sequence of the values in the domain.
+
+        Domains made of a single segment return that segment directly.
+        """
+        if len(self._segments) == 1:
+            return self._segments[0]
+        if not self._segments:
+            return []
+        return _DomainValues(self)
+
+    def index(self, value):
+        """
+        Return the position of a value in the domain.
+
+        Raises:
+            ValueError if the value is not in the domain
+        """
+        if self._index is None:
+            self._index = {}
+            for start, segment in self.segments():
+                if not isinstance(segment, FRange):
+                    for i, v in enumerate(segment, start):
+                        self._index.setdefault(v, i)
+        try:
+            return self._index[value]
+        except KeyError:
+            pass
+        except TypeError:
+            raise ValueError("{} is not in the domain".format(value)) from None
+        start = 0
+        for segment, end in zip(self._segments, self._ends):
+            if isinstance(segment, FRange) and value in segment:
+                return start + segment.index(value)
+            start = end
+        raise ValueError("{} is not in the domain".format(value))
+
+    def has_value(self, value):
+        """Check if a value is in the domain."""
+        try:
+            self.index(value)
+        except ValueError:
+            return False
+        return True
+
+    def dependencies(self, pos):
+        """Return the GenSchema bound to the value at a position, or None."""
+        return self._deps.get(pos)
+
+    def set_dependencies(self, pos, dep):
+        """Bind a GenSchema to the value at a position."""
+        self._deps[pos] = dep
+        self._layout = None
+
+    def dependency_items(self):
+        """Return (position, GenSchema) pairs for every value with non-empty dependencies, in order."""
+        return sorted((pos, dep) for pos, dep in self._deps.items()
+                      if dep is not None and dep.schema)
+
+    def layout(self):
+        """
+        Describe how the domain's configs are laid out.
+
+        Values without dependencies contribute one config each while values
+        with dependencies contribute one config per dependent config. The
+        layout holds parallel lists describing the values with dependencies:
+        their positions, the index of their first config, the number of
+        configs they contribute, and the total number of extra configs
+        contributed by them and every such value before them.
+
+        Returns:
+            Tuple (positions, starts, spans, extras).
+        """
+        if self._layout is None:
+            positions, starts, spans, extras = [], [], [], []
+            extra = 0
+            for pos, dep in self.dependency_items():
+                span = dep.size()
+                positions.append(pos)
+                starts.append(pos + extra)
+                spans.append(span)
+                extra += span - 1
+                extras.append(extra)
+            self._layout = (positions, starts, spans, extras)
+        return self._layout
+
+    def radix(self):
+        """Return the number of configs contributed by all values in the domain."""
+        extras = self.layout()[3]
+        return len(self) + (extras[-1] if extras else 0)
+
+    def offset(self, pos):
+        """Return the index of the first config contributed by the value at a position."""
+        positions, _, _, extras = self.layout()
+        k = bisect.bisect_left(positions, pos)
+        return pos + (extras[k-1] if k else 0)
+
+    def locate(self, digit):
+        """
+        Find which value contributes the config with a given index.
+
+        Args:
+            digit: (int) Index of a config contributed by the domain.
+        Returns:
+            Tuple of the value's position and the index of the config among
+            the configs of its dependencies (always 0 for values without).
+        """
+        positions, starts, spans, extras = self.layout()
+        k = bisect.bisect_right(starts, digit) - 1
+        if k < 0:
+            return digit, 0
+        if digit < starts[k] + spans[k]:
+            return positions[k], digit - starts[k]
+        return digit - extras[k], 0
+
+    def __len__(self):
+        return self._ends[-1] if self._ends else 0
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self[i] for i in range(*pos.indices(len(self)))]
+        if pos < 0:
+            pos += len(self)
+        if pos < 0:
+            raise IndexError("domain index out of range")
+        return (self.value(pos), self._deps.get(pos))
+
+    def __iter__(self):
+        deps = self._deps
+        pos = 0
+        for segment in self._segments:
+            for v in segment:
+                yield (v, deps.get(pos))
+                pos += 1
+
+    def __eq__(self, other):
+        if not isinstance(other, (Domain, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "Domain({!r})".format(self._segments)
+
+
+class _DomainValues(object):
+    """Indexable view of the values of a Domain made of several segments."""
+
+    __slots__ = ('domain',)
+
+    def __init__(self, domain):
+        self.domain = domain
+
+    def __len__(self):
+        return len(self.domain)
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self[i] for i in range(*pos.indices(len(self)))]
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError("domain index out of range")
+        return self.domain.value(pos)
+
+    def __iter__(self):
+        for segment in self.domain._segments:
+            yield from segment
+
+
+class GenPlan(object):
+    """
+    Flat enumeration plan compiled from a GenSchema.
+
+    Every variable of every (nested) schema becomes a slot and every schema
+    becomes a node. Slots and nodes are stored in parallel lists so configs
+    can be generated by a single loop instead of a chain of nested generators:
+
+        names[slot]       variable name of the slot
+        values[slot]      indexable sequence of the variable's values
+        children[slot]    dict mapping the position of each value with
+                          dependencies to the node holding them
+        domains[slot]     Domain of the variable, used to locate values
+        slot_rank[slot]   position of the slot in its node's variable order
+        node_slots[node]  slots of the node in variable order
+        slot_node[slot]   node the slot belongs to
+        unique[slot]      whether no other slot has the same variable name
+
+    Node 0 is the compiled schema itself. While generating configs the plan
+    tracks the slots in use, most significant first, where each slot is
+    followed by the slots of its current value's dependencies. Advancing
+    to the next config only touches the slots after the one that changed.
+    """
+
+    def __init__(self, schema):
+        """
+        Compile a GenSchema.
+
+        Args:
+            schema: GenSchema to compile.
+        """
+        self.names = []
+        self.values = []
+        self.children = []
+        self.domains = []
+        self.slot_rank = []
+        self.slot_node = []
+        self.node_slots = []
+        self.size = schema._plain_size()
+
+        nodes = {}
+        def add_node(gen):
+            """Add a schema and its dependencies to the plan, returning its node id."""
+            if id(gen) in nodes:
+                return nodes[id(gen)]
+            node = len(self.node_slots)
+            nodes[id(gen)] = node
+            self.node_slots.append([])
+            for rank, variable in enumerate(gen.schema):
+                slot = len(self.names)
+                self.node_slots[node].append(slot)
+                domain = gen.schema[variable]
+                self.names.append(variable)
+                self.values.append(domain.values())
+                self.children.append(None)
+                self.domains.append(domain)
+                self.slot_rank.append(rank)
+                self.slot_node.append(node)
+                self.children[slot] = {pos: add_node(dep) for pos, dep in domain.dependency_items()}
+            return node
+
+        add_node(schema)
+
+        # Slots whose variable name isn't used by any other slot can't be
+        # shadowed in a config by another variable with the same name
+        counts = {}
+        for name in self.names:
+            counts[name] = counts.get(name, 0) + 1
+        self.unique = [counts[name] == 1 for name in self.names]
+
+    def configs(self, start=0, stop=None):
+        """
+        Generate the configs with indices in the range [start, stop).
+
+        Args:
+            start: (int) Index of the first config to generate.
+            stop: (int) Index after the last config, defaults to the plan size.
+        """
+        if stop is None or stop > self.size:
+            stop = self.size
+        if start >= stop:
+            return
+
+        names = self.names
+        values = self.values
+        children = self.children
+        unique = self.unique
+        slots, positions, parents = self._seek(start)
+        last = len(slots) - 1
+        config = {names[s]: values[s][i] for s, i in zip(reversed(slots), reversed(positions))}
+
+        for _ in range(stop - start - 1):
+            yield config
+
+            # Fast path: only the least significant slot changes and it neither
+            # has nor gains dependencies, so only one key of the config changes
+            slot = slots[last]
+            pos = positions[last] + 1
+            if pos < len(values[slot]) and pos not in children[slot] and unique[slot]:
+                positions[last] = pos
+                config = dict(config)
+                config[names[slot]] = values[slot][pos]
+                continue
+
+            self._advance(slots, positions, parents)
+            last = len(slots) - 1
+            config = {names[s]: values[s][i] for s, i in zip(reversed(slots), reversed(positions))}
+
+        yield config
+
+    def changes(self, start=0, stop=None):
+        """
+        Generate the configs with indices in the range [start, stop) as updates.
+
+        Rather than yielding a new dict for every config, a single dict is
+        updated in place and yielded along with the keys that changed since
+        the previous config. Keys that were removed from the config are also
+        listed as changed. The first config lists all of its keys as changed.
+
+        Args:
+            start: (int) Index of the first config to generate.
+            stop: (int) Index after the last config, defaults to the plan size.
+        Yields:
+            Tuple of the config dict and a tuple of changed keys.
+        """
+        if stop is None or stop > self.size:
+            stop = self.size
+        if start >= stop:
+            return
+
+        names = self.names
+        values = self.values
+        children = self.children
+        unique = self.unique
+        slots, positions, parents = self._seek(start)
+        last = len(slots) - 1
+        config = {names[s]: values[s][i] for s, i in zip(reversed(slots), reversed(positions))}
+        yield config, tuple(config)
+
+        for _ in range(stop - start - 1):
+            # Fast path: only the least significant slot changes, see configs()
+            slot = slots[last]
+            pos = positions[last] + 1
+            if pos < len(values[slot]) and pos not in children[slot] and unique[slot]:
+                positions[last] = pos
+                config[names[slot]] = values[slot][pos]
+                yield config, (names[slot],)
+                continue
+
+            self._advance(slots, positions, parents)
+            last = len(slots) - 1
+            new = {names[s]: values[s][i] for s, i in zip(reversed(slots), reversed(positions))}
+            changed = [k for k in config if k not in new]
+            for k in changed:
+                del config[k]
+            for k, v in new.items():
+                if k not in config or config[k] != v or type(config[k]) is not type(v):
+                    config[k] = v
+                    changed.append(k)
+            yield config, tuple(changed)
+
+    def config_at(self, index):
+        """Return the config at a valid index."""
+        slots, positions, _ = self._seek(index)
+        names = self.names
+        values = self.values
+        return {names[s]: values[s][i] for s, i in zip(reversed(slots), reversed(positions))}
+
+    def _seek(self, index):
+        """
+        Find the slots in use and their value positions for the config at an index.
+
+        Returns:
+            Lists of slots, value positions, and the entry each slot depends on
+            (-1 for top level slots) ordered from most to least significant.
+        """
+        slots, positions, parents = [], [], []
+        # Stack of (slot, parent entry, digit) still to be placed
+        stack = []
+        def push_node(node, index, parent):
+            for slot in self.node_slots[node]:
+                index, digit = divmod(index, self.domains[slot].radix())
+                stack.append((slot, parent, digit))
+
+        push_node(0, index, -1)
+        while stack:
+            slot, parent, digit = stack.pop()
+            pos, sub_index = self.domains[slot].locate(digit)
+            entry = len(slots)
+            slots.append(slot)
+            positions.append(pos)
+            parents.append(parent)
+            child = self.children[slot].get(pos, -1)
+            if child >= 0:
+                push_node(child, sub_index, entry)
+        return slots, positions, parents
+
+    def _advance(self, slots, positions, parents):
+        """Move the slots in use to the next config, which must exist."""
+        # Advance the least significant slot that hasn't run out of values
+        q = len(slots) - 1
+        while positions[q] + 1 == len(self.values[slots[q]]):
+            q -= 1
+        positions[q] += 1
+        self._reset_after(q, slots, positions, parents)
+
+    def _reset_after(self, q, slots, positions, parents):
+        """
+        Rebuild the slots following entry q after q's value changes.
+
+        Every entry after q is less significant than q, so they are replaced
+        with their first values: the new dependencies of q's value followed by
+        the lower ranked siblings of q and of each slot q depends on.
+        """
+        del slots[q+1:], positions[q+1:], parents[q+1:]
+        
+        # Stack of (slot, parent entry) still to be placed at their first value
+        stack = []
+        chain = []
+        entry = q
+        while entry >= 0:
+            chain.append(entry)
+            entry = parents[entry]
+        for entry in reversed(chain):
+            slot = slots[entry]
+            siblings = self.node_slots[self.slot_node[slot]]
+            for sibling in siblings[:self.slot_rank[slot]]:
+                stack.append((sibling, parents[entry]))
+        child = self.children[slots[q]].get(positions[q], -1)
+        if child >= 0:
+            for slot in self.node_slots[child]:
+                stack.append((slot, q))
+
+        while stack:
+            slot, parent = stack.pop()
+            entry = len(slots)
+            slots.append(slot)
+            positions.append(0)
+            parents.append(parent)
+            child = self.children[slot].get(0, -1)
+            if child >= 0:
+                for dep_slot in self.node_slots[child]:
+                    stack.append((dep_slot, entry))
+
+
 ###############################################################################    
     
     
 class GenParser(object):
-    """Wrapper for a pyparsing parser object used to parse genfile syntax."""
+    """
+    Wrapper for a pyparsing parser object used to parse genfile syntax.
+
+    Genfiles are parsed by the hand written parser in ctip.fastparse when
+    possible, which produces the same results much faster, and by the
+    pyparsing grammar otherwise.
+
+    The grammar is built once per process, the first time it's needed. It
+    keeps the indentation of nested blocks in a mutable stack, so parses are
+    serialized by a lock and the stack is reset before each one.
+
+    Packrat parsing is left disabled: memoized results skip the parse actions
+    that maintain the indent stack, which breaks nested blocks.
+    """
+
+    _grammar = None
+    _indent_stack = None
+    _lock = threading.Lock()
 
     @staticmethod
     def parseString(s):
@@ -355,7 +1845,10 @@ class GenParser(object):
         Returns:
             ParseResults object that can be consumed in the GenSchema read function.
         """
-        return GenParser._get_parser().parseString(s)
+        try:
+            return parse_genfile(s)
+        except UnsupportedSyntax:
+            return GenParser._parse_with_grammar(s)
 
     @staticmethod
     def parseFile(f):
@@ -365,13 +1858,41 @@ class GenParser(object):
         Returns:
             ParseResults object that can be consumed in the GenSchema read function.
         """
-        return GenParser._get_parser().parseFile(f)
+        try:
+            contents = f.read()
+        except AttributeError:
+            with open(f, 'r') as genfile:
+                contents = genfile.read()
+        return GenParser.parseString(contents)
+
+    @staticmethod
+    def _parse_with_grammar(s):
+        """Parse a string with the shared pyparsing grammar."""
+        with GenParser._lock:
+            return GenParser._get_grammar().parseString(s)
+
+    @staticmethod
+    def _get_grammar():
+        """
+        Return the shared genfile grammar, ready to parse a new genfile.
+
+        Must be called while holding GenParser._lock.
+        """
+        if GenParser._grammar is None:
+            GenParser._indent_stack = [1]
+            GenParser._grammar = GenParser._get_parser(GenParser._indent_stack)
+        # A failed parse can leave nested indentation levels on the stack
+        GenParser._indent_stack[:] = [1]
+        return GenParser._grammar
 
     @staticmethod
-    def _get_parser():
+    def _get_parser(indent_stack=None):
         """
         Create parser for genfile using pyparsing library.
-        
+
+        Args:
+            indent_stack: (list) Optional stack used to track the indentation of
+                nested blocks, a new one is created if not given.
         Returns:
             Parser capable of turning a genfile into a consumable ParseResults object.
         """
@@ -430,7 +1951,8 @@ class GenParser(object):
         ######### Define grammar #########################
          
         # Indent stack needed for the pyparsing indentBlock function
-        indent_stack = [1]
+        if indent_stack is None:
+            indent_stack = [1]
         # Statement used for recursive definition of genfile grammar
         stmt = p.Forward()
     
@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+"""
+Set operations on the configs represented by GenSchemas.
+
+The configs of a schema are the product of its variables' values, where a
+value with dependencies contributes the product of its dependent schema.
+Set operations work on that structure directly rather than on configs:
+
+    A & B = (A1 & B1) x (A2 & B2) x ...
+    A - B = (A1 - B1) x A2 x A3 ...
+          + (A1 & B1) x (A2 - B2) x A3 ...
+          + ...
+
+where the values shared by a variable's domains are intersected and
+subtracted recursively through their dependencies. Only values are
+compared, so the cost depends on the size of the schemas rather than the
+number of configs. Ranges stepping through the same values are split by
+comparing positions, without generating their values. The results are rarely a single product, so they're
+returned as a GenUnion: a list of disjoint GenSchemas.
+
+Variables are matched by name. When a variable is at the top of one schema
+but only part of the dependencies of the other, the configs at that level
+are compared one at a time instead. Schemas where a config can hold a
+variable twice, such as a dependency shadowing a top level variable with the
+same name, don't have that structure at all: they may generate the same
+config more than once, so their distinct configs are generated and used as
+pieces of one config each.
+"""
+
+import itertools
+
+from .utils import FRange
+
+
+class GenUnion(object):
+    """
+    Disjoint union of GenSchemas, the result of set operations on GenSchemas.
+
+    Configs are generated piece by piece, so a union behaves like a schema
+    whose configs are the configs of every piece in order.
+
+    Args:
+        pieces: List of GenSchemas without configs in common.
+    """
+
+    def __init__(self, pieces = ()):
+        self.pieces = [piece for piece in pieces if piece.size()]
+
+    @classmethod
+    def from_schema(cls, schema):
+        """
+        Create a union holding the configs of a GenSchema.
+
+        Raises:
+            ValueError if the schema has constraints
+        """
+        return cls(_pieces(schema))
+
+    def size(self):
+        """Return the number of configs in the union."""
+        return sum(piece.size() for piece in self.pieces)
+
+    def __len__(self):
+        """Return the number of configs in the union."""
+        return self.size()
+
+    def configs(self, shard = 0, num_shards = 1):
+        """
+        Generate all configurations in the union.
+
+        Args:
+            shard: (int) Which contiguous shard to generate, see GenSchema.configs().
+            num_shards: (int) Number of shards the configs are split into.
+        Returns:
+            Generator yielding config dicts.
+        Raises:
+            ValueError if num_shards is less than 1 or shard is out of range
+        """
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        if not 0 <= shard < num_shards:
+            raise ValueError("shard must be between 0 and {}".format(num_shards - 1))
+        size = self.size()
+        return self._configs(size * shard // num_shards, size * (shard + 1) // num_shards)
+
+    def _configs(self, start, stop):
+        """Generate the configs with indices in [start, stop)."""
+        offset = 0
+        for piece in self.pieces:
+            size = piece.size()
+            if offset + size > start and offset < stop:
+                plan = piece.compile()
+                yield from plan.configs(max(start - offset, 0), min(stop - offset, size))
+            offset += size
+
+    def config_at(self, index):
+        """
+        Return the config at a given position in the order generated by configs().
+
+        Raises:
+            IndexError if the index is out of range
+        """
+        size = self.size()
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("config index out of range")
+        for piece in self.pieces:
+            if index < piece.size():
+                return piece.config_at(index)
+            index -= piece.size()
+
+    def union(self, other):
+        """Return a GenUnion of the configs in this union or another schema or union."""
+        return GenUnion(self.pieces + self.difference_pieces(other, reverse=True))
+
+    def intersection(self, other):
+        """Return a GenUnion of the configs in both this union and another schema or union."""
+        splitter = _Splitter()
+        return GenUnion([p for a in self.pieces for b in _pieces(other)
+                         for p in splitter.intersection(a, b)])
+
+    def difference(self, other):
+        """Return a GenUnion of the configs in this union but not another schema or union."""
+        return GenUnion(self.difference_pieces(other))
+
+    def difference_pieces(self, other, reverse = False):
+        """
+        Subtract one set of configs from another.
+
+        Args:
+            other: GenSchema or GenUnion.
+            reverse: (bool) Subtract this union from other instead.
+        Returns:
+            List of disjoint GenSchemas.
+        """
+        pieces, subtract = (_pieces(other), self.pieces) if reverse else (self.pieces, _pieces(other))
+        splitter = _Splitter()
+        for b in subtract:
+            pieces = [p for a in pieces for p in splitter.difference(a, b)]
+        return pieces
+
+
+def _pieces(schemas):
+    """
+    Return the pieces of a GenUnion, or a GenSchema as a single piece.
+
+    Schemas with shadowed variables are split into one piece per distinct
+    config instead.
+
+    Raises:
+        ValueError if the schema has constraints
+    """
+    if isinstance(schemas, GenUnion):
+        return schemas.pieces
+    _check_unconstrained(schemas)
+    if not schemas.schema:
+        return []
+    if _shadowed(schemas, {}):
+        distinct = {}
+        for config in schemas.configs():
+            # Shadowing can reorder the keys of equal configs
+            items = frozenset((k, type(v), v) for k, v in config.items())
+            distinct.setdefault(items, config)
+        return [_single(type(schemas), config) for config in distinct.values()]
+    return [schemas]
+
+
+def _check_unconstrained(schema):
+    """
+    Raises:
+        ValueError if the schema has constraints
+    """
+    if schema.constraints:
+        raise ValueError("Set operations don't support gen schemas with constraints")
+
+
+class _Splitter(object):
+    """
+    Split schemas into the configs they share and the configs only one of them has.
+
+    Results are memoized by the identity of the schemas for the duration of
+    one set operation, since dependency schemas are shared by many values.
+    Schemas without variables stand for the empty config a value without
+    dependencies contributes.
+    """
+
+    def __init__(self):
+        self._splits = {}
+        self._names = {}
+
+    def intersection(self, a, b):
+        """Return disjoint GenSchemas holding the configs of both a and b."""
+        if not a.schema or not b.schema:
+            return []
+        return self.split(a, b)[0]
+
+    def difference(self, a, b):
+        """Return disjoint GenSchemas holding the configs of a that aren't in b."""
+        if not a.schema:
+            return []
+        if not b.schema:
+            return [a]
+        return self.split(a, b)[1]
+
+    def split(self, a, b):
+        """
+        Split two (dependency) schemas.
+
+        Returns:
+            Tuple of lists of disjoint GenSchemas, holding the configs in
+            both a and b and the configs of a that aren't in b.
+        """
+        key = (id(a), id(b))
+        if key not in self._splits:
+            # Keep both schemas alive so their ids aren't reused
+            self._splits[key] = (a, b, self._split(a, b))
+        return self._splits[key][2]
+
+    def _split(self, a, b):
+        if a is b:
+            return [a], []
+        variables = list(a.schema)
+        if set(variables) != set(b.schema):
+            only_a = set(variables).difference(b.schema)
+            only_b = set(b.schema).difference(variables)
+            if not only_a <= self.names(b) or not only_b <= self.names(a):
+                # Some configs of one schema have a variable no config of the other has
+                return [], [a]
+            return self._split_configs(a, b)
+        if not variables:
+            return [a], []
+
+        common = []
+        different = []
+        for variable in variables:
+            c, d = self._split_domains(a.schema[variable], b.schema[variable])
+            common.append(c)
+            different.append(d)
+
+        both = []
+        if all(common):
+            both = [_build(type(a), variables, layers, a) for layers in itertools.product(*common)]
+        only = []
+        whole = [_WHOLE]
+        for i, variable in enumerate(variables):
+            for layers in itertools.product(*(common[:i] + [different[i]] + [whole] * (len(variables) - i - 1))):
+                only.append(_build(type(a), variables, layers, a))
+            if not common[i]:
+                # Every later term contains this empty intersection
+                break
+        return both, only
+
+    def _split_domains(self, a, b):
+        """
+        Split the values of two domains of the same variable.
+
+        Returns:
+            Lists of layers for the values in both domains and the values only
+            in a. A layer is a list of (value, dependencies) pairs with unique
+            values, where value can be an FRange of values without dependencies
+            and dependencies is a GenSchema or None. A value whose dependencies
+            are split into several pieces appears once per piece, in different
+            layers.
+        """
+        if a is b:
+            return [_WHOLE], []
+        common = []
+        different = []
+        # Ranges of b without dependencies, keyed by their values
+        b_ranges = {_range_key(seg): start for start, seg in b.segments()
+                    if isinstance(seg, FRange) and not _has_deps(b, start, len(seg))}
+        for start, segment in a.segments():
+            split = None
+            if isinstance(segment, FRange) and not _has_deps(a, start, len(segment)):
+                if _range_key(segment) in b_ranges:
+                    common.append([(segment, None)])
+                    continue
+                split = _split_range(segment, b)
+            if split is not None:
+                both, only, positions = split
+                common.extend([(r, None)] for r in both)
+                different.extend([(r, None)] for r in only)
+                values = ((start + i, segment[i]) for i in positions)
+            else:
+                values = enumerate(segment, start)
+            for pos, value in values:
+                dep = _dependencies(a, pos)
+                try:
+                    other = _dependencies(b, b.index(value))
+                except ValueError:
+                    different.append([(value, dep)])
+                    continue
+                both, only = self.split(dep, other)
+                common.append([(value, piece) for piece in both])
+                different.append([(value, piece) for piece in only])
+        return _layers(common), _layers(different)
+
+    def _split_configs(self, a, b):
+        """Split two schemas with different variables by comparing their configs."""
+        both = []
+        only = []
+        for config in a.configs():
+            try:
+                b.index_of(config)
+                both.append(_single(type(a), config))
+            except ValueError:
+                only.append(_single(type(a), config))
+        return both, only
+
+    def names(self, schema):
+        """Return the set of every variable name in a schema and its dependencies."""
+        key = id(schema)
+        if key not in self._names:
+            names = set(schema.schema)
+            for domain in schema.schema.values():
+                for _, dep in domain.dependency_items():
+                    names |= self.names(dep)
+            self._names[key] = (schema, names)
+        return self._names[key][1]
+
+
+def _shadowed(schema, memo):
+    """
+    Check if a config of a schema can hold the same variable more than once.
+
+    Args:
+        schema: GenSchema to check along with its dependencies.
+        memo: Dict memoizing (shadowed, names) by the id of each schema.
+    """
+    return _check_names(schema, memo)[0]
+
+
+def _check_names(schema, memo):
+    """Return whether a schema shadows variables and the set of its variable names."""
+    key = id(schema)
+    if key not in memo:
+        shadowed = False
+        names = set()
+        for variable, domain in schema.schema.items():
+            # Every config holds one value of each variable, and its dependencies
+            found = {variable}
+            for _, dep in domain.dependency_items():
+                dep_shadowed, dep_names = _check_names(dep, memo)
+                # A dependency may also redefine its own parent variable
+                shadowed = shadowed or dep_shadowed or variable in dep_names
+                found |= dep_names
+            shadowed = shadowed or not names.isdisjoint(found)
+            names |= found
+        memo[key] = (schema, shadowed, names)
+    return memo[key][1:]
+
+
+# Layer standing for every value of a domain along with its dependencies
+_WHOLE = object()
+
+
+def _layers(options):
+    """
+    Spread lists of (value, dependencies) options into layers of unique values.
+
+    The k-th option of every value goes into the k-th layer, so most domains
+    only need a single layer.
+    """
+    layers = []
+    for opts in options:
+        for k, option in enumerate(opts):
+            if k == len(layers):
+                layers.append([])
+            layers[k].append(option)
+    return layers
+
+
+def _build(cls, variables, layers, whole = None):
+    """
+    Create a GenSchema from one layer of values per variable.
+
+    Args:
+        cls: GenSchema class.
+        variables: Variable names in order.
+        layers: One layer per variable, see _Splitter._split_domains(), or
+            _WHOLE to copy the variable's domain from whole.
+        whole: GenSchema the _WHOLE domains are copied from.
+    """
+    schema = cls()
+    for variable, layer in zip(variables, layers):
+        if layer is _WHOLE:
+            schema.schema[variable] = whole.schema[variable].copy()
+            continue
+        schema.add_values(variable, *[value for value, _ in layer])
+        for value, dep in layer:
+            if dep is not None and dep.schema:
+                schema.add_dependencies(variable, value, dep)
+    return schema
+
+
+def _single(cls, config):
+    """Create a GenSchema holding a single config."""
+    schema = cls()
+    for variable, value in config.items():
+        schema.add_values(variable, value)
+    return schema
+
+
+def _dependencies(domain, pos):
+    """Return the dependencies of a value, using an empty schema for values without any."""
+    dep = domain.dependencies(pos)
+    if dep is None:
+        return _EMPTY
+    return dep
+
+
+def _has_deps(domain, start, length):
+    """Check if any value in a run of positions has non-empty dependencies."""
+    return any(start <= pos < start + length for pos, _ in domain.dependency_items())
+
+
+def _split_range(r, domain):
+    """
+    Split the values of an FRange without dependencies by the values of a domain.
+
+    Ranges of the domain without dependencies that step through the same
+    values as r are intersected by comparing positions, so their values are
+    never generated. Explicit values are looked up in r one at a time, and
+    only the values of misaligned ranges or ranges with dependencies are
+    generated.
+
+    Returns:
+        Tuple of the FRanges of values in both r and the domain, the FRanges
+        of values only in r, and the positions in r of the values that must
+        be compared one at a time, or None if r can't be split into exact
+        sub-ranges.
+    """
+    if not _sliceable(r):
+        return None
+    covered = []
+    single = set()
+    lo, hi = r.bounds()
+    for start, segment in domain.segments():
+        if isinstance(segment, FRange):
+            seg_lo, seg_hi = segment.bounds()
+            if seg_hi < lo or hi < seg_lo:
+                continue
+            overlap = _aligned_overlap(r, segment)
+            if overlap is not None and not _has_deps(domain, start, len(segment)):
+                covered.append(overlap)
+                continue
+            if overlap is not None:
+                single.update(range(*overlap))
+                continue
+        for value in segment:
+            try:
+                single.add(r.index(value))
+            except ValueError:
+                pass
+
+    both = []
+    only = []
+    positions = sorted(single)
+    # Walk the positions of r, splitting off the covered runs and single values
+    pos = 0
+    k = 0
+    for first, stop in sorted(covered) + [(len(r), len(r))]:
+        while k < len(positions) and positions[k] < first:
+            only.append((pos, positions[k]))
+            pos = positions[k] + 1
+            k += 1
+        only.append((pos, first))
+        both.append((first, stop))
+        pos = stop
+    both = [_subrange(r, first, stop) for first, stop in both if first < stop]
+    only = [_subrange(r, first, stop) for first, stop in only if first < stop]
+    if None in both or None in only:
+        return None
+    return both, only, positions
+
+
+def _sliceable(r):
+    """
+    Check if an FRange can be split into sub-ranges holding exactly its values.
+
+    Int ranges always can. Float ranges must be rounded to a number of digits
+    their start and increment fit in, and that hides the floating point error
+    of computing their values from a different start.
+    """
+    if type(r.start) is int and type(r.inc) is int:
+        return True
+    if r.ndigits is None or round(r.start, r.ndigits) != r.start or round(r.inc, r.ndigits) != r.inc:
+        return False
+    return max(abs(r.start), abs(r.end)) * 1e-14 < 0.5 * 10.0 ** -r.ndigits
+
+
+def _aligned_overlap(r, other):
+    """
+    Return the positions in r of the values it shares with another FRange.
+
+    Returns:
+        Tuple (first, stop) of positions in r, or None if the ranges don't
+        step through the same values.
+    """
+    if other.inc != r.inc or other.ndigits != r.ndigits or not _sliceable(other):
+        return None
+    shift = (other.start - r.start) / r.inc
+    k = int(round(shift))
+    if abs(shift - k) > 1e-6:
+        return None
+    first, stop = max(0, k), min(len(r), k + len(other))
+    if first >= stop:
+        return first, first
+    if r[first] != other[first - k] or r[stop - 1] != other[stop - 1 - k]:
+        return None
+    return first, stop
+
+
+def _subrange(r, first, stop):
+    """Return an FRange holding the values of r from position first up to stop, or None."""
+    if first == 0 and stop == len(r):
+        return r
+    a, b = r[first], r[stop - 1]
+    # A bound half a step past the last value is safe from floating point error
+    for sub in (FRange(a, b, r.inc, r.ndigits), FRange(a, b + r.inc / 2, r.inc, r.ndigits)):
+        if len(sub) == stop - first and sub[0] == a and sub[-1] == b:
+            return sub
+    return None
+
+
+def _range_key(r):
+    """Return a key identifying the values of an FRange."""
+    return (r.start, type(r.start), r.inc, type(r.inc), len(r), r.ndigits)
+
+
+class _Empty(object):
+    """Stand-in for a schema without variables, used for values without dependencies."""
+    schema = {}
+    constraints = []
+
+    def size(self):
+        return 1
+
+
+_EMPTY = _Empty()
@@ -5,17 +5,16 @@ Created on Sun Jul 10 10:25:42 2016
 @author: Aaron Beckett
 """
 
-import sqlite3 as sql
+import math
 
 
 class DBConn(object):
+    """Connection to a SQLite database from the process-wide pool, see ctip.dbm."""
 
     def __init__(self, dbpath):
-        self.conn = sql.connect(dbpath)
-        self.conn.row_factory = sql.Row
-
-    def __del__(self):
-        self.conn.close()
+        # Imported here so modules only needing ranges don't load the database layer
+        from .dbm import get_pool
+        self.conn = get_pool(dbpath).connection()
 
 
 def frange(a, b = 0, inc = 1):
@@ -58,3 +57,135 @@ def frange(a, b = 0, inc = 1):
         yield nextval
         i += 1
         nextval = start + inc*i
+
+
+
+def range_digits(a, b = 0, inc = 1):
+    """
+    Return the number of decimal places genfile range values are rounded to.
+
+    Values are rounded to 5 decimal places to hide floating point error unless
+    the increment is too small for that, in which case 5 significant digits
+    of the increment are kept so distinct values stay distinct.
+    """
+    if inc == 0 or abs(inc) >= 1e-5:
+        return 5
+    return 4 - int(math.floor(math.log10(abs(inc))))
+
+
+class FRange(object):
+    """Lazy, indexable sequence of the values generated by frange.
+
+    FRange(a, b, inc) holds the same values as list(frange(a, b, inc)) but
+    only computes a value when it is accessed, so a range with millions of
+    values takes constant memory. Supports len, indexing, slicing, iteration,
+    membership tests, and index lookups in constant time.
+
+    Args:
+        a: Either the upper or lower bound.
+        b: Optional second bound, defaults to 0.
+        inc: incremental difference between consecutive values, defaults to 1.
+        ndigits: Optional number of decimal places to round values to.
+
+    Raises:
+        ValueError: The increment provided was 0 or too small.
+    """
+
+    __slots__ = ('a', 'b', 'inc', 'ndigits', 'start', 'end', '_len')
+
+    def __init__(self, a, b = 0, inc = 1, ndigits = None):
+        if inc == 0:
+            raise ValueError("Increment cannot be 0.")
+        elif a + inc == a:
+            raise ValueError("Increment is too small.")
+
+        self.a = a
+        self.b = b
+        self.inc = inc
+        self.ndigits = ndigits
+        self.start = min(a,b) if inc > 0 else max(a,b)
+        self.end = max(a,b) if inc > 0 else min(a,b)
+
+        # Estimate the length then correct for floating point error so the
+        # range ends exactly where frange would
+        n = int(math.floor((self.end - self.start) / inc)) + 1
+        while self._in_bounds(n):
+            n += 1
+        while n > 1 and not self._in_bounds(n - 1):
+            n -= 1
+        self._len = n
+
+    def _in_bounds(self, i):
+        """Check if the unrounded i-th value lies between the range bounds."""
+        nextval = self.start + self.inc*i
+        return (self.inc > 0 and nextval <= self.end) or (self.inc < 0 and nextval >= self.end)
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._len))]
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("FRange index out of range")
+        # Like frange, the first value is the start itself, keeping its type
+        val = self.start + self.inc*i if i else self.start
+        return val if self.ndigits is None else round(val, self.ndigits)
+
+    def __iter__(self):
+        start, inc, ndigits = self.start, self.inc, self.ndigits
+        if ndigits is None:
+            yield start
+            for i in range(1, self._len):
+                yield start + inc*i
+        else:
+            yield round(start, ndigits)
+            for i in range(1, self._len):
+                yield round(start + inc*i, ndigits)
+
+    def __contains__(self, value):
+        try:
+            self.index(value)
+        except ValueError:
+            return False
+        return True
+
+    def index(self, value):
+        """Return the position of value in the range.
+
+        Raises:
+            ValueError: The value is not in the range.
+        """
+        if type(value) == float and not math.isfinite(value):
+            raise ValueError("{} is not in range".format(value))
+        if type(value) == int or type(value) == float:
+            try:
+                i = int(round((value - self.start) / self.inc))
+            except OverflowError:
+                # Too far from the start to be in the range
+                raise ValueError("{} is not in range".format(value)) from None
+            for j in (i, i - 1, i + 1):
+                if 0 <= j < self._len and self[j] == value:
+                    return j
+        raise ValueError("{} is not in range".format(value))
+
+    def bounds(self):
+        """Return the smallest and largest values in the range."""
+        return min(self[0], self[-1]), max(self[0], self[-1])
+
+    def __eq__(self, other):
+        if not isinstance(other, FRange):
+            return NotImplemented
+        return (self.start, self.inc, self._len, self.ndigits) == \
+               (other.start, other.inc, other._len, other.ndigits)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "FRange({!r}, {!r}, {!r})".format(self.a, self.b, self.inc)
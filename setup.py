@@ -32,9 +32,14 @@ setup(
     license = "MIT",
     url = "https://github.com/becketta/ctip.git",
     packages = ["ctip"],
+    # Python's sqlite3 module must also be linked against SQLite 3.25 or newer
+    python_requires = ">=3.7",
     install_requires = [
         'pyparsing'
     ],
+    extras_require = {
+        'numpy': ['numpy']
+    },
     entry_points = {
         "console_scripts": ['ctip = ctip.entrypoint:main']
     },
@@ -50,6 +55,12 @@ setup(
         "Operating System :: Microsoft :: Windows",
         "Operating System :: Unix",
         "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
         "Topic :: Scientific/Engineering",
         "Topic :: Software Development :: Testing",
         "Topic :: Utilities"
@@ -19,6 +19,15 @@ pytest_plugins = ['helpers_namespace']
 
 ########### Fixtures ################
 
+@pytest.fixture(autouse=True, scope='session')
+def schema_cache_dir(tmp_path_factory):
+    """Keep schemas read by the tests out of the user's schema cache."""
+    from ctip.cache import SchemaCache, set_default_cache
+    cache = SchemaCache(str(tmp_path_factory.mktemp("schemas")))
+    previous = set_default_cache(cache)
+    yield cache.directory
+    set_default_cache(previous)
+
 
 ########### Helper funcs ##############
 
@@ -276,3 +276,13 @@ class TestLogCommand(object):
         log_function.assert_called_once()
         assert args.job_id == 'ab123'
 
+
+
+##################### DAEMON COMMAND ################################
+
+class TestDaemonCommand(object):
+    def test_daemon(self):
+        with mock.patch('ctip.entrypoint.cmd.run_daemon', side_effect=sentry) as daemon_function:
+            cli.main(['ctip', 'daemon'])
+
+        daemon_function.assert_called_once()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the daemon writing job updates to the ctip database.
+"""
+
+import os
+import shutil
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+
+import pytest
+
+import ctip.entrypoint as cli
+from ctip.daemon import StatusDaemon, send
+from ctip.dbm import DatabaseManager, get_pool
+from ctip.exceptions import DaemonUnreachable
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="requires Unix domain sockets")
+
+
+@pytest.fixture
+def paths(monkeypatch):
+    # Socket paths are limited to about 100 characters
+    directory = tempfile.mkdtemp()
+    dbpath = os.path.join(directory, "ctip.db")
+    monkeypatch.setenv("CTIP_DB", dbpath)
+    monkeypatch.delenv("CTIP_SOCKET", raising=False)
+    monkeypatch.delenv("CTIP_SESSION_ID", raising=False)
+    db = DatabaseManager(dbpath)
+    db.register_jobs(1, range(10))
+    db.register_jobs(2, range(10))
+    yield dbpath, dbpath + ".sock"
+    get_pool(dbpath).close()
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def daemon(paths):
+    server = StatusDaemon(paths[1], paths[0])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def job(dbpath, session_id, job_id):
+    return DatabaseManager(dbpath).conn.execute(
+        "SELECT * FROM jobs WHERE session_id = ? AND job_id = ?", (session_id, job_id)).fetchone()
+
+
+def test_updates(paths, daemon):
+    """Test applying each kind of update through the daemon and reporting errors."""
+    dbpath, path = paths
+    assert send({'command': 'status', 'job_id': '3', 'session_id': 1, 'value': 'running'}, path) is None
+    assert job(dbpath, 1, '3')['status'] == 'running'
+    # Jobs default to the latest session
+    assert send({'command': 'id', 'job_id': '3', 'value': 'pbs.42'}, path) is None
+    assert job(dbpath, 2, 'pbs.42') is not None
+    assert send({'command': 'log', 'job_id': 'pbs.42', 'value': 'start', 'ts': 1500}, path) is None
+    event = DatabaseManager(dbpath).conn.execute("SELECT * FROM job_events").fetchone()
+    assert tuple(event) == (2, 'pbs.42', 'start', 1500)
+
+    assert send({'command': 'status', 'job_id': 'missing', 'value': 'done'}, path) == "No job with id 'missing'"
+    assert send({'command': 'log', 'job_id': '3', 'value': 'stop'}, path).startswith("Invalid update")
+    # Duplicate job ids fail on their own
+    assert "UNIQUE" in send({'command': 'id', 'job_id': '4', 'session_id': 1, 'value': '5'}, path)
+
+
+def test_malformed_updates(paths, daemon):
+    """Test malformed updates are rejected without stopping the writer thread."""
+    dbpath, path = paths
+    bad = {'command': 'log', 'job_id': '3', 'session_id': 1, 'value': 'start', 'ts': 'abc'}
+    assert send(bad, path).startswith("Invalid update")
+    assert send(dict(bad, job_id=3), path).startswith("Invalid update")
+    # Updates that get past the checks don't stop the writer either
+    assert daemon.submit(bad) is not None
+    assert send(dict(bad, ts=1500), path) is None
+    event = DatabaseManager(dbpath).conn.execute("SELECT * FROM job_events").fetchone()
+    assert tuple(event) == (1, '3', 'start', 1500)
+
+
+def test_concurrent_clients(paths, daemon):
+    """Test updates from concurrent clients are applied in shared batches."""
+    dbpath, path = paths
+    errors = []
+
+    def report(job_id):
+        for status in ('running', 'done'):
+            errors.append(send({'command': 'status', 'job_id': str(job_id), 'session_id': 1, 'value': status}, path))
+
+    threads = [threading.Thread(target=report, args=(k,)) for k in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == [None] * 20
+    assert daemon.updates == 20
+    assert daemon.batches <= 20
+    assert DatabaseManager(dbpath).status_counts(1) == {'done': 10}
+
+
+def test_commands_use_daemon(paths, daemon, monkeypatch):
+    """Test the update command sends its update to a running daemon."""
+    dbpath, _ = paths
+    monkeypatch.setenv("CTIP_SESSION_ID", "1")
+    cli.main(['ctip', 'update', 'status', '7', 'failed'])
+    assert daemon.updates == 1
+    assert job(dbpath, 1, '7')['status'] == 'failed'
+    assert job(dbpath, 2, '7')['status'] == 'queued'
+
+
+def test_commands_without_daemon(paths):
+    """Test the update command writes to the database when no daemon is listening."""
+    dbpath, path = paths
+    with pytest.raises(DaemonUnreachable):
+        send({'command': 'status', 'job_id': '1', 'value': 'done'}, path)
+    cli.main(['ctip', 'update', 'status', '1', 'done'])
+    assert job(dbpath, 2, '1')['status'] == 'done'
+    with pytest.raises(SystemExit):
+        cli.main(['ctip', 'update', 'status', 'missing', 'done'])
+
+
+def test_lost_replies(paths, monkeypatch):
+    """Test updates that reached the daemon aren't written again when the reply is lost."""
+    dbpath, path = paths
+    monkeypatch.setenv("CTIP_SESSION_ID", "1")
+    # A daemon that reads updates but never replies
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(5)
+    received = []
+
+    def accept(close):
+        client, _ = server.accept()
+        with client:
+            received.append(client.recv(4096))
+            if not close:
+                client.recv(4096)
+
+    thread = threading.Thread(target=accept, args=(False,))
+    thread.start()
+    with pytest.raises(socket.timeout):
+        send({'command': 'status', 'job_id': '1', 'value': 'done'}, path, timeout=0.1)
+    thread.join()
+
+    # Updates the daemon received aren't written again
+    thread = threading.Thread(target=accept, args=(True,))
+    thread.start()
+    with pytest.raises(SystemExit) as exit:
+        cli.main(['ctip', 'update', 'status', '1', 'done'])
+    thread.join()
+    server.close()
+    assert "may not have been applied" in str(exit.value)
+    assert len(received) == 2
+    assert job(dbpath, 1, '1')['status'] == 'queued'
+
+
+def test_socket_in_use(paths, daemon):
+    """Test a second daemon can't listen on the same socket."""
+    with pytest.raises(RuntimeError):
+        StatusDaemon(paths[1], paths[0])
+
+
+def test_stale_socket(paths):
+    """Test a daemon replaces the socket left behind by one that exited."""
+    dbpath, path = paths
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    server = StatusDaemon(path, dbpath)
+    server.server_close()
+    assert not os.path.exists(path)
+
+
+def test_socket_permissions(paths, monkeypatch):
+    """Test the socket is never accessible to other users, even right after it's bound."""
+    dbpath, path = paths
+    modes = []
+    bind = socketserver.UnixStreamServer.server_bind
+
+    def server_bind(self):
+        bind(self)
+        modes.append(stat.S_IMODE(os.stat(self.server_address).st_mode))
+
+    monkeypatch.setattr(socketserver.UnixStreamServer, "server_bind", server_bind)
+    umask = os.umask(0o022)
+    try:
+        server = StatusDaemon(path, dbpath)
+        server.server_close()
+        # The process umask is left as it was
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(umask)
+    assert modes == [0o600]
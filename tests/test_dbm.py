@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the local SQLite database and its connection pool.
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from ctip import dbm
+from ctip.dbm import DatabaseManager, get_pool
+from ctip.utils import DBConn
+
+
+@pytest.fixture
+def dbpath(tmpdir):
+    path = str(tmpdir.join("data", "ctip.db"))
+    yield path
+    get_pool(path).close()
+
+
+def test_default_path(monkeypatch, tmpdir):
+    """Test the database path defaults to $CTIP_DB, then to the XDG data directory."""
+    monkeypatch.setenv("CTIP_DB", str(tmpdir.join("env.db")))
+    assert dbm.default_db_path() == str(tmpdir.join("env.db"))
+    monkeypatch.delenv("CTIP_DB")
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmpdir))
+    assert dbm.default_db_path() == os.path.join(str(tmpdir), "ctip", "ctip.db")
+
+
+def test_create_database(dbpath):
+    """Test a new database is created with its tables in WAL mode."""
+    db = DatabaseManager(dbpath)
+    assert os.path.exists(dbpath)
+    tables = {row['name'] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert set(db.reserved_table_names) <= tables
+    assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert db.conn.execute("PRAGMA busy_timeout").fetchone()[0] == dbm.DEFAULT_TIMEOUT * 1000
+
+
+def test_shared_connections(dbpath):
+    """Test connections to a database are shared within a thread."""
+    db = DatabaseManager(dbpath)
+    assert DatabaseManager(dbpath).conn is db.conn
+    assert DBConn(dbpath).conn is db.conn
+
+    # Other threads get their own connections
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.conn))
+    thread.start()
+    thread.join()
+    assert other[0] is not db.conn
+
+
+def test_database_imported_on_use():
+    """Test importing ctip.gen doesn't load the database layer."""
+    script = ("import sys\n"
+              "import ctip.gen\n"
+              "print('ctip.dbm' in sys.modules, 'sqlite3' in sys.modules)\n")
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    assert subprocess.check_output([sys.executable, "-c", script], env=env).split() == [b"False", b"False"]
+
+
+def test_old_database(dbpath):
+    """Test databases created by older versions of ctip are upgraded."""
+    os.makedirs(os.path.dirname(dbpath))
+    conn = sqlite3.connect(dbpath)
+    conn.execute("CREATE TABLE sessions(id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("INSERT INTO sessions VALUES (1, 'old')")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(dbpath)
+    db.save_checkpoint(1, "token")
+    assert db.checkpoint(1) == "token"
+    assert db.checkpoint(2) is None
+
+
+def test_concurrent_writers(dbpath):
+    """Test threads writing to the database at once don't fail on locks."""
+    db = DatabaseManager(dbpath)
+    with db.conn:
+        db.conn.execute("INSERT INTO sessions (id, name) VALUES (1, 'test')")
+    errors = []
+
+    def write(worker):
+        try:
+            manager = DatabaseManager(dbpath)
+            for i in range(50):
+                with manager.conn:
+                    manager.conn.execute("INSERT INTO jobs (session_id, job_id, status) VALUES (1, ?, 'queued')",
+                                         ("{}-{}".format(worker, i),))
+        except sqlite3.Error as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(k,)) for k in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert db.conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 8 * 50
+
+
+def test_register_jobs(dbpath):
+    """Test registering jobs in chunks and rebuilding deferred indexes."""
+    db = DatabaseManager(dbpath)
+    db.conn.execute("CREATE INDEX jobs_status ON jobs (status)")
+    configs = ({"x": i} for i in range(25))
+    count, seconds = db.register_jobs(1, configs, chunk_size=10)
+    assert count == 25
+    assert seconds >= 0
+    rows = db.conn.execute("SELECT config_id, job_id, status FROM jobs ORDER BY config_id").fetchall()
+    assert [tuple(row) for row in rows] == [(i, str(i), 'queued') for i in range(25)]
+    assert db.conn.execute("SELECT config FROM jobs WHERE config_id = 3").fetchone()[0] == '{"x":3}'
+
+    # Deferred indexes are rebuilt
+    indexes = db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                              "AND tbl_name = 'jobs' AND sql IS NOT NULL")
+    assert sorted(row['name'] for row in indexes) == ['jobs_job_id', 'jobs_session_runtime', 'jobs_session_status', 'jobs_status']
+
+    # Jobs of a resumed cursor keep their positions
+    assert db.register_jobs(2, [{}] * 3, first_config_id=7, status='held')[0] == 3
+    assert db.conn.execute("SELECT COUNT(*) FROM jobs WHERE session_id = 2 AND config_id >= 7").fetchone()[0] == 3
+
+
+def test_register_jobs_failure(dbpath):
+    """Test a failed registration doesn't leave any of its jobs behind."""
+    db = DatabaseManager(dbpath)
+    db.register_jobs(1, range(5))
+    # A duplicate job rolls back the whole registration
+    with pytest.raises(sqlite3.IntegrityError):
+        db.register_jobs(1, range(20), first_config_id=-10, chunk_size=4, defer_indexes=True)
+    assert db.conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 5
+    assert not db.conn.in_transaction
+    with pytest.raises(ValueError):
+        db.register_jobs(1, range(5), chunk_size=0)
+
+
+def brute_force_counts(db, session_id):
+    rows = db.conn.execute("SELECT status, COUNT(*) FROM jobs WHERE session_id = ? AND status IS NOT NULL "
+                           "GROUP BY status", (session_id,))
+    return {status: count for status, count in rows}
+
+
+def test_status_counts(dbpath):
+    """Test status counts follow inserts, updates, and deletes of jobs."""
+    db = DatabaseManager(dbpath)
+    db.register_jobs(1, range(10))
+    db.register_jobs(2, range(5), status='held')
+    assert db.status_counts(1) == {'queued': 10}
+    assert db.status_counts() == {'queued': 10, 'held': 5}
+
+    conn = db.conn
+    with conn:
+        conn.execute("UPDATE jobs SET status = 'running' WHERE session_id = 1 AND config_id < 4")
+        conn.execute("UPDATE jobs SET status = 'done' WHERE session_id = 1 AND config_id < 2")
+        conn.execute("UPDATE jobs SET status = NULL WHERE session_id = 1 AND config_id = 9")
+        conn.execute("UPDATE jobs SET session_id = 1, job_id = 'moved' WHERE session_id = 2 AND config_id = 0")
+        conn.execute("INSERT INTO jobs (session_id, config_id, job_id, status) VALUES (2, 5, '5', 'queued')")
+        conn.execute("DELETE FROM jobs WHERE session_id = 2 AND config_id = 1")
+    for session_id in (1, 2):
+        assert db.status_counts(session_id) == brute_force_counts(db, session_id)
+    assert db.status_counts(1) == {'done': 2, 'running': 2, 'queued': 5, 'held': 1}
+    assert db.status_counts(3) == {}
+
+    # Checking a session uses the counts rather than the jobs table
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT status, count FROM session_status_counts "
+                        "WHERE session_id = 1 AND count > 0").fetchall()
+    assert not any("jobs" in row[-1] for row in plan)
+
+
+def test_status_counts_of_old_database(dbpath):
+    """Test status counts of a database created by an older version of ctip."""
+    os.makedirs(os.path.dirname(dbpath))
+    conn = sqlite3.connect(dbpath)
+    conn.execute("CREATE TABLE jobs(session_id INT, config_id INT, job_id TEXT, status TEXT, "
+                 "time_log TEXT, runtime TEXT, PRIMARY KEY (session_id, job_id))")
+    conn.executemany("INSERT INTO jobs (session_id, job_id, status) VALUES (?, ?, ?)",
+                     [(1, 'a', 'done'), (1, 'b', 'done'), (1, 'c', None), (2, 'a', 'failed')])
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(dbpath)
+    assert db.status_counts(1) == {'done': 2}
+    assert db.status_counts() == {'done': 2, 'failed': 1}
+    # Text runtimes and time logs are replaced by integer runtimes
+    columns = {row['name']: row['type'] for row in db.conn.execute("PRAGMA table_info(jobs)")}
+    assert columns['runtime'] == 'INT' and 'time_log' not in columns
+
+
+def open_database(dbpath, barrier):
+    barrier.wait()
+    db = DatabaseManager(dbpath)
+    assert db.status_counts(1) == {'done': 2}
+    db.save_checkpoint(1, "token")
+
+
+def test_concurrent_migrations(dbpath):
+    """Test processes opening an old database at the same time migrate it once."""
+    os.makedirs(os.path.dirname(dbpath))
+    conn = sqlite3.connect(dbpath)
+    conn.execute("CREATE TABLE sessions(id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE jobs(session_id INT, config_id INT, job_id TEXT, status TEXT, "
+                 "time_log TEXT, runtime TEXT, PRIMARY KEY (session_id, job_id))")
+    conn.executemany("INSERT INTO jobs (session_id, job_id, status) VALUES (?, ?, ?)",
+                     [(1, 'a', 'done'), (1, 'b', 'done'), (2, 'a', 'failed')])
+    conn.execute("INSERT INTO sessions VALUES (1, 'old')")
+    conn.commit()
+    conn.close()
+
+    # Every process opens the old database at the same time
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(8)
+    processes = [context.Process(target=open_database, args=(dbpath, barrier)) for _ in range(8)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0] * 8
+    db = DatabaseManager(dbpath)
+    assert db.status_counts() == {'done': 2, 'failed': 1}
+    assert db.checkpoint(1) == "token"
+
+
+def test_check_command(dbpath, monkeypatch, capsys):
+    """Test the check command prints the status counts of a session or of every session."""
+    import ctip.entrypoint as cli
+    monkeypatch.setenv("CTIP_DB", dbpath)
+    db = DatabaseManager(dbpath)
+    db.register_jobs(1, range(1200))
+    db.register_jobs(2, range(5), status='done')
+    cli.main(['ctip', 'check', '1'])
+    assert capsys.readouterr().out.split() == ['queued', '1,200', 'total', '1,200']
+    cli.main(['ctip', 'check'])
+    assert capsys.readouterr().out.split() == ['done', '5', 'queued', '1,200', 'total', '1,205']
+
+
+def log(db, job_id, *events, session_id=1):
+    updates = [{'command': 'log', 'job_id': job_id, 'session_id': session_id, 'value': kind, 'ts': ts}
+               for kind, ts in events]
+    with db.conn:
+        return dbm.apply_updates(db.conn, updates)
+
+
+def test_job_events(dbpath):
+    """Test logging timing events and computing runtimes from them."""
+    db = DatabaseManager(dbpath)
+    db.register_jobs(1, range(3))
+    assert log(db, '0', ('start', 100), ('pause', 250), ('resume', 1000), ('end', 1020)) == [None] * 4
+    assert log(db, '1', ('start', 5)) == [None]
+    assert log(db, '9', ('start', 5)) == ["No job with id '9'"]
+    runtimes = dict(db.conn.execute("SELECT job_id, runtime FROM jobs WHERE session_id = 1").fetchall())
+    assert runtimes == {'0': 170, '1': None, '2': None}
+
+    # Events follow their job's new id
+    with db.conn:
+        dbm.apply_updates(db.conn, [{'command': 'id', 'job_id': '0', 'session_id': 1, 'value': 'pbs.1'}])
+    kinds = db.conn.execute("SELECT kind FROM job_events WHERE job_id = 'pbs.1' ORDER BY ts").fetchall()
+    assert [row['kind'] for row in kinds] == ['start', 'pause', 'resume', 'end']
+
+
+def nearest_rank(runtimes, p):
+    runtimes = sorted(runtimes)
+    return runtimes[max(0, -(-p * len(runtimes) // 100) - 1)]
+
+
+def test_runtime_percentiles(dbpath):
+    """Test runtime percentiles per session and grouped by the values of a variable."""
+    from ctip.gen import GenSchema
+    schema = GenSchema()
+    schema.add_values("a", 1, 2, 3)
+    schema.add_values("b", "x", "y")
+    dep = GenSchema()
+    dep.add_values("c", 10, 20, 30)
+    schema.add_dependencies("b", "y", dep)
+    db = DatabaseManager(dbpath)
+    configs = list(schema.configs())
+    sampled = list(schema.sample(5, seed=3))
+    db.register_jobs(1, configs)
+    # Sampled configs aren't numbered by their position in configs()
+    db.register_jobs(2, sampled)
+    runtimes = [(k * 37) % 11 + k for k in range(len(configs))]
+    for k, runtime in enumerate(runtimes):
+        log(db, str(k), ('start', 0), ('end', runtime))
+    for k in range(len(sampled)):
+        log(db, str(k), ('start', 0), ('end', 100 + k), session_id=2)
+
+    percentiles = (0, 50, 95, 100)
+    expected = tuple(nearest_rank(runtimes, p) for p in percentiles)
+    assert db.runtime_percentiles(1, percentiles) == {1: expected}
+    assert db.runtime_percentiles(percentiles=(50,)) == {1: (nearest_rank(runtimes, 50),), 2: (102,)}
+
+    jobs = list(zip(configs, runtimes)) + [(config, 100 + k) for k, config in enumerate(sampled)]
+    for variable in ("a", "b", "c"):
+        for session_id, session_jobs in ((1, jobs[:len(configs)]), (None, jobs)):
+            groups = {}
+            for config, runtime in session_jobs:
+                if variable in config:
+                    groups.setdefault(config[variable], []).append(runtime)
+            expected = {value: tuple(nearest_rank(group, p) for p in percentiles) for value, group in groups.items()}
+            assert db.runtime_percentiles(session_id, percentiles, variable) == expected
+
+    assert db.runtime_percentiles(variable="missing") == {}
+    with pytest.raises(ValueError):
+        db.runtime_percentiles(variable='a"')
+
+
+def test_old_sqlite(dbpath, monkeypatch):
+    """Test connecting fails with SQLite versions older than 3.25."""
+    monkeypatch.setattr(dbm.sql, "sqlite_version_info", (3, 24, 0))
+    with pytest.raises(RuntimeError):
+        dbm.connect(dbpath)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the hand written genfile parser.
+"""
+
+import glob
+import json
+import os
+
+import pytest
+
+from ctip import GenParser
+from ctip.fastparse import parse_genfile, stream_genfile, UnsupportedSyntax
+
+
+genfiles = sorted(glob.glob("tests/resources/*.gen"))
+
+# Supported syntax along with the tree of its expected parse, see tree()
+supported = [
+    ("type = long",
+     {"schema": [{"var": "type", "values": ["long"]}]}),
+    ("name7_with.special-chars = val1, val2",
+     {"schema": [{"var": "name7_with.special-chars", "values": ["val1", "val2"]}]}),
+    ("variable = 'val1', \"#alwaystraining\", 'comma,string' # comment",
+     {"schema": [{"var": "variable", "values": ["val1", "#alwaystraining", "comma,string"]}]}),
+    ("var = '\"a\"', \"'b'\", '', a\"b, .x, a=b, ~!",
+     {"schema": [{"var": "var", "values": ["a", "b", "", 'a"b', ".x", "a=b", "~!"]}]}),
+    ("ints = 0:2, 5 : 11 : 2, -4:0:3, +7, 007",
+     {"schema": [{"var": "ints", "values": [(0, 2), (5, 11, 2), (-4, 0, 3), 7, 7]}]}),
+    ("floats = 1.5e3, -.5:2: 0.5, -1.0e+2, 1.5E-3",
+     {"schema": [{"var": "floats", "values": [1500.0, (-0.5, 2, 0.5), -100.0, 0.0015]}]}),
+    ("a = 1\ny = a b  , 'c,#'  # z\n  z = 2\n      w = 3\n  k = 1\n# done",
+     {"schema": [{"var": "a", "values": [1]},
+                 {"var": "y", "values": ["a b", "c,#"], "deps": [
+                     {"var": "z", "values": [2], "deps": [{"var": "w", "values": [3]}]},
+                     {"var": "k", "values": [1]}]}]}),
+    ("top\n\n   # comment\nx = 1\n    y = 2\n        z = 3\n\nw = 4\n    v = 5",
+     {"name": "top",
+      "schema": [{"var": "x", "values": [1], "deps": [
+                     {"var": "y", "values": [2], "deps": [{"var": "z", "values": [3]}]}]},
+                 {"var": "w", "values": [4], "deps": [{"var": "v", "values": [5]}]}]}),
+]
+
+unsupported = [
+    "",
+    "# only a comment",
+    "name",
+    "x = 1,\n    2",
+    "x = 1\n  y = 2\n z = 3",
+    "    x = 1",
+    "x\ty = 1",
+    "x = a\r\ny = b",
+    "var = '\\'', \"\\\"\"",
+    "x = 'a'b",
+    "x = 1a",
+    "x = 1e5",
+    "x = 1:2:3:4",
+    "x = a,,b",
+    "x = café",
+    "top # comment\nx = 1",
+]
+
+
+def parse_with_grammar(text):
+    """Parse a string with a new pyparsing grammar."""
+    return GenParser._get_parser().parseString(text)
+
+
+def assert_same_results(fast, slow):
+    """Compare the structure, names, and values of two ParseResults."""
+    assert fast.asList() == slow.asList()
+    assert fast.dump() == slow.dump()
+
+
+def tree(results):
+    """Return the names, variables, values, and dependencies of a parse as dicts."""
+    def domain(d):
+        node = {"var": d["var"], "values": d["values"].asList()}
+        if "deps" in d:
+            node["deps"] = [domain(dep) for dep in d["deps"]]
+        return node
+
+    parsed = {"name": results["name"]} if "name" in results else {}
+    parsed["schema"] = [domain(d) for d in results["schema"]]
+    return parsed
+
+
+with open("tests/resources/parsed_genfiles.json") as f:
+    parsed_genfiles = json.load(f)
+
+
+@pytest.mark.parametrize("genfile", genfiles)
+def test_genfiles(genfile):
+    """Test the fast parser against the known parses of the test genfiles."""
+    with open(genfile) as f:
+        result = parse_genfile(f.read())
+    # JSON has no tuples, range values come back as lists
+    assert json.loads(json.dumps(tree(result))) == parsed_genfiles[os.path.basename(genfile)]
+
+
+@pytest.mark.parametrize("text,expected", supported)
+def test_supported_syntax(text, expected):
+    """Test the fast parser on snippets of supported syntax."""
+    assert tree(parse_genfile(text)) == expected
+
+
+@pytest.mark.parametrize("text", unsupported)
+def test_unsupported_syntax(text):
+    """Test the fast parser rejects syntax only the grammar supports."""
+    with pytest.raises(UnsupportedSyntax):
+        parse_genfile(text)
+
+
+@pytest.mark.parametrize("text", unsupported)
+def test_fallback(text):
+    """Test GenParser falls back to the grammar for unsupported syntax."""
+    try:
+        expected = parse_with_grammar(text)
+    except Exception as e:
+        with pytest.raises(type(e)):
+            GenParser.parseString(text)
+    else:
+        assert_same_results(GenParser.parseString(text), expected)
+
+
+def test_stream_order():
+    """Test suites are handed over as soon as they close, dependencies first."""
+    events = []
+    def add_suite(block, var, values, deps):
+        events.append((var, deps))
+        block.append(var)
+    
+    lines = iter("top\na = 1\n    b = 2\n        c = 3\n    d = 4\ne = 5\n".splitlines(True))
+    name, block = stream_genfile(lines, list, add_suite)
+    assert name == "top"
+    assert block == ["a", "e"]
+    assert events == [("c", None), ("b", ["c"]), ("d", None), ("a", ["b", "d"]), ("e", None)]
+
+
+def test_stream_closes_suites_early():
+    """Test a suite closes before the rest of the genfile is read."""
+    closed = []
+    def lines():
+        yield "a = 1\n"
+        yield "    b = 2\n"
+        yield "c = 3\n"
+        assert closed == ["b", "a"]
+        yield "d = 4\n"
+    stream_genfile(lines(), list, lambda block, var, values, deps: closed.append(var))
+    assert closed == ["b", "a", "c", "d"]
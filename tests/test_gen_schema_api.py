@@ -8,9 +8,16 @@ Created on Sun Jul 10 14:32:01 2016
 """
 
 
+import os
+import subprocess
+import sys
+from array import array
+
 import pytest
 
 from ctip import GenSchema
+from ctip.gen import Domain
+from ctip.utils import FRange
 
 
 def test_construction():
@@ -134,3 +141,293 @@ def test_add_dependencies():
     assert isinstance(binding[1], GenSchema)
     assert len(binding[1].schema) == 3
 
+    
+def test_size():
+    """Test counting configs without generating them."""
+    
+    gen = GenSchema()
+    assert gen.size() == 0
+    assert len(gen) == 0
+    
+    gen.add_values("var1", 1, 2, 3)
+    assert gen.size() == 3
+    
+    # Adding values invalidates the cached size
+    gen.add_values("var2", "a", "b")
+    assert gen.size() == 6
+    
+    # Adding dependencies invalidates the cached size
+    dep = GenSchema()
+    dep.add_values("sub1", 1, 2)
+    dep.add_values("sub2", 1, 2, 3)
+    gen.add_dependencies("var1", 2, dep)
+    assert gen.size() == (2 + 6) * 2
+    assert len(gen) == gen.size()
+    
+    # Empty dependencies don't add configs
+    gen.add_dependencies("var2", "a", GenSchema())
+    assert gen.size() == (2 + 6) * 2
+    assert gen.size() == len(list(gen.configs()))
+    
+def test_random_access():
+    """Test decoding configs from indices and vice versa."""
+    
+    gen = GenSchema()
+    with pytest.raises(IndexError): gen.config_at(0)
+    with pytest.raises(ValueError): gen.index_of({})
+    
+    gen.add_values("var1", 1, 2)
+    gen.add_values("var2", "a", "b", "c")
+    dep = GenSchema()
+    dep.add_values("sub", 10, 20)
+    gen.add_dependencies("var2", "b", dep)
+    
+    assert gen.config_at(0) == {"var1": 1, "var2": "a"}
+    assert gen.config_at(3) == {"var1": 2, "var2": "b", "sub": 10}
+    assert gen.config_at(-1) == {"var1": 2, "var2": "c"}
+    with pytest.raises(IndexError): gen.config_at(8)
+    with pytest.raises(IndexError): gen.config_at(-9)
+    
+    assert gen.index_of({"var1": 2, "var2": "b", "sub": 10}) == 3
+    with pytest.raises(ValueError): gen.index_of({"var1": 3, "var2": "a"})
+    with pytest.raises(ValueError): gen.index_of({"var1": 1})
+    with pytest.raises(ValueError): gen.index_of({"var1": 1, "var2": "a", "sub": 10})
+    with pytest.raises(ValueError): gen.index_of({"var1": 1, "var2": "b"})
+
+def test_random_access_with_shadowed_variables():
+    """Test locating configs whose variables are redefined by dependencies."""
+    
+    gen = GenSchema()
+    gen.add_values("x", 1, 2)
+    gen.add_values("y", "a")
+    dep = GenSchema()
+    dep.add_values("y", "b", "c")
+    gen.add_dependencies("x", 1, dep)
+    
+    # The top level y overrides the dependency, so x=1 yields the same config twice
+    assert list(gen.configs()) == [{"x": 1, "y": "a"}] * 2 + [{"x": 2, "y": "a"}]
+    assert gen.index_of({"x": 1, "y": "a"}) == 0
+    assert gen.index_of({"x": 2, "y": "a"}) == 2
+    with pytest.raises(ValueError): gen.index_of({"x": 1, "y": "b"})
+    
+    # Dependencies of later variables override earlier ones
+    gen.add_values("z", 0, 1)
+    other = GenSchema()
+    other.add_values("x", 3)
+    gen.add_dependencies("z", 1, other)
+    configs = list(gen.configs())
+    for i, config in enumerate(configs):
+        assert gen.index_of(config) == configs.index(config)
+        assert gen.config_at(gen.index_of(config)) == config
+    with pytest.raises(ValueError): gen.index_of({"x": 3, "y": "a"})
+
+def test_sample():
+    """Test drawing random configs without generating the config space."""
+
+    gen = GenSchema()
+    with pytest.raises(ValueError): gen.sample(1)
+    with pytest.raises(ValueError): gen.sample(1, replace=True)
+    assert gen.sample(0) == []
+
+    gen.add_values("var1", "x", "y")
+    gen.add_values("var2", *range(5))
+    dep = GenSchema()
+    dep.add_values("sub", *range(9))
+    gen.add_dependencies("var1", "x", dep)
+    configs = list(gen.configs())
+
+    # Without replacement every config is drawn at most once
+    sample = gen.sample(len(configs), seed=7)
+    assert sorted(map(repr, sample)) == sorted(map(repr, configs))
+    with pytest.raises(ValueError): gen.sample(len(configs) + 1)
+    with pytest.raises(ValueError): gen.sample(-1)
+
+    # Samples are reproducible and shards split them into disjoint parts
+    assert gen.sample(20, seed="run") == gen.sample(20, seed="run")
+    shards = [gen.sample(20, seed="run", shard=k, num_shards=3) for k in range(3)]
+    assert sum(shards, []) == gen.sample(20, seed="run")
+    with pytest.raises(ValueError): gen.sample(20, shard=3, num_shards=3)
+
+    # Values are weighted by the number of configs below them
+    sample = gen.sample(10000, seed=1, replace=True)
+    assert 0.88 < sum(c["var1"] == "x" for c in sample) / len(sample) < 0.92
+
+    # Constraints are respected
+    gen.add_exclusion({"var1": "x", "var2": 0})
+    assert all(c["var1"] == "y" or c["var2"] != 0 for c in gen.sample(40, seed=3))
+
+    # Huge config spaces can be sampled too
+    huge = GenSchema()
+    for i in range(8):
+        huge.add_values("var{}".format(i), FRange(1, 10**4))
+    assert huge.size() > sys.maxsize
+    sample = huge.sample(100, seed=0)
+    assert len({huge.index_of(c) for c in sample}) == 100
+
+def test_sample_across_processes():
+    """Test samples don't depend on the process drawing them."""
+
+    script = ("from ctip import GenSchema\n"
+              "gen = GenSchema()\n"
+              "gen.add_values('a', *'abcdefgh')\n"
+              "gen.add_values('b', *range(100))\n"
+              "print(gen.sample(10, seed='seed'))\n")
+    outputs = set()
+    for hash_seed in ("1", "2"):
+        env = dict(os.environ, PYTHONHASHSEED=hash_seed, PYTHONPATH=os.getcwd())
+        outputs.add(subprocess.check_output([sys.executable, "-c", script], env=env))
+    assert len(outputs) == 1
+
+def test_invalid_shards():
+    """Test error detection when requesting a shard of the configs."""
+    
+    gen = GenSchema()
+    gen.add_values("var1", 1, 2)
+    with pytest.raises(ValueError): gen.configs(0, 0)
+    with pytest.raises(ValueError): gen.configs(2, 2)
+    with pytest.raises(ValueError): gen.configs(-1, 2)
+    
+    # Extra shards are empty
+    assert list(gen.configs(0, 3)) == []
+    assert list(gen.configs(2, 3, strided=True)) == []
+    
+def test_add_ranges():
+    """Test adding lazy ranges of values to a variable."""
+    
+    gen = GenSchema()
+    gen.add_values("var1", 5, FRange(1, 3))
+    assert gen.schema["var1"] == [(5,None), (1,None), (2,None), (3,None)]
+    assert gen.size() == 4
+    
+    # Values already in a range aren't added again
+    gen.add_values("var1", 2, 4)
+    assert len(gen.schema["var1"]) == 5
+    
+    # Overlapping ranges only add new values
+    gen.add_values("var1", FRange(0, 10, 2))
+    assert [v for v, _ in gen.schema["var1"]] == [5, 1, 2, 3, 4, 0, 6, 8, 10]
+    
+    # Dependencies can be bound to values in a range
+    gen.add_values("var2", FRange(0, 1000000))
+    dep = GenSchema()
+    dep.add_values("sub", "a", "b")
+    gen.add_dependencies("var2", 500, dep)
+    assert gen.size() == 9 * 1000002
+    assert gen.config_at(9 * 501) == {"var1": 5, "var2": 500, "sub": "b"}
+    
+def test_extend():
+    """Test adding many values and dependencies in one call."""
+    
+    dep1 = GenSchema()
+    dep1.add_values("sub1", 1, 2)
+    dep2 = GenSchema()
+    dep2.add_values("sub2", "x")
+    
+    gen = GenSchema()
+    gen.extend({"var1": [1, 2, 3, 2], "var2": ["a", FRange(1, 4)]},
+               [("var1", 2, dep1), ("var2", 3, dep1), ("var1", 2, dep2)])
+    assert gen.schema["var1"][:2] == [(1,None), (2,gen.schema["var1"][1][1])]
+    assert len(gen.schema["var1"]) == 3
+    assert len(gen.schema["var2"]) == 5
+    assert set(gen.schema["var1"][1][1].schema) == {"sub1", "sub2"}
+    assert gen.size() == (2 + 2) * (4 + 2)
+    
+    # Ordered pairs work as well as dicts
+    gen.extend([("var3", [1])])
+    assert len(gen.schema["var3"]) == 1
+    
+    with pytest.raises(ValueError): gen.extend({}, [("var1", 4, dep1)])
+    with pytest.raises(KeyError): gen.extend({}, [("var4", 1, dep1)])
+    with pytest.raises(TypeError): gen.extend({"var1": [[]]})
+    
+def test_shared_dependencies():
+    """Test identical dependencies are shared and copied on write."""
+    
+    dep = GenSchema()
+    dep.add_values("sub", 1, 2)
+    same = GenSchema()
+    same.add_values("sub", 1, 2)
+    
+    gen = GenSchema()
+    gen.add_values("var1", "a", "b", "c")
+    gen.add_dependencies("var1", "a", dep)
+    gen.add_dependencies("var1", "b", dep)
+    gen.add_dependencies("var1", "c", same)
+    shared = gen.schema["var1"][0][1]
+    assert gen.schema["var1"][1][1] is shared
+    assert gen.schema["var1"][2][1] is shared
+    
+    # Shared dependencies can't be modified directly
+    with pytest.raises(TypeError): shared.add_values("sub", 3)
+    with pytest.raises(TypeError): shared.add_values("other", 3)
+    
+    # Modifying the original dependency doesn't affect bound values
+    dep.add_values("sub", 3)
+    assert len(shared.schema["sub"]) == 2
+    
+    # Binding more dependencies to one value only changes that value
+    extra = GenSchema()
+    extra.add_values("more", "x", "y")
+    gen.add_dependencies("var1", "b", extra)
+    assert gen.schema["var1"][0][1] is shared
+    assert set(gen.schema["var1"][1][1].schema) == {"sub", "more"}
+    assert gen.size() == 2 + 4 + 2
+
+
+def test_shared_dependency_keys(monkeypatch):
+    """Test dependencies are shared by a digest of their values and types."""
+    
+    def bind(*values):
+        dep = GenSchema()
+        dep.add_values("sub", *values)
+        gen = GenSchema()
+        gen.add_values("var", "a")
+        gen.add_dependencies("var", "a", dep)
+        return gen.schema["var"][0][1]
+    
+    floats = [0.25 * k for k in range(1000)]
+    shared = bind(*floats)
+    assert isinstance(shared.schema["sub"].values(), array)
+    assert bind(*floats) is shared
+    assert bind(*floats[:-1]) is not shared
+    # Equal values of different types aren't shared
+    assert bind(1, 2) is not bind(1.0, 2)
+    # Schemas whose digests collide are compared value by value
+    monkeypatch.setattr(Domain, "key", lambda self: (b"", ()))
+    collided = bind(1, 2)
+    assert bind(1, 2) is collided
+    assert bind(3, 4) is not collided
+    assert bind(3, 4).schema["sub"] == [(3, None), (4, None)]
+
+
+def test_compact():
+    """Test compacting a schema stores numeric runs in arrays without changing configs."""
+    
+    gen = GenSchema()
+    gen.add_values("ints", *range(20))
+    gen.add_values("ints", "a", 20, 21)
+    gen.add_values("floats", *(0.5 * k for k in range(20)))
+    gen.add_values("mixed", 1, "b", 2.5)
+    dep = GenSchema()
+    dep.add_values("sub", 1, 2)
+    gen.add_dependencies("ints", 3, dep)
+    before = list(gen.configs())
+    
+    gen.compact()
+    assert isinstance(gen.schema["ints"].segments()[0][1], array)
+    assert isinstance(gen.schema["floats"].values(), array)
+    assert gen.schema["mixed"] == [(1, None), ("b", None), (2.5, None)]
+    assert list(gen.configs()) == before
+    for i, config in enumerate(before):
+        assert gen.config_at(i) == config
+        assert gen.index_of(config) == i
+    
+    # Compacted schemas can still be modified and keep values unique
+    gen.add_values("ints", 5, 22, 23.0)
+    assert gen.schema["ints"].values()[-2:] == [22, 23.0]
+    assert type(gen.schema["ints"].values()[-1]) == float
+    assert len(gen.schema["ints"]) == 25
+    
+    # Schemas use slots instead of per-instance dicts
+    assert not hasattr(gen, '__dict__')
+    assert not hasattr(gen.schema["ints"], '__dict__')
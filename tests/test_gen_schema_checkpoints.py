@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for checkpointing and resuming the configs generated by a gen schema.
+"""
+
+import glob
+import itertools
+
+import pytest
+
+from ctip import GenSchema
+from ctip.utils import FRange, range_digits
+
+genfiles = sorted(glob.glob("tests/resources/*.gen"))
+
+
+def sweep():
+    """Build a schema with dependencies shared by several values."""
+    net = GenSchema()
+    net.add_values("width", 16, 32, 64)
+    net.add_values("activation", "relu", "tanh")
+
+    schema = GenSchema()
+    schema.add_values("lr", FRange(0.1, 0.5, 0.1))
+    schema.add_values("model", "tree", "net", "deep")
+    schema.add_dependencies("model", "net", net)
+    schema.add_dependencies("model", "deep", net)
+    schema.add_values("seed", *range(4))
+    return schema
+
+
+def resumed_configs(schema, cursor, stops):
+    """Generate the configs of a cursor, checkpointing and resuming it after every number of configs in stops."""
+    configs = []
+    for n in stops:
+        configs.extend(itertools.islice(cursor, n))
+        cursor = schema.resume(cursor.checkpoint())
+    return configs + list(cursor)
+
+
+@pytest.mark.parametrize("genfile", genfiles)
+def test_resume_genfiles(genfile):
+    """Test resuming the configs of every test genfile from each position."""
+    schema = GenSchema.read(genfile)
+    expected = list(schema.configs())
+    for stop in range(len(expected) + 1):
+        cursor = schema.cursor()
+        assert list(itertools.islice(cursor, stop)) == expected[:stop]
+        token = cursor.checkpoint()
+        # A schema read again from the same genfile accepts the token
+        assert list(GenSchema.read(genfile, cache=False).resume(token)) == expected[stop:]
+
+
+@pytest.mark.parametrize("strided", [False, True])
+def test_resume_shards(strided):
+    """Test checkpointing and resuming shards several times."""
+    schema = sweep()
+    for shard in range(3):
+        expected = list(schema.configs(shard, 3, strided))
+        cursor = schema.cursor(shard, 3, strided)
+        assert resumed_configs(schema, cursor, [0, 5, 1, 20, 100]) == expected
+
+
+def test_resume_constraints():
+    """Test resuming the configs of a constrained schema."""
+    schema = sweep()
+    schema.add_inequality("width", ">", "seed")
+    schema.add_exclusion({"model": "tree", "seed": 1})
+    expected = list(schema.configs())
+    cursor = schema.cursor()
+    assert resumed_configs(schema, cursor, [7, 0, 13]) == expected
+
+
+def test_finished_cursor():
+    """Test resuming a cursor that has generated all its configs."""
+    schema = sweep()
+    cursor = schema.cursor(1, 4, strided=True)
+    list(cursor)
+    assert cursor.done()
+    assert list(schema.resume(cursor.checkpoint())) == []
+
+
+def test_token():
+    """Test the format and length of checkpoint tokens."""
+    schema = sweep()
+    cursor = schema.cursor(2, 5)
+    next(cursor)
+    token = cursor.checkpoint()
+    assert token.startswith("ctip1:")
+    assert token.endswith(":2/5:c:{}".format(cursor.position))
+    assert len(token) < 64
+
+
+def test_invalid_tokens():
+    """Test malformed tokens and tokens of modified schemas are rejected."""
+    schema = sweep()
+    token = schema.cursor().checkpoint()
+
+    with pytest.raises(ValueError): schema.resume("not a token")
+    with pytest.raises(ValueError): schema.resume(token.replace("ctip1", "ctip9"))
+    with pytest.raises(ValueError): schema.resume(token[:-1] + "x")
+    with pytest.raises(ValueError): schema.resume(token[:-1] + str(schema.size() + 1))
+    with pytest.raises(ValueError): schema.resume(None)
+
+    # Modified schemas don't accept old tokens
+    other = sweep()
+    other.add_values("seed", 4)
+    with pytest.raises(ValueError): other.resume(token)
+    reordered = GenSchema()
+    for variable in reversed(list(schema.schema)):
+        reordered.schema[variable] = schema.schema[variable]
+    with pytest.raises(ValueError): reordered.resume(token)
+    constrained = sweep()
+    constrained.add_exclusion({"seed": 0})
+    with pytest.raises(ValueError): constrained.resume(token)
+
+
+def test_fingerprint_ignores_storage():
+    """Test tokens don't depend on how explicit values are split up or compacted."""
+    schema = GenSchema()
+    schema.add_values("seed", 0, 1, FRange(2, 49), *range(50, 100))
+    schema.add_values("lr", 0.1, 0.2)
+    token = schema.cursor().checkpoint()
+
+    # The same values added in several calls, or compacted
+    split = GenSchema()
+    split.add_values("seed", 0)
+    split.add_values("seed", 1, FRange(2, 49), *range(50, 80))
+    split.add_values("seed", *range(80, 100))
+    split.add_values("lr", 0.1)
+    split.add_values("lr", 0.2)
+    assert split.resume(token).position == 0
+    split.compact()
+    assert split.resume(token).position == 0
+
+    # Ranges are hashed by their parameters rather than their values
+    explicit = GenSchema()
+    explicit.add_values("seed", *range(100))
+    explicit.add_values("lr", 0.1, 0.2)
+    with pytest.raises(ValueError): explicit.resume(token)
+    other = GenSchema()
+    other.add_values("seed", 0, 1, FRange(2, 49), *range(50, 99), 100)
+    other.add_values("lr", 0.1, 0.2)
+    with pytest.raises(ValueError): other.resume(token)
+    other = GenSchema()
+    other.add_values("seed", 0, 1, FRange(2.0, 49.0), *range(50, 100))
+    other.add_values("lr", 0.1, 0.2)
+    with pytest.raises(ValueError): other.resume(token)
+
+
+def above_one(x):
+    return x > 1
+
+
+def test_fingerprint_predicates():
+    """Test tokens of schemas with predicates depend on the predicates' names."""
+    schema = sweep()
+    schema.add_constraint("seed", above_one)
+    assert list(schema.resume(schema.cursor().checkpoint())) == list(schema.configs())
+
+    # Lambdas can't be told apart by name
+    schema = sweep()
+    schema.add_constraint("seed", lambda x: x > 1)
+    with pytest.raises(ValueError): schema.cursor().checkpoint()
+    schema = sweep()
+    schema.add_constraint("seed", lambda x: x > 1, "seed > 1")
+    token = schema.cursor().checkpoint()
+    other = sweep()
+    other.add_constraint("seed", lambda x: x < 1, "seed < 1")
+    with pytest.raises(ValueError): other.resume(token)
+
+
+def test_fingerprint_float_ranges(tmpdir):
+    """Test fingerprinting huge float ranges without generating their values."""
+    # A trillion values, checkpoints only look at the range's parameters
+    genfile = tmpdir.join("huge.gen")
+    genfile.write("lr = 0:1000:0.000000001\nseed = 1, 2\n")
+    schema = GenSchema.read(str(genfile), cache=False)
+    cursor = schema.cursor()
+    next(cursor)
+    token = cursor.checkpoint()
+    resumed = GenSchema.read(str(genfile), cache=False).resume(token)
+    assert resumed.position == 1
+    assert next(resumed) == {"lr": 1e-09, "seed": 1}
+
+    # Float ranges hash the same as equal ranges, but not as their explicit values
+    for a, b, inc, ndigits in ((0.1, 2, 0.3, range_digits(0.1, 2, 0.3)), (0.1, 2, 0.1, None)):
+        schema = GenSchema()
+        schema.add_values("lr", FRange(a, b, inc, ndigits))
+        token = schema.cursor().checkpoint()
+        other = GenSchema()
+        other.add_values("lr", FRange(a, b, inc, ndigits))
+        other.compact()
+        assert other.resume(token).position == 0
+        other = GenSchema()
+        other.add_values("lr", *FRange(a, b, inc, ndigits))
+        with pytest.raises(ValueError): other.resume(token)
+
+    # Different float ranges hash differently
+    a = GenSchema()
+    a.add_values("lr", FRange(0.0, 1000.0, 0.5))
+    b = GenSchema()
+    b.add_values("lr", FRange(0.0, 1000.5, 0.5))
+    with pytest.raises(ValueError): b.resume(a.cursor().checkpoint())
+    b = GenSchema()
+    b.add_values("lr", *FRange(0.0, 1000.0, 0.5)[:-1], 1000.5)
+    with pytest.raises(ValueError): b.resume(a.cursor().checkpoint())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Test exporting the configs of a GenSchema as NumPy column arrays.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from ctip import GenSchema
+from test_gen_schema_reading_and_writing import gather_test_files
+
+np = pytest.importorskip("numpy")
+
+
+def batch_configs(batch):
+    """Rebuild the config dicts stored in a ColumnBatch."""
+    configs = [{} for _ in range(len(batch))]
+    for variable, column in batch.columns.items():
+        present = batch.present.get(variable)
+        categories = batch.categories.get(variable)
+        for i, config in enumerate(configs):
+            if present is not None and not present[i]:
+                continue
+            value = column[i].item()
+            config[variable] = categories[value] if categories is not None else value
+    return configs
+
+
+@pytest.mark.parametrize("genfile,config_file", gather_test_files())
+@pytest.mark.parametrize("batch_size", [1, 3, 1000])
+def test_to_columns(genfile, config_file, batch_size):
+    """Test column export with all examples in test/resources."""
+    schema = GenSchema.read(genfile)
+
+    configs = []
+    for batch in schema.to_columns(batch_size):
+        assert len(batch) <= batch_size
+        assert list(batch.index) == list(range(len(configs), len(configs) + len(batch)))
+        configs.extend(batch_configs(batch))
+    assert configs == list(schema.configs())
+
+def test_column_types():
+    """Test the array types chosen for each kind of variable."""
+    schema = GenSchema()
+    schema.add_values("ints", 1, 2)
+    schema.add_values("floats", 1, 2.5)
+    schema.add_values("strs", "a", "b", 3)
+    dep = GenSchema()
+    dep.add_values("nested", 0.1)
+    schema.add_dependencies("strs", "b", dep)
+
+    batch = next(schema.to_columns())
+    assert batch.columns["ints"].dtype == np.int64
+    assert batch.columns["floats"].dtype == np.float64
+    assert batch.columns["strs"].dtype == np.int32
+    assert batch.categories["strs"] == ["a", "b", 3]
+    assert set(batch.present) == {"nested"}
+    assert list(batch.present["nested"]) == [c["strs"] == "b" for c in schema.configs()]
+    assert np.isnan(batch.columns["nested"][~batch.present["nested"]]).all()
+
+    with pytest.raises(ValueError):
+        next(schema.to_columns(0))
+
+def test_write_columns(tmpdir):
+    """Test writing column batches to .npz files."""
+    schema = GenSchema.read("tests/resources/genfile8_multiple_nests.gen")
+    prefix = str(tmpdir.join("configs"))
+
+    filenames = schema.write_columns(prefix, batch_size=5)
+    assert len(filenames) == 4
+
+    data = np.load(filenames[-1])
+    assert list(data["index"]) == [15]
+    assert "values/name" in data.files
+    assert "categories/name" in data.files
+
+    # Variables don't need to be named by strings
+    schema = GenSchema()
+    schema.add_values(1, "a", "b")
+    schema.add_values(2, 0.5)
+    filename = str(tmpdir.join("numbered.npz"))
+    next(schema.to_columns()).save(filename)
+    data = np.load(filename)
+    assert list(data["values/1"]) == [0, 1]
+    assert list(data["categories/1"]) == ["a", "b"]
+    assert list(data["values/2"]) == [0.5, 0.5]
+
+def test_numpy_imported_on_use():
+    """Test importing ctip.gen doesn't import NumPy until columns are exported."""
+    script = ("import sys\n"
+              "import ctip.gen\n"
+              "print('numpy' in sys.modules)\n"
+              "next(ctip.gen.GenSchema.read('tests/resources/genfile3_multiple_vars.gen').to_columns())\n"
+              "print('numpy' in sys.modules)\n")
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    assert subprocess.check_output([sys.executable, "-c", script], env=env).split() == [b"False", b"True"]
@@ -158,5 +158,26 @@ def test_multi_nested():
     schema.add_dependencies("decoder", "Hypercube", gates)
 
     pytest.helpers.compare_configs(configs, schema)
+    
+
+def test_shadowed_variable():
+    """Test nested variables sharing a name with a later variable keep generation order."""
+    
+    schema = GenSchema()
+    schema.add_values("b", 1, 2)
+    schema.add_values("a", "p", "q")
+    dep = GenSchema()
+    dep.add_values("b", 10, 20)
+    schema.add_dependencies("a", "p", dep)
+    
+    configs = list(schema.configs())
+    assert configs == [
+        {"b": 10, "a": "p"},
+        {"b": 10, "a": "p"},
+        {"b": 20, "a": "p"},
+        {"b": 20, "a": "p"},
+        {"b": 1, "a": "q"},
+        {"b": 2, "a": "q"}
+    ]
+    assert configs == [schema.config_at(i) for i in range(schema.size())]
 
-    
\ No newline at end of file
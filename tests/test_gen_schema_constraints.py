@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for constraints pruning the configs generated by a gen schema.
+"""
+
+import pytest
+
+from ctip import GenSchema
+from ctip.utils import FRange
+
+
+def nested_schema():
+    """Build a schema with dependencies, shared blocks, and shadowed variables."""
+    inner = GenSchema()
+    inner.add_values("depth", 1, 2, 3)
+    inner.add_values("lr", 0.1, 0.01)
+
+    shadow = GenSchema()
+    shadow.add_values("lr", 0.5, 0.05)
+    shadow.add_values("width", 4, 8)
+
+    schema = GenSchema()
+    schema.add_values("lr", 0.1, 0.5, 1.0)
+    schema.add_values("model", "tree", "net", "linear")
+    schema.add_dependencies("model", "tree", inner)
+    schema.add_dependencies("model", "net", shadow, inner)
+    schema.add_values("seed", FRange(0, 4))
+    schema.add_values("width", 2, 4, 16)
+    return schema
+
+
+def allowed(schema, config):
+    """Check a config against the schema's constraints by brute force."""
+    return all(c.check(config) for c in schema.constraints
+               if all(v in config for v in c.variables))
+
+
+def check_constrained(schema):
+    """Compare a constrained schema against filtering the unconstrained configs."""
+    unconstrained = GenSchema()
+    unconstrained.schema = schema.schema
+    expected = [c for c in unconstrained.configs() if allowed(schema, c)]
+    assert schema.size() == len(expected)
+    assert list(schema.configs()) == expected
+    for i, config in enumerate(expected):
+        assert schema.config_at(i) == config
+        # Configs with shadowed variables can't always be located
+        try:
+            unconstrained.index_of(config)
+        except ValueError:
+            with pytest.raises(ValueError):
+                schema.index_of(config)
+        else:
+            assert schema.config_at(schema.index_of(config)) == config
+    return expected
+
+
+def test_exclusion():
+    """Test excluding a combination of values, including a nested variable."""
+    schema = nested_schema()
+    schema.add_exclusion({"model": "linear", "width": 16})
+    expected = check_constrained(schema)
+    assert expected
+    assert not any(c["model"] == "linear" and c["width"] == 16 for c in expected)
+
+
+def test_inequality():
+    """Test an inequality between two numeric variables."""
+    schema = GenSchema()
+    schema.add_values("low", *range(10))
+    schema.add_values("high", *range(10))
+    schema.add_inequality("low", "<", "high")
+    assert schema.size() == 45
+    check_constrained(schema)
+
+
+def test_inequality_ignores_strings():
+    """Test inequalities never skip configs holding non-numeric values."""
+    schema = GenSchema()
+    schema.add_values("a", 1, 2, "auto")
+    schema.add_values("b", 1, 2)
+    schema.add_inequality("a", ">=", "b")
+    assert schema.size() == 5
+    check_constrained(schema)
+
+
+def test_predicate_over_nested_variables():
+    """Test a predicate over variables defined by dependencies."""
+    schema = nested_schema()
+    schema.add_constraint(["depth", "width", "seed"], lambda d, w, s: d * w + s < 20)
+    check_constrained(schema)
+
+
+def test_shadowed_variables():
+    """Test constraints see the value a config holds for a shadowed variable."""
+    schema = nested_schema()
+    schema.add_inequality("lr", "<", "width")
+    schema.add_exclusion({"lr": 0.05, "depth": 2})
+    schema.add_constraint("lr", lambda lr: lr != 0.01)
+    check_constrained(schema)
+
+
+def test_missing_variables_satisfy_constraints():
+    """Test constraints don't skip configs missing one of their variables."""
+    schema = nested_schema()
+    schema.add_constraint(["depth"], lambda depth: False)
+    expected = check_constrained(schema)
+    assert expected
+    assert all(c["model"] == "linear" for c in expected)
+
+
+def test_excluding_everything():
+    """Test a schema whose constraints skip every config."""
+    schema = nested_schema()
+    schema.add_constraint("seed", lambda seed: seed > 10)
+    assert schema.size() == 0
+    assert list(schema.configs()) == []
+    with pytest.raises(IndexError):
+        schema.config_at(0)
+
+
+def test_index_of_excluded_config():
+    """Test index_of() rejects configs skipped by a constraint."""
+    schema = nested_schema()
+    schema.add_exclusion({"model": "linear"})
+    config = {"lr": 0.1, "model": "linear", "seed": 0, "width": 2}
+    with pytest.raises(ValueError):
+        schema.index_of(config)
+
+
+def test_shards():
+    """Test shards of a constrained schema split its configs."""
+    schema = nested_schema()
+    schema.add_inequality("depth", "<", "width")
+    schema.add_exclusion({"seed": 2, "lr": 0.1})
+    expected = check_constrained(schema)
+    for strided in (False, True):
+        shards = [list(schema.configs(shard, 7, strided)) for shard in range(7)]
+        assert sorted(map(repr, sum(shards, []))) == sorted(map(repr, expected))
+        if not strided:
+            assert sum(shards, []) == expected
+
+
+def test_config_changes():
+    """Test config_changes() of a constrained schema build the same configs as configs()."""
+    schema = nested_schema()
+    schema.add_inequality("depth", "<", "seed")
+    config = {}
+    for expected, (changes, changed) in zip(schema.configs(), schema.config_changes()):
+        for key in changed:
+            if key in changes:
+                config[key] = changes[key]
+            else:
+                del config[key]
+        assert config == expected
+
+
+def test_columns():
+    """Test column batches of a constrained schema only hold the remaining configs."""
+    pytest.importorskip("numpy")
+    schema = nested_schema()
+    schema.add_exclusion({"model": "net", "seed": 1})
+    index = []
+    widths = []
+    for batch in schema.to_columns(batch_size=7):
+        assert len(batch) <= 7
+        index.extend(batch.index.tolist())
+        widths.extend(batch.columns["width"].tolist())
+    assert index == list(range(schema.size()))
+    assert widths == [c["width"] for c in schema.configs()]
+
+
+def test_constraints_reset_cache():
+    """Test sizes are recounted when a constrained schema is modified."""
+    schema = nested_schema()
+    size = schema.size()
+    schema.add_exclusion({"width": 16})
+    assert schema.size() == size * 2 // 3
+    schema.add_values("width", 32)
+    check_constrained(schema)
+
+
+def test_invalid_constraints():
+    """Test error detection when adding constraints."""
+    schema = nested_schema()
+    with pytest.raises(ValueError):
+        schema.add_inequality("lr", "=<", "width")
+    with pytest.raises(ValueError):
+        schema.add_inequality("lr", "<", "lr")
+    with pytest.raises(ValueError):
+        schema.add_exclusion({})
+    with pytest.raises(TypeError):
+        schema.add_constraint([], lambda: True)
+    with pytest.raises(TypeError):
+        schema.add_constraint("lr", "lr > 0")
+
+
+def test_dependencies_cannot_have_constraints():
+    """Test constrained schemas can't be bound as dependencies."""
+    dep = GenSchema()
+    dep.add_values("x", 1, 2)
+    dep.add_exclusion({"x": 1})
+    schema = GenSchema()
+    schema.add_values("a", "b")
+    with pytest.raises(ValueError):
+        schema.add_dependencies("a", "b", dep)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for space-filling designs over a gen schema's numeric variables.
+"""
+
+import pytest
+
+from ctip import GenSchema
+from ctip.utils import FRange
+
+np = pytest.importorskip("numpy")
+
+from ctip.designs import halton_points, sobol_directions, sobol_points
+
+
+def sweep():
+    """Build a schema with numeric ranges and categorical variables with dependencies."""
+    schema = GenSchema()
+    schema.add_values("lr", FRange(0.01, 0.64, 0.01))
+    schema.add_values("depth", *range(1, 65))
+    schema.add_values("dropout", FRange(0, 0.63, 0.01))
+    schema.add_values("model", "tree", "net")
+    net = GenSchema()
+    net.add_values("activation", "relu", "tanh")
+    schema.add_dependencies("model", "net", net)
+    return schema
+
+
+@pytest.mark.parametrize("method", ["lhs", "sobol"])
+def test_values_are_covered_evenly(method):
+    """Test every value is used once when there are as many points as values."""
+    schema = sweep()
+    configs = list(schema.design(64, method, seed=3, categorical='sample'))
+    assert len(configs) == 64
+    for variable in ("lr", "depth", "dropout"):
+        assert sorted(c[variable] for c in configs) == list(schema.schema[variable].values())
+
+
+def test_cross_categorical():
+    """Test every design point is crossed with each categorical config by default."""
+    schema = sweep()
+    configs = list(schema.design(10, 'halton'))
+    assert len(configs) == 10 * 3
+    for config in configs:
+        assert schema.config_at(schema.index_of(config)) == config
+    # Each point is crossed with every categorical config
+    points = {(c["lr"], c["depth"], c["dropout"]) for c in configs}
+    assert len(points) == 10
+
+
+def test_cross_categorical_once(monkeypatch):
+    """Test the categorical configs are generated once rather than once per point."""
+    schema = sweep()
+    expected = list(schema.design(50, 'sobol', batch_size=8))
+    calls = []
+    configs = GenSchema.configs
+    monkeypatch.setattr(GenSchema, "configs", lambda self, *args: calls.append(self) or configs(self, *args))
+    assert list(schema.design(50, 'sobol', batch_size=8)) == expected
+    assert len(calls) == 1
+
+
+def test_sample_categorical():
+    """Test categorical configs are sampled in proportion to their share of the schema."""
+    schema = sweep()
+    configs = list(schema.design(300, 'lhs', seed=0, categorical='sample'))
+    assert len(configs) == 300
+    models = [c["model"] for c in configs]
+    assert models.count("net") == 200
+    assert all(("activation" in c) == (c["model"] == "net") for c in configs)
+
+
+@pytest.mark.parametrize("method", ["lhs", "sobol", "halton"])
+def test_reproducible(method):
+    """Test designs are reproducible from a seed regardless of the batch size."""
+    schema = sweep()
+    first = list(schema.design(100, method, seed=42, batch_size=7))
+    assert first == list(schema.design(100, method, seed=42))
+    assert first != list(schema.design(100, method, seed=43))
+
+
+def test_deterministic_sequences():
+    """Test Sobol and Halton designs are the same without a seed."""
+    schema = sweep()
+    assert list(schema.design(20, 'sobol')) == list(schema.design(20, 'sobol'))
+    assert list(schema.design(20, 'halton')) == list(schema.design(20, 'halton'))
+
+
+def test_design_variables():
+    """Test restricting the design to some of the numeric variables."""
+    schema = sweep()
+    configs = list(schema.design(8, 'sobol', variables=["lr"]))
+    assert len(configs) == 8 * schema.size() // 64
+    assert len({c["lr"] for c in configs}) == 8
+
+
+def test_constraints():
+    """Test design configs skipped by constraints aren't generated."""
+    schema = sweep()
+    schema.add_inequality("lr", "<", "dropout")
+    configs = list(schema.design(64, 'lhs', seed=1))
+    assert configs
+    assert len(configs) < 64 * 3
+    assert all(c["lr"] < c["dropout"] for c in configs)
+
+
+def test_sequences():
+    """Test the unit sequences against known points."""
+    points = sobol_points(np.arange(4, dtype=np.uint64), sobol_directions(3))
+    assert points.tolist() == [[0, 0, 0], [0.5, 0.5, 0.5], [0.25, 0.75, 0.75], [0.75, 0.25, 0.25]]
+    points = halton_points(np.arange(4), 2)
+    assert np.allclose(points, [[0, 0], [1/2, 1/3], [1/4, 2/3], [3/4, 1/9]])
+
+
+def test_invalid_designs():
+    """Test error detection when building designs."""
+    schema = sweep()
+    with pytest.raises(ValueError): schema.design(10, 'grid')
+    with pytest.raises(ValueError): schema.design(10, categorical='all')
+    with pytest.raises(ValueError): schema.design(-1)
+    with pytest.raises(ValueError): schema.design(10, variables=["missing"])
+    with pytest.raises(ValueError): schema.design(10, variables=["model"])
+    with pytest.raises(ValueError): schema.design(10, batch_size=0)
+
+    categorical = GenSchema()
+    categorical.add_values("model", "tree", "net")
+    with pytest.raises(ValueError): categorical.design(10)
+
+    wide = GenSchema()
+    for i in range(33):
+        wide.add_values("x{}".format(i), 1, 2)
+    with pytest.raises(ValueError): wide.design(10, 'sobol')
+    assert len(list(wide.design(10, 'halton'))) == 10
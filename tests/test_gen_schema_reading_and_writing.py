@@ -13,6 +13,7 @@ import json
 import os
 
 from ctip import GenSchema
+from ctip.utils import FRange
 
 
 def gather_test_files():
@@ -53,3 +54,144 @@ def test_gen_schema_write(genfile, config_file, tmpdir):
     pytest.helpers.compare_configs(configs, schema)
 
 
+@pytest.mark.parametrize("genfile,config_file", gather_test_files())
+def test_gen_schema_size(genfile, config_file):
+    """Test the GenSchema size method with all examples in test/resources."""
+    schema = GenSchema.read(genfile)
+    configs = json.load(open(config_file))
+
+    assert schema.size() == len(configs)
+    assert len(schema) == len(configs)
+
+
+@pytest.mark.parametrize("genfile,config_file", gather_test_files())
+def test_gen_schema_random_access(genfile, config_file):
+    """Test config_at and index_of with all examples in test/resources."""
+    schema = GenSchema.read(genfile)
+
+    for i, config in enumerate(schema.configs()):
+        assert schema.config_at(i) == config
+        assert schema.index_of(config) == i
+
+
+@pytest.mark.parametrize("genfile,config_file", gather_test_files())
+@pytest.mark.parametrize("num_shards", [1, 2, 3, 7])
+def test_gen_schema_sharding(genfile, config_file, num_shards):
+    """Test sharded config generation with all examples in test/resources."""
+    schema = GenSchema.read(genfile)
+    configs = list(schema.configs())
+
+    contiguous = []
+    for shard in range(num_shards):
+        contiguous.extend(schema.configs(shard, num_shards))
+    assert contiguous == configs
+
+    for shard in range(num_shards):
+        strided = list(schema.configs(shard, num_shards, strided=True))
+        assert strided == configs[shard::num_shards]
+
+
+@pytest.mark.parametrize("genfile,config_file", gather_test_files())
+def test_gen_schema_config_changes(genfile, config_file):
+    """Test incremental config generation with all examples in test/resources."""
+    schema = GenSchema.read(genfile)
+
+    previous = {}
+    configs = []
+    for config, changed in schema.config_changes():
+        for key in set(config) | set(previous):
+            if previous.get(key) != config.get(key):
+                assert key in changed
+        previous = dict(config)
+        configs.append(previous)
+    assert configs == list(schema.configs())
+
+
+def test_lazy_ranges(tmpdir):
+    """Test genfile ranges are kept as lazy FRange objects when read and written."""
+    genfile = tmpdir.join("lazy.gen")
+    genfile.write("lr = 0:1:0.000001\nopt = adam, sgd\n")
+
+    schema = GenSchema.read(str(genfile))
+    assert schema.size() == 2 * 1000001
+    assert [type(seg) for _, seg in schema.schema["lr"].segments()] == [FRange]
+    assert schema.config_at(500000) == {"lr": 0.5, "opt": "adam"}
+    assert schema.index_of({"lr": 0.000002, "opt": "sgd"}) == 1000001 + 2
+
+    schema.write(str(genfile))
+    assert "lr = 0:1:1.0e-06" in genfile.read()
+    assert GenSchema.read(str(genfile)).config_at(-1) == {"lr": 1, "opt": "sgd"}
+
+
+def test_range_with_dependencies(tmpdir):
+    """Test binding dependencies to every value of a range."""
+    genfile = tmpdir.join("deps.gen")
+    genfile.write("x = 1:3, 7\n    y = a, b\n")
+
+    schema = GenSchema.read(str(genfile))
+    assert [c["x"] for c in schema.configs()] == [7, 7, 1, 1, 2, 2, 3, 3]
+
+    schema.write(str(genfile))
+    assert list(GenSchema.read(str(genfile)).configs()) == list(schema.configs())
+
+
+def test_read_shares_dependencies(tmpdir):
+    """Test identical nested blocks are only stored once."""
+    genfile = tmpdir.join("shared.gen")
+    genfile.write("x = a, b, c\n    y = 1, 2\nz = q\n    y = 1, 2\n")
+    schema = GenSchema.read(str(genfile))
+
+    deps = [dep for _, dep in schema.schema["x"]] + [dep for _, dep in schema.schema["z"]]
+    assert len(deps) == 4
+    assert all(dep is deps[0] for dep in deps)
+    assert schema.size() == 6 * 2
+
+
+
+
+def test_read_unsupported_syntax(tmpdir):
+    """Test genfiles the streaming reader can't handle are read with the grammar."""
+    genfile = tmpdir.join("escaped.gen")
+    genfile.write("escaped\nx = 'it\\'s', b\n\ty = 1, 2\n")
+    schema = GenSchema.read(str(genfile), cache=False)
+    assert schema.name == "escaped"
+    assert schema.schema["x"].values() == ["it's", "b"]
+    assert schema.size() == 2 * 2
+
+
+def test_write_collapses_runs(tmpdir):
+    """Test runs of numbers are written as ranges without changing the values."""
+    schema = GenSchema()
+    schema.add_values("var", "a", 1, 5, 6, 7, 8, "b", 0.5, 1.5, 2.5, 3.5, 4.5, 0.1, 0.2, 0.30000000000000004)
+    schema.add_values("big", *range(0, 30000, 3))
+    schema.add_values("down", *(10 - 0.25 * k for k in range(20)))
+    assert str(schema).split("\n") == [
+        "big = 0:29997:3",
+        "down = 10.0:5.25:-0.25",
+        "var = a,1,5:8:1",
+        "var = b,0.5:4.5:1.0",
+        "var = 0.1,0.2,0.30000000000000004",
+    ]
+
+    genfile = str(tmpdir.join("runs.gen"))
+    schema.write(genfile)
+    read = GenSchema.read(genfile, cache=False)
+    for var in schema.schema:
+        values = list(read.schema[var].values())
+        assert values == list(schema.schema[var].values())
+        assert [type(v) for v in values] == [type(v) for v in schema.schema[var].values()]
+    assert read.size() == schema.size()
+
+
+def test_write_streams_lines(tmpdir):
+    """Test schemas are written line by line to files and file objects."""
+    schema = GenSchema.read("tests/resources/genfile9_multi_nested.gen")
+    lines = schema.lines()
+    assert next(lines) == "p3"
+    assert next(lines) == "decoder = Hypercube"
+    assert next(lines) == "    gates = 12"
+
+    f = tmpdir.join("stream.gen")
+    with f.open("w") as out:
+        schema.write(out)
+    assert f.read() == str(schema) + "\n"
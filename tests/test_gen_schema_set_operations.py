@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for union, intersection, and difference of gen schemas.
+"""
+
+import pytest
+
+from ctip import GenSchema, GenUnion
+from ctip.utils import FRange, range_digits
+
+
+def key(config):
+    return tuple(sorted(config.items()))
+
+
+def config_set(schema):
+    """Return the configs of a schema or union as a set, checking for duplicates."""
+    configs = [key(c) for c in schema.configs()]
+    assert len(configs) == len(set(configs)) == schema.size()
+    return set(configs)
+
+
+def check_operations(a, b):
+    """Compare every set operation on two schemas against sets of their configs."""
+    ca, cb = config_set(a), config_set(b)
+    assert config_set(a.difference(b)) == ca - cb
+    assert config_set(a.intersection(b)) == ca & cb
+    assert config_set(a.union(b)) == ca | cb
+
+
+def sweep(models=("tree", "net"), depths=(1, 2, 3), widths=(16, 32)):
+    """Build a schema with dependencies shared by several values."""
+    tree = GenSchema()
+    tree.add_values("depth", *depths)
+
+    net = GenSchema()
+    net.add_values("width", *widths)
+    net.add_values("activation", "relu", "tanh")
+
+    schema = GenSchema()
+    schema.add_values("lr", 0.1, 0.01)
+    schema.add_values("model", *models)
+    if "tree" in models:
+        schema.add_dependencies("model", "tree", tree)
+    if "net" in models:
+        schema.add_dependencies("model", "net", net)
+    schema.add_values("seed", FRange(0, 9))
+    return schema
+
+
+def test_added_values():
+    """Test the difference of a schema with values added to one of its variables."""
+    old = sweep()
+    new = sweep()
+    new.add_values("seed", 10, 11)
+
+    delta = new.difference(old)
+    assert isinstance(delta, GenUnion)
+    assert delta.size() == new.size() - old.size()
+    assert {c["seed"] for c in delta.configs()} == {10, 11}
+    assert old.difference(new).size() == 0
+    check_operations(new, old)
+    check_operations(old, new)
+
+
+def test_nested_changes():
+    """Test set operations on schemas whose dependencies changed."""
+    old = sweep()
+    new = sweep(models=("tree", "net", "linear"), depths=(2, 3, 4), widths=(32, 64))
+    check_operations(new, old)
+    check_operations(old, new)
+
+
+def test_ranges():
+    """Test set operations on overlapping ranges without materialising them."""
+    a = GenSchema()
+    a.add_values("x", FRange(0, 99), 200)
+    b = GenSchema()
+    b.add_values("x", FRange(0, 99))
+    b.add_values("y", 1)
+    c = GenSchema()
+    c.add_values("x", FRange(50, 149, 1))
+    assert a.difference(b).size() == a.size()
+    assert [conf["x"] for conf in a.difference(c).configs()] == list(range(50)) + [200]
+    check_operations(a, c)
+
+
+
+def frange(a, b, inc):
+    """Build an FRange rounded the way genfile ranges are."""
+    return FRange(a, b, inc, ndigits=range_digits(a, b, inc))
+
+
+def test_overlapping_ranges():
+    """Test set operations on ranges split by aligned ranges, misaligned ranges, and explicit values."""
+    a = GenSchema()
+    a.add_values("x", frange(0, 3, 0.1), 7)
+    a.add_values("y", FRange(0, 40, 2), frange(100, 99, -0.25))
+    for values in ([frange(1, 5, 0.1)], [frange(0.55, 2, 0.1), 0.2, 2.5],
+                   [frange(0.5, 1.5, 0.1), frange(2, 2.6, 0.2), 0, 7]):
+        b = GenSchema()
+        b.add_values("x", *values)
+        b.add_values("y", FRange(10, 100, 2), 3, frange(99.5, 80, -0.25))
+        dep = GenSchema()
+        dep.add_values("z", 1)
+        b.add_dependencies("y", 20, dep)
+        check_operations(a, b)
+        check_operations(b, a)
+
+
+def test_large_ranges(monkeypatch):
+    """Test set operations on ranges of a million values don't generate their values."""
+    a = GenSchema()
+    a.add_values("x", frange(0, 1, 1e-6))
+    a.add_values("n", FRange(0, 10**6 - 1))
+    b = GenSchema()
+    b.add_values("x", frange(0.5, 1.5, 1e-6), 0.25)
+    b.add_values("n", FRange(500000, 2 * 10**6), 7)
+
+    def fail(self):
+        raise AssertionError("range values were generated")
+
+    monkeypatch.setattr(FRange, "__iter__", fail)
+    both = a.intersection(b)
+    only = a.difference(b)
+    monkeypatch.undo()
+
+    assert both.size() == 500002 * 500001
+    assert only.size() == a.size() - both.size()
+    assert {p.schema["x"].values()[0] for p in both.pieces} <= {0.25, 0.5}
+    config = only.config_at(0)
+    assert config == {"x": 0, "n": 0}
+    assert b.index_of(both.config_at(-1)) is not None
+    with pytest.raises(ValueError): b.index_of(only.config_at(-1))
+
+def test_variable_moved_into_dependencies():
+    """Test set operations on schemas holding a variable at different levels."""
+    flat = GenSchema()
+    flat.add_values("model", "tree", "net")
+    flat.add_values("depth", 1, 2)
+
+    nested = GenSchema()
+    nested.add_values("model", "tree", "net")
+    tree = GenSchema()
+    tree.add_values("depth", 1, 2, 3)
+    nested.add_dependencies("model", "tree", tree)
+
+    check_operations(flat, nested)
+    check_operations(nested, flat)
+
+
+def test_identical_and_empty_schemas():
+    """Test set operations on identical and empty schemas."""
+    schema = sweep()
+    assert schema.difference(schema).size() == 0
+    assert config_set(schema.intersection(schema)) == config_set(schema)
+    assert config_set(schema.union(sweep())) == config_set(schema)
+
+    empty = GenSchema()
+    assert config_set(schema.difference(empty)) == config_set(schema)
+    assert empty.difference(schema).size() == 0
+    assert schema.intersection(empty).size() == 0
+
+
+def test_chained_operations():
+    """Test set operations on the unions they return."""
+    first = sweep(depths=(1,))
+    second = sweep(depths=(2,))
+    third = sweep(depths=(1, 2, 3))
+    done = first.union(second)
+    assert done.size() == first.size() + second.size() - first.intersection(second).size()
+    todo = third.difference(done)
+    assert config_set(todo) == config_set(third) - config_set(first) - config_set(second)
+    assert config_set(done.intersection(third)) == config_set(third) - config_set(todo)
+
+
+def test_union_configs():
+    """Test random access and shards of a union's configs."""
+    old = sweep()
+    new = sweep(widths=(16, 32, 64))
+    delta = new.difference(old)
+    configs = list(delta.configs())
+    assert [delta.config_at(i) for i in range(len(delta))] == configs
+    assert delta.config_at(-1) == configs[-1]
+    with pytest.raises(IndexError): delta.config_at(len(delta))
+
+    shards = [list(delta.configs(shard, 3)) for shard in range(3)]
+    assert sum(shards, []) == configs
+    with pytest.raises(ValueError): delta.configs(3, 3)
+
+
+def test_constraints():
+    """Test set operations reject constrained schemas."""
+    a = sweep()
+    b = sweep()
+    b.add_exclusion({"model": "net", "width": 16})
+    with pytest.raises(ValueError): a.difference(b)
+    with pytest.raises(ValueError): b.union(a)
+
+
+def test_shadowed_variables():
+    """Test set operations on schemas whose dependencies shadow variables."""
+    a = GenSchema()
+    a.add_values("b", 1, 2)
+    a.add_values("a", "p", "q")
+    dep = GenSchema()
+    dep.add_values("b", 10, 20)
+    a.add_dependencies("a", "p", dep)
+
+    b = GenSchema()
+    b.add_values("b", 1, 10, 20)
+    b.add_values("a", "p")
+
+    # The top level domains of b differ from a's, but the configs overlap
+    ca = {key(c) for c in a.configs()}
+    cb = {key(c) for c in b.configs()}
+    for x, y, cx, cy in ((a, b, ca, cb), (b, a, cb, ca), (a, a, ca, ca)):
+        assert config_set(x.difference(y)) == cx - cy
+        assert config_set(x.intersection(y)) == cx & cy
+        assert config_set(x.union(y)) == cx | cy
+
+    # Sibling dependencies can shadow each other too
+    c = GenSchema()
+    c.add_values("x", 1)
+    c.add_dependencies("x", 1, dep)
+    c.add_values("y", 2)
+    c.add_dependencies("y", 2, dep)
+    assert config_set(c.union(c)) == {(("b", 10), ("x", 1), ("y", 2)), (("b", 20), ("x", 1), ("y", 2))}
+
+    # So can a dependency redefining its own parent variable
+    d = GenSchema()
+    d.add_values("d", "x")
+    redefined = GenSchema()
+    redefined.add_values("d", 1, 2)
+    d.add_dependencies("d", "x", redefined)
+    other = GenSchema()
+    other.add_values("d", 5)
+    assert config_set(d.union(d)) == {(("d", "x"),)}
+    assert config_set(d.difference(other)) == {(("d", "x"),)}
+    assert config_set(d.intersection(d)) == {(("d", "x"),)}
+
+
+def test_shadowed_variables_in_any_order():
+    """Test configs shadowed with their keys in different orders are only kept once."""
+    s = GenSchema()
+    s.add_values("p", 1, 2)
+    s.add_values("q", 1)
+    q = GenSchema()
+    q.add_values("q", 1)
+    s.add_dependencies("p", 1, q)
+    p = GenSchema()
+    p.add_values("p", 1)
+    s.add_dependencies("q", 1, p)
+
+    # Both configs come out as p=1, q=1 with their keys in different orders
+    expected = {(("p", 1), ("q", 1))}
+    assert config_set(s.union(GenSchema())) == expected
+    assert config_set(s.intersection(s)) == expected
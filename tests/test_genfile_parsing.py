@@ -6,6 +6,8 @@ Created on Sun Aug 21 22:11:38 2016
 """
 
 
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
 from ctip import GenParser
@@ -299,4 +301,30 @@ def test_commented():
     assert deps[0]["var"] == "complexity"
     assert deps[0]["values"].asList() == [2, 3]
     assert "deps" not in deps[0]
-    
\ No newline at end of file
+
+def test_parse_after_partial_match():
+    """Test parses that stop inside a nested block don't affect later parses."""
+    GenParser.parseString("a = 1\n    b = 2\n        c = ")
+    GenParser.parseString("a = 1\n    b = 2\n        c = 3\n      d = 4")
+    result = GenParser.parseFile("tests/resources/genfile9_multi_nested.gen")
+    assert result.asList() == [
+        "p3",
+        ["decoder", ["Hypercube"], [
+            ["gates", [12], [
+                ["complexity", [2], [["length", [80]]]],
+                ["complexity", [3], [["length", [110]]]]]],
+            ["gates", [15], [
+                ["complexity", [2], [["length", [116]]]],
+                ["complexity", [3], [["length", [140, 158]]]]]]]]
+    ]
+
+def test_parse_from_threads():
+    """Test genfiles can be parsed from several threads at once."""
+    files = ["tests/resources/genfile8_multiple_nests.gen",
+             "tests/resources/genfile9_multi_nested.gen",
+             "tests/resources/genfile11_commented.gen"]
+    expected = [GenParser.parseFile(f).asList() for f in files]
+    
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda f: GenParser.parseFile(f).asList(), files * 20))
+    assert results == expected * 20
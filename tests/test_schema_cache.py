@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the on-disk GenSchema cache.
+"""
+
+import os
+
+from ctip import GenSchema
+from ctip.cache import SchemaCache, set_default_cache
+
+
+genfile = "tests/resources/genfile9_multi_nested.gen"
+
+
+def cached_files(cache):
+    return sorted(os.listdir(cache.directory))
+
+
+def test_read_through_cache(tmpdir):
+    """Test reading a genfile again loads an independent copy of the schema from the cache."""
+    cache = SchemaCache(str(tmpdir))
+    schema = GenSchema.read(genfile, cache=cache)
+    assert len(cached_files(cache)) == 1
+    
+    # The second read comes from the cache
+    cached = GenSchema.read(genfile, cache=cache)
+    assert cached is not schema
+    assert cached.name == schema.name
+    assert list(cached.configs()) == list(schema.configs())
+    assert str(cached) == str(schema)
+    
+    # Cached schemas are independent copies
+    cached.add_values("decoder", "Extra")
+    assert str(GenSchema.read(genfile, cache=cache)) == str(schema)
+
+
+def test_bypass_cache(tmpdir):
+    """Test reads with cache=False neither store nor load cache entries."""
+    cache = SchemaCache(str(tmpdir))
+    GenSchema.read(genfile, cache=False)
+    assert not os.listdir(str(tmpdir))
+    
+    # A bypassed read doesn't use existing entries either
+    cache.store(cache.key(open(genfile).read()), GenSchema("stale"))
+    assert GenSchema.read(genfile, cache=cache).name == "stale"
+    assert GenSchema.read(genfile, cache=False).name == "p3"
+
+
+def test_key_depends_on_contents(tmpdir):
+    """Test a changed genfile is cached under a new key."""
+    cache = SchemaCache(str(tmpdir))
+    filename = str(tmpdir.join("test.gen"))
+    with open(filename, "w") as f:
+        f.write("var = 1, 2")
+    assert GenSchema.read(filename, cache=cache).size() == 2
+    with open(filename, "w") as f:
+        f.write("var = 1, 2, 3")
+    assert GenSchema.read(filename, cache=cache).size() == 3
+    assert len([f for f in cached_files(cache) if f.endswith(".schema")]) == 2
+
+
+
+def test_genfile_changed_while_reading(tmpdir):
+    """Test a genfile rewritten between hashing and parsing isn't cached under the old contents."""
+    filename = str(tmpdir.join("test.gen"))
+    with open(filename, "w") as f:
+        f.write("var = 1, 2")
+
+    class RewritingCache(SchemaCache):
+        def key(self, contents):
+            key = SchemaCache.key(self, contents)
+            with open(filename, "w") as f:
+                f.write("var = 1, 2, 3")
+            return key
+
+    cache = SchemaCache(str(tmpdir.join("cache")))
+    assert GenSchema.read(filename, cache=RewritingCache(cache.directory)).size() == 3
+    assert not os.path.exists(cache.directory) or not cached_files(cache)
+
+    # Reading the original contents again doesn't return the new schema
+    with open(filename, "w") as f:
+        f.write("var = 1, 2")
+    assert GenSchema.read(filename, cache=cache).size() == 2
+
+
+def test_streamed_key(tmpdir):
+    """Test schemas parsed while streaming and by the grammar are cached under the key of their contents."""
+    # Tabs are only supported by the grammar
+    for contents in ("var = 1, 2\nother = a, b\n", "var =\t1, 2\n"):
+        cache = SchemaCache(str(tmpdir.join("cache")))
+        filename = str(tmpdir.join("test.gen"))
+        with open(filename, "w") as f:
+            f.write(contents)
+        schema = GenSchema.read(filename, cache=cache)
+        with open(filename) as f:
+            key = cache.key(f.read())
+        assert str(cache.load(key)) == str(schema)
+        cache.clear()
+
+
+def test_corrupt_entry(tmpdir):
+    """Test corrupt cache entries are removed and the genfile is parsed again."""
+    cache = SchemaCache(str(tmpdir))
+    key = cache.key(open(genfile).read())
+    GenSchema.read(genfile, cache=cache)
+    with open(cache._path(key), "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.load(key) is None
+    assert not cached_files(cache)
+    assert GenSchema.read(genfile, cache=cache).name == "p3"
+
+
+def test_lru_eviction(tmpdir):
+    """Test the least recently used entries are evicted first."""
+    cache = SchemaCache(str(tmpdir))
+    keys = [cache.key(str(i)) for i in range(4)]
+    for i, key in enumerate(keys):
+        gen = GenSchema()
+        gen.add_values("var", *range(100))
+        assert cache.store(key, gen)
+        os.utime(cache._path(key), (i, i))
+    size = os.path.getsize(cache._path(keys[0]))
+    
+    # Loading an entry marks it as recently used
+    assert cache.load(keys[0]) is not None
+    cache.max_size = 2 * size
+    cache.evict()
+    assert cached_files(cache) == sorted(os.path.basename(cache._path(k)) for k in (keys[0], keys[3]))
+    
+    cache.clear()
+    assert not cached_files(cache)
+
+
+def test_default_cache(tmpdir):
+    """Test reads use the cache set with set_default_cache()."""
+    cache = SchemaCache(str(tmpdir))
+    previous = set_default_cache(cache)
+    try:
+        GenSchema.read(genfile)
+        assert len(cached_files(cache)) == 1
+    finally:
+        assert set_default_cache(previous) is cache
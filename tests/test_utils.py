@@ -12,7 +12,7 @@ import sys
 import math
 
 
-from ctip.utils import frange
+from ctip.utils import frange, FRange
 
 
 def my_isclose(a, b, rel_tol=1e-09, abs_tol=0.0):
@@ -109,4 +109,81 @@ class TestFrange(object):
         assert lists_fequal(self.smol, list(frange(1e-8, inc=1e-9)))
         assert lists_fequal(self.smol, list(frange(1.05e-8, inc=1e-9)))
         assert lists_fequal(self.smol[::-1], list(frange(1e-8, inc=-1e-9)))
-            
\ No newline at end of file
+            
+
+class TestFRange(object):
+    """Tests for the lazy FRange sequence."""
+
+    ranges = [(2,), (-2, 0), (1, -1, -0.5), (100, 99, -0.3), (11, 5, 2), (77.7, 77.7, 1e-5),
+              (1e-8, 0, 1e-9), (1.05e-8, 0, 1e-9), (-4.65, -6.1, -0.35), (0, 1, 0.1)]
+
+    @pytest.mark.parametrize("args", ranges)
+    def test_frange_values(self, args):
+        """Test FRange holds the same values as frange."""
+
+        r = FRange(*args)
+        values = list(frange(*args))
+        assert len(r) == len(values)
+        assert list(r) == values
+        assert r[-1] == values[-1]
+        assert r[1:3] == values[1:3]
+        assert all(r.index(v) == i for i, v in enumerate(values))
+        assert all(v in r for v in values)
+
+    def test_frange_membership(self):
+        """Test FRange membership and index lookups on values not in the range."""
+
+        r = FRange(0, 1, 0.25)
+        assert 0.5 in r
+        assert 0.6 not in r
+        assert 1.25 not in r
+        assert "0.5" not in r
+        with pytest.raises(ValueError):
+            r.index(-0.25)
+        with pytest.raises(IndexError):
+            r[5]
+
+    def test_frange_int_start(self):
+        """Test an FRange with an int bound and a float increment starts with the int like frange."""
+
+        for args in ((0, 1, 0.25), (1, 0, -0.25), (0, 1, 0.1)):
+            for ndigits in (None, 5):
+                r = FRange(*args, ndigits=ndigits)
+                expected = list(frange(*args))
+                if ndigits is not None:
+                    expected = [round(v, ndigits) for v in expected]
+                assert type(r[0]) is int and type(r[-len(r)]) is int
+                assert type(list(r)[0]) is int
+                assert [type(v) for v in r] == [type(v) for v in expected]
+                assert list(r) == expected
+
+    def test_frange_non_finite(self):
+        """Test FRange membership and index lookups on infinite, nan, and huge values."""
+
+        r = FRange(0, 1, 0.25)
+        for value in (float('inf'), float('-inf'), float('nan'), 1e308, 10**400):
+            assert value not in r
+            with pytest.raises(ValueError):
+                r.index(value)
+
+    def test_frange_rounding(self):
+        """Test rounding FRange values."""
+
+        assert list(FRange(0, 0.35, 0.1, ndigits=5)) == [0, 0.1, 0.2, 0.3]
+        assert 0.3 in FRange(0, 0.35, 0.1, ndigits=5)
+        assert 0.3 not in FRange(0, 0.35, 0.1)
+
+    def test_frange_large(self):
+        """Test FRange doesn't compute its values up front."""
+
+        r = FRange(0, 1, 1e-9)
+        assert len(r) == 10**9 + 1
+        assert r.index(0.5) == 5 * 10**8
+
+    def test_frange_invalid_increment(self):
+        """Test FRange with invalid increments."""
+
+        with pytest.raises(ValueError):
+            FRange(5, inc=0)
+        with pytest.raises(ValueError):
+            FRange(77.7, 77.7, inc=1e-35)